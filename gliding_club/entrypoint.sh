@@ -1,17 +1,20 @@
 #!/bin/sh
 set -e
 
-# Apply database migrations
-echo "Applying database migrations..."
-python manage.py migrate
+# Apply pending migrations, create the fragment cache table (only used with
+# FRAGMENT_CACHE_BACKEND=db) and collect static files, skipping what is already done
+echo "Preparing the application..."
+python manage.py fast_boot
 
-# Collect static files
-echo "Collecting static files..."
-python manage.py collectstatic --noinput
+# Shared directory where each worker writes its Prometheus metrics so
+# /metrics can aggregate them; cleared on start to drop stale worker files
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
 # Start Gunicorn
 echo "Starting Gunicorn server..."
-exec gunicorn gliding_club.wsgi:application --bind 0.0.0.0:8000 \
+exec gunicorn gliding_club.wsgi:application --config gunicorn_config.py --bind 0.0.0.0:8000 \
     --workers 3 \
     --timeout 120 \
     --access-logfile - \
@@ -1,17 +1,63 @@
 #adding health checks for the app
 
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden
 from django.db import connection
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.conf import settings
+import hmac
 import os
+import time
 import logging
+from training_records.models import TrainingRecord, Exercise, GroundBriefingTopic
+from training_records.services import metrics
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Liveness response body - built once so /live/ does no work per probe
+LIVE_RESPONSE_BODY = b'ok'
+
+# Cached result of the deep health check: (expires_at, payload, status_code)
+_health_cache = None
+
+def live_check(request):
+    """Liveness probe: the process is up and serving requests. Never touches the database."""
+    return HttpResponse(LIVE_RESPONSE_BODY, content_type='text/plain')
+
 def health_check(request):
+    """Deep health check, cached for HEALTH_CHECK_CACHE_TTL seconds per worker"""
+    global _health_cache
+
+    now = time.monotonic()
+    if _health_cache is None or _health_cache[0] <= now:
+        health_status, status_code = _run_health_checks()
+        ttl = getattr(settings, 'HEALTH_CHECK_CACHE_TTL', 30)
+        health_status['cache_ttl_seconds'] = ttl
+        _health_cache = (now + ttl, health_status, status_code)
+
+    _, health_status, status_code = _health_cache
+    return JsonResponse(health_status, status=status_code)
+
+def _get_estimated_row_counts(cursor, models):
+    """
+    Approximate row counts from the planner statistics in pg_class.
+    Much cheaper than COUNT(*) on large tables; None means the table
+    has not been analyzed yet.
+    """
+    tables = {model._meta.db_table: model for model in models}
+    cursor.execute(
+        "SELECT relname, reltuples::bigint FROM pg_class "
+        "WHERE relkind = 'r' AND relname = ANY(%s) AND pg_table_is_visible(oid)",
+        [list(tables)]
+    )
+    estimates = {relname: reltuples for relname, reltuples in cursor.fetchall()}
+    return {
+        model: (estimates[table] if estimates.get(table, -1) >= 0 else None)
+        for table, model in tables.items()
+    }
+
+def _run_health_checks():
     """Comprehensive health check for Gliding Club Training Records system"""
     health_status = {
         'status': 'healthy',
@@ -28,27 +74,23 @@ def health_check(request):
             # Check database connection
             cursor.execute("SELECT 1")
             
-            # Check core tables exist and have data
-            cursor.execute("SELECT COUNT(*) FROM auth_user WHERE is_active = true")
-            user_count = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM training_records_trainingrecord")
-            record_count = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM training_records_exercise")
-            exercise_count = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM training_records_groundbriefingtopic")
-            briefing_count = cursor.fetchone()[0]
+            # Check core tables exist, using estimated sizes instead of COUNT(*)
+            row_counts = _get_estimated_row_counts(
+                cursor, [User, TrainingRecord, Exercise, GroundBriefingTopic]
+            )
             
         health_status['checks']['database'] = {
             'status': 'healthy',
             'connection': 'connected',
-            'users': user_count,
-            'training_records': record_count,
-            'exercises': exercise_count,
-            'ground_briefings': briefing_count
+            'row_counts': 'estimated',
+            'users': row_counts[User],
+            'training_records': row_counts[TrainingRecord],
+            'exercises': row_counts[Exercise],
+            'ground_briefings': row_counts[GroundBriefingTopic]
         }
+        pool_stats = metrics.get_db_pool_stats()
+        if pool_stats is not None:
+            health_status['checks']['database']['pool'] = pool_stats
     except Exception as e:
         health_status['checks']['database'] = {
             'status': 'unhealthy',
@@ -191,10 +233,10 @@ def health_check(request):
     # Return appropriate HTTP status
     status_code = 200 if health_status['status'] == 'healthy' else 503
     
-    return JsonResponse(health_status, status=status_code)
+    return health_status, status_code
 
 def ready_check(request):
-    """Simple readiness check for load balancers"""
+    """Readiness check for load balancers: a single SELECT 1 on the (persistent) connection"""
     try:
         # Quick database ping
         with connection.cursor() as cursor:
@@ -207,4 +249,24 @@ def ready_check(request):
         return JsonResponse({
             'status': 'not ready',
             'error': str(e)
-        }, status=503)
\ No newline at end of file
+        }, status=503)
+
+def _may_scrape_metrics(request):
+    """
+    The bearer token or client address is on the METRICS_TOKEN / METRICS_ALLOWED_IPS list.
+    Only REMOTE_ADDR counts: X-Forwarded-For is set by the client.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+def metrics_view(request):
+    """Prometheus metrics in the text exposition format"""
+    # Served before authentication, so it checks who is asking itself
+    if not _may_scrape_metrics(request):
+        return HttpResponseForbidden('Forbidden', content_type='text/plain')
+    metrics.refresh_scrape_gauges()
+    payload, content_type = metrics.render_metrics()
+    return HttpResponse(payload, content_type=content_type)
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     # Third-party apps
     'csp',  # Content Security Policy
     'axes',        # Login attempt security
@@ -46,6 +47,9 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'training_records.middleware.ProbeMiddleware',  # Must be first: answers PROBE_PATHS without the rest of the stack
+    'training_records.middleware.MetricsMiddleware',  # Timings cover the rest of the stack
+    'training_records.middleware.SQLCommentMiddleware',  # Tags SQL statements with the view that issued them
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -58,9 +62,28 @@ MIDDLEWARE = [
     'training_records.middleware.CSPNonceMiddleware',
     'csp.middleware.CSPMiddleware',
     'training_records.middleware.FirstLoginMiddleware',  # Custom middleware for first login redirect
+    'training_records.middleware.ReplicaRoutingMiddleware',  # Routes reads of read-only views to the replica
+    'training_records.middleware.CatalogueMiddleware',  # Checks the reference data catalogue version once per request
     'training_records.middleware.AuditLogMiddleware',  # Custom middleware for audit logging
     'axes.middleware.AxesMiddleware',  # Should be the last middleware
 ]
+# Health probe and metrics endpoints answered by ProbeMiddleware without
+# sessions, authentication, CSP or audit logging
+PROBE_PATHS = ['/live/', '/ready/', '/health/', '/metrics/']
+
+# Also tag every SQL statement with the request id. Off by default: a value unique to each
+# request makes every statement text unique, so prepared statements are never reused and
+# logs and pg_stat_statements samples no longer group by call site.
+SQL_COMMENT_REQUEST_ID = os.environ.get('SQL_COMMENT_REQUEST_ID', 'false').lower() in ('1', 'true', 'yes')
+
+# Who may scrape /metrics/: requests with "Authorization: Bearer <METRICS_TOKEN>" or from
+# one of METRICS_ALLOWED_IPS (REMOTE_ADDR, comma separated). With neither set it answers 403.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+# How long the deep /health/ check result is reused (seconds, per worker)
+HEALTH_CHECK_CACHE_TTL = int(os.environ.get('HEALTH_CHECK_CACHE_TTL', '30'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -161,6 +184,84 @@ DATABASES = {
     }
 }
 
+# Connection pooling (Django 5.1+ with psycopg 3). With DATABASE_POOL=true each
+# worker keeps a small shared pool instead of one persistent connection per thread.
+# CONN_HEALTH_CHECKS makes Django pass ConnectionPool.check_connection to the pool, so a
+# connection the server dropped is replaced on checkout instead of failing the request.
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'false').lower() in ('1', 'true', 'yes')
+if DATABASE_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # Persistent connections can't be combined with a pool
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', '4')),
+        'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', '10')),  # Seconds to wait for a free connection
+    }
+
+# Optional read replica. Reads from the views in REPLICA_READ_VIEWS go to the
+# replica unless the user changed something in the last REPLICA_PIN_SECONDS.
+if os.environ.get('DATABASE_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ.get('DATABASE_REPLICA_HOST'),
+        'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),  # Same pooling mode, separate pool
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['training_records.routers.ReplicaRouter']
+
+REPLICA_READ_VIEWS = [
+    'student_dashboard',
+    'instructor_dashboard',
+    'record_list',
+    'student_history',
+    'student_lookup',
+    'student_search',
+    'instructor_flight_history',
+    'export_student_records',
+]
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
+# Fuzzy (trigram) matching in the student typeahead. Requires the pg_trgm
+# extension: CREATE EXTENSION pg_trgm;
+STUDENT_SEARCH_TRIGRAM = os.environ.get('STUDENT_SEARCH_TRIGRAM', 'false').lower() in ('1', 'true', 'yes')
+
+# Shared reference data snapshot. When set, the gunicorn master writes the
+# catalogue to this file (use /dev/shm so it stays in memory) and workers map
+# it instead of each loading it from the database.
+CATALOGUE_SNAPSHOT_PATH = os.environ.get('CATALOGUE_SNAPSHOT_PATH', '')
+
+# Rendered template fragments (dashboards, student history, record lists), shared by
+# all workers. We run no Redis: use the filesystem (default) or the database
+# (FRAGMENT_CACHE_BACKEND=db, created by `python manage.py createcachetable`).
+# 'off' disables fragment caching.
+FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'file').lower()
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', '86400'))
+FRAGMENT_CACHES = {
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('FRAGMENT_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'fragments')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'fragment_cache',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'off': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'fragments': {**FRAGMENT_CACHES[FRAGMENT_CACHE_BACKEND], 'TIMEOUT': FRAGMENT_CACHE_TIMEOUT},
+}
+
+# Data backfills (migrations and `python manage.py backfill`): rows written per
+# transaction, and seconds to pause between chunks so a backfill on a live
+# database leaves room for other queries.
+BACKFILL_CHUNK_SIZE = int(os.environ.get('BACKFILL_CHUNK_SIZE', '1000'))
+BACKFILL_SLEEP = float(os.environ.get('BACKFILL_SLEEP', '0'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -8,8 +8,10 @@ from . import health
 
 urlpatterns = [
     # Add the i18n patterns for language selection
+    path('live/', health.live_check, name='live_check'),
     path('health/', health.health_check, name='health_check'),
     path('ready/', health.ready_check, name='ready_check'),
+    path('metrics/', health.metrics_view, name='metrics'),
     path('i18n/', include('django.conf.urls.i18n')),
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
@@ -14,4 +14,35 @@ keepalive = 2
 # Logging
 errorlog = 'logs/gunicorn-error.log'
 accesslog = 'logs/gunicorn-access.log'
-loglevel = 'info'
\ No newline at end of file
+loglevel = 'info'
+
+# Prometheus multi-process metrics: drop a dead worker's live gauges so
+# /metrics only reports workers that are still running
+def child_exit(server, worker):
+    import os
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+# Shared catalogue snapshot: write the reference data once in the master so
+# forked workers map it instead of each querying it on their first request
+def on_starting(server):
+    import os
+    if not os.environ.get('CATALOGUE_SNAPSHOT_PATH'):
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gliding_club.settings')
+    import django
+    django.setup()
+    from django.db import connections
+    from training_records.services.catalogue import write_snapshot
+    try:
+        write_snapshot()
+    except Exception as e:
+        # Workers fall back to the database and write the snapshot themselves
+        server.log.warning(f"Could not write catalogue snapshot: {e}")
+    finally:
+        # Connections (and any pool) must not be inherited by the forked workers
+        for connection in connections.all():
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
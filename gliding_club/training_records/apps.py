@@ -1,4 +1,6 @@
 # training_records/apps.py
+import os
+import sys
 from django.apps import AppConfig
 from django.db.models.signals import post_migrate
 from django.dispatch import receiver
@@ -11,8 +13,27 @@ class TrainingRecordsConfig(AppConfig):
         # Import and setup signals
         import training_records.middleware
         training_records.middleware.setup_audit_signals()
+        # Tag SQL statements with the view or management command that issued them
+        from django.db.backends.signals import connection_created
+        from . import sqlcomment
+        connection_created.connect(sqlcomment.install_wrapper, dispatch_uid='sqlcomment_install_wrapper')
+        if os.path.basename(sys.argv[0]) == 'manage.py' and len(sys.argv) > 1 and sys.argv[1] != 'runserver':
+            sqlcomment.set_command(sys.argv[1])
+        # Invalidate the reference data catalogue when it changes
+        from .services import catalogue
+        catalogue.connect_signals()
+        # Bump the template fragment versions when records, briefings or students change
+        from .services import fragment_cache
+        fragment_cache.connect_signals()
         # Run data import after migration
         post_migrate.connect(self._post_migrate_callback, sender=self)
-    def _post_migrate_callback(self, sender, **kwargs):
+    def _post_migrate_callback(self, sender, using=None, **kwargs):
         from django.core.management import call_command
-        call_command('import_initial_data')
\ No newline at end of file
+        from django.db import DEFAULT_DB_ALIAS, connections
+        from django.db.migrations.loader import MigrationLoader
+        # After migrating back to an earlier state the tables don't match the models
+        loader = MigrationLoader(connections[using or DEFAULT_DB_ALIAS])
+        if not set(loader.graph.leaf_nodes(self.label)) <= set(loader.applied_migrations):
+            return
+        # Only reads the workbooks when their checksum changed since the last import
+        call_command('import_initial_data', verbosity=kwargs.get('verbosity', 1))
\ No newline at end of file
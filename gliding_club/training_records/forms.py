@@ -6,6 +6,7 @@ from .models import (
     TrainingRecord, User, Glider, TrainingTopic, Exercise, 
     ExercisePerformance, GroundBriefing, GroundBriefingTopic
 )
+from .services.catalogue import get_catalogue
 import os
 from django.core.exceptions import ValidationError
 from PIL import Image
@@ -13,6 +14,16 @@ import io
 from datetime import timedelta
 import re
 
+def set_cached_choices(field, objects):
+    """
+    Render a ModelChoiceField from catalogue objects instead of querying its queryset.
+    The queryset is still used to validate the submitted value.
+    """
+    choices = [(obj.pk, field.label_from_instance(obj)) for obj in objects]
+    if field.empty_label is not None:
+        choices.insert(0, ('', field.empty_label))
+    field.choices = choices
+
 class ExercisePerformanceForm(forms.ModelForm):
     """Form for a single exercise performance within a training record"""
     class Meta:
@@ -58,12 +69,17 @@ class TrainingRecordForm(forms.ModelForm):
         self.user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
         
+        catalogue = get_catalogue()
+        
         # Instructor choices
         self.fields['instructor'].queryset = User.objects.filter(user_type='instructor')
+        set_cached_choices(self.fields['instructor'], catalogue.instructors)
         self.fields['instructor'].help_text = "Select the instructor for this training session"
         
-        # Glider choices
+        # Glider and topic choices
         self.fields['glider'].queryset = Glider.objects.filter(is_active=True)
+        set_cached_choices(self.fields['glider'], catalogue.active_gliders)
+        set_cached_choices(self.fields['training_topic'], catalogue.training_topics)
         
         # Default date
         if not self.instance.pk:
@@ -177,6 +193,10 @@ class SignOffForm(forms.ModelForm):
             minutes = total_minutes % 60
             self.fields['duration_display'].initial = f"{int(hours)}:{int(minutes):02d}"
         
+        catalogue = get_catalogue()
+        set_cached_choices(self.fields['glider'], catalogue.gliders)
+        set_cached_choices(self.fields['training_topic'], catalogue.training_topics)
+        
         # Help text for comments
         self.fields['instructor_comments'].help_text = "Comments that will be visible to the student"
         self.fields['student_comments'].help_text = "Student's original comments (can be edited if needed)"
@@ -368,13 +388,16 @@ class GroundBriefingForm(forms.ModelForm):
             'notes': 'Optional: Add any notes or questions about this briefing',
         }
         
-    def __init__(self, *args, user=None, **kwargs):
+    def __init__(self, *args, user=None, briefed_topic_ids=None, **kwargs):
         super().__init__(*args, **kwargs)
         
+        catalogue = get_catalogue()
+        
         # Always filter instructors regardless of user parameter
         self.fields['instructor'].queryset = User.objects.filter(
             user_type='instructor'
         ).distinct().order_by('first_name', 'last_name')
+        set_cached_choices(self.fields['instructor'], catalogue.instructors)
         
         self.fields['instructor'].required = True
         self.fields['instructor'].help_text = "Select the instructor who conducted this briefing"
@@ -385,10 +408,65 @@ class GroundBriefingForm(forms.ModelForm):
         
         # If we have a valid user, filter topics they've already completed
         if user and hasattr(user, 'ground_briefings'):
-            completed_topics = user.ground_briefings.values_list('topic', flat=True)
+            # Callers that already loaded the student's briefings pass their topics in
+            if briefed_topic_ids is None:
+                briefed_topic_ids = user.ground_briefings.values_list('topic', flat=True)
+            completed_topics = set(briefed_topic_ids)
             self.fields['topic'].queryset = GroundBriefingTopic.objects.exclude(
                 id__in=completed_topics
             )
+            set_cached_choices(self.fields['topic'], [
+                topic for topic in catalogue.briefing_topics if topic.pk not in completed_topics
+            ])
+        else:
+            set_cached_choices(self.fields['topic'], catalogue.briefing_topics)
+
+class GroundBriefingFilterForm(forms.Form):
+    """Filters for the ground briefing list; every field is optional"""
+    SIGNED_OFF_CHOICES = [('', 'All'), ('yes', 'Signed off'), ('no', 'Pending')]
+    
+    # A student id picked with the student typeahead, not a list of the whole club
+    student = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+    topic = forms.ModelChoiceField(
+        queryset=GroundBriefingTopic.objects.all(), required=False, empty_label='All topics',
+    )
+    signed_off = forms.ChoiceField(choices=SIGNED_OFF_CHOICES, required=False)
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        set_cached_choices(self.fields['topic'], get_catalogue().briefing_topics)
+        # Students only ever see their own briefings
+        if user is not None and user.is_student():
+            del self.fields['student']
+        for field in self.visible_fields():
+            field.field.widget.attrs.setdefault('class', 'form-select form-select-sm' if isinstance(
+                field.field.widget, forms.Select) else 'form-control form-control-sm')
+    
+    def student_name(self):
+        """Name of the student filtered by, for the typeahead box"""
+        if 'student' not in self.fields or not self.is_valid() or not self.cleaned_data.get('student'):
+            return ''
+        student = User.objects.filter(pk=self.cleaned_data['student'], user_type='student').first()
+        return (student.get_full_name() or student.username) if student else ''
+    
+    def filter(self, queryset):
+        """Apply the valid filters to a GroundBriefing queryset"""
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data.get('student'):
+            queryset = queryset.filter(student_id=data['student'])
+        if data.get('topic'):
+            queryset = queryset.filter(topic=data['topic'])
+        if data.get('signed_off'):
+            queryset = queryset.filter(signed_off=data['signed_off'] == 'yes')
+        if data.get('date_from'):
+            queryset = queryset.filter(date__gte=data['date_from'])
+        if data.get('date_to'):
+            queryset = queryset.filter(date__lte=data['date_to'])
+        return queryset
 
 class GroundBriefingSignOffForm(forms.ModelForm):
     class Meta:
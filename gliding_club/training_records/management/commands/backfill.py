@@ -0,0 +1,25 @@
+# training_records/management/commands/backfill.py
+from django.core.management.base import BaseCommand
+
+from training_records.services import backfill
+
+class Command(BaseCommand):
+    help = (
+        'Run a data backfill in chunks, one transaction per chunk, resuming where the last run stopped. '
+        'Safe to run on a live database; use --sleep to leave it more room.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(backfill.BACKFILLS))
+        parser.add_argument('--chunk-size', type=int, help='Rows per transaction (default: BACKFILL_CHUNK_SIZE)')
+        parser.add_argument('--sleep', type=float, help='Seconds to pause between chunks (default: BACKFILL_SLEEP)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Start from the beginning instead of resuming an interrupted run')
+
+    def handle(self, *args, **options):
+        report = self.stdout.write if options['verbosity'] > 0 else lambda message: None
+        processed = backfill.run(
+            options['name'], chunk_size=options['chunk_size'], sleep=options['sleep'],
+            restart=options['restart'], report=report,
+        )
+        self.stdout.write(self.style.SUCCESS(f"{options['name']}: {processed} rows processed"))
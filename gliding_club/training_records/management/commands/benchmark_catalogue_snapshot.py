@@ -0,0 +1,99 @@
+# training_records/management/commands/benchmark_catalogue_snapshot.py
+import json
+import os
+import statistics
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from training_records.models import CacheVersion
+from training_records.services import catalogue, catalogue_snapshot
+from training_records.services.metrics import current_rss_bytes
+
+def private_bytes():
+    """Memory only this process holds (Private_Clean + Private_Dirty), or RSS where smaps_rollup is unavailable"""
+    try:
+        with open('/proc/self/smaps_rollup') as rollup:
+            fields = dict(line.split(':', 1) for line in rollup if ':' in line)
+        return sum(int(fields[key].split()[0]) for key in ('Private_Clean', 'Private_Dirty')) * 1024
+    except (OSError, KeyError, ValueError):
+        return current_rss_bytes()
+
+class Command(BaseCommand):
+    help = (
+        'Fork simulated workers and compare loading the reference data catalogue from the '
+        'database with loading it from the snapshot file: private memory added per worker and time '
+        'to the first catalogue lookup after the fork'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Workers to fork per mode')
+        parser.add_argument('--path', help='Snapshot file (defaults to a temporary file on /dev/shm)')
+
+    def handle(self, *args, **options):
+        if not hasattr(os, 'fork'):
+            raise CommandError('benchmark_catalogue_snapshot requires os.fork()')
+
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        path = options['path'] or os.path.join(tempfile.mkdtemp(dir=directory), 'catalogue.bin')
+        version = CacheVersion.get_version(catalogue.CATALOGUE_VERSION_NAME)
+        catalogue_snapshot.write(path, catalogue.Catalogue.load(version))
+        self.stdout.write(f'Snapshot {path}: {os.path.getsize(path)} bytes, version {version}')
+
+        def from_database():
+            return catalogue.Catalogue.load(version)
+
+        def from_snapshot():
+            return catalogue_snapshot.load(path, version)
+
+        self.stdout.write(f"{'mode':<10} {'workers':>8} {'first lookup ms':>16} {'private KiB':>12}")
+        try:
+            for name, load in (('database', from_database), ('snapshot', from_snapshot)):
+                results = [self.fork_worker(load) for _ in range(options['workers'])]
+                self.stdout.write(
+                    f"{name:<10} {len(results):>8} "
+                    f"{statistics.median(r['seconds'] for r in results) * 1000:>16.2f} "
+                    f"{statistics.median(r['private'] for r in results) / 1024:>12.0f}"
+                )
+        finally:
+            if not options['path']:
+                os.unlink(path)
+                os.rmdir(os.path.dirname(path))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Medians per worker. Private KiB is the memory the first lookup added that is not shared with other processes.'
+        ))
+
+    def fork_worker(self, load):
+        """Fork a child that loads the catalogue once, as a gunicorn worker would on its first request"""
+        # Children must open their own connections, as forked gunicorn workers do
+        connections.close_all()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 0
+            try:
+                # A worker needs a connection for the session anyway; only measure the catalogue
+                connection.ensure_connection()
+                before = private_bytes()
+                start = time.perf_counter()
+                result = load()
+                result.exercises_by_id  # first lookup
+                seconds = time.perf_counter() - start
+                payload = {'seconds': seconds, 'private': max(0, private_bytes() - before)}
+                os.write(write_fd, json.dumps(payload).encode())
+                connections.close_all()
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            data = pipe.read()
+        _, status = os.waitpid(pid, 0)
+        if status or not data:
+            raise CommandError('Benchmark worker failed')
+        return json.loads(data)
@@ -0,0 +1,103 @@
+# training_records/management/commands/benchmark_db_pool.py
+import statistics
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+class Command(BaseCommand):
+    help = (
+        'Compare database connection acquisition latency under concurrent load with a new '
+        'connection per request (no pool) and with a psycopg connection pool'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per client')
+        parser.add_argument('--pool-size', type=int, default=4, help='Maximum pool size')
+
+    def handle(self, *args, **options):
+        try:
+            import psycopg
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise CommandError('This command requires psycopg 3. Install it with: pip install "psycopg[binary,pool]"')
+
+        if connection.vendor != 'postgresql':
+            raise CommandError('benchmark_db_pool requires PostgreSQL')
+
+        # Same parameters Django uses, without Django's own pool settings
+        conn_params = connection.get_connection_params()
+        conn_params.pop('pool', None)
+
+        threads = options['threads']
+        requests = options['requests']
+        self.stdout.write(f'Running {threads} clients x {requests} requests, each doing SELECT 1')
+
+        def without_pool():
+            start = time.perf_counter()
+            conn = psycopg.connect(**conn_params)
+            acquired = time.perf_counter() - start
+            try:
+                conn.execute('SELECT 1')
+            finally:
+                conn.close()
+            return acquired
+
+        pool = ConnectionPool(
+            kwargs=conn_params,
+            min_size=1,
+            max_size=options['pool_size'],
+            check=ConnectionPool.check_connection,
+            open=True,
+        )
+        pool.wait()
+
+        def with_pool():
+            start = time.perf_counter()
+            with pool.connection() as conn:
+                acquired = time.perf_counter() - start
+                conn.execute('SELECT 1')
+            return acquired
+
+        try:
+            results = [
+                ('no pool', self.run_load(without_pool, threads, requests)),
+                (f'pool (max {options["pool_size"]})', self.run_load(with_pool, threads, requests)),
+            ]
+        finally:
+            pool.close()
+
+        self.stdout.write(
+            f"{'mode':<16} {'req/s':>8} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        )
+        for name, (latencies, elapsed) in results:
+            latencies_ms = sorted(latency * 1000 for latency in latencies)
+            self.stdout.write(
+                f"{name:<16} {len(latencies_ms) / elapsed:>8.0f} {statistics.mean(latencies_ms):>9.2f} "
+                f"{self.percentile(latencies_ms, 50):>8.2f} {self.percentile(latencies_ms, 95):>8.2f} "
+                f"{self.percentile(latencies_ms, 99):>8.2f} {latencies_ms[-1]:>8.2f}"
+            )
+
+    def run_load(self, acquire, threads, requests):
+        """Run acquire() requests times in each of threads threads; return latencies and wall time"""
+        latencies = []
+        lock = threading.Lock()
+
+        def client():
+            local = [acquire() for _ in range(requests)]
+            with lock:
+                latencies.extend(local)
+
+        workers = [threading.Thread(target=client) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return latencies, time.perf_counter() - start
+
+    @staticmethod
+    def percentile(sorted_values, percent):
+        index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+        return sorted_values[index]
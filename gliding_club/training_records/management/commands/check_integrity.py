@@ -0,0 +1,73 @@
+# training_records/management/commands/check_integrity.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from training_records.models import JobCheckpoint
+from training_records.services import batching, integrity
+
+CHECKPOINT_PREFIX = 'check_integrity.'
+# Problems listed per check unless -v 2 lists them all
+LISTED_PROBLEMS = 20
+
+class Command(BaseCommand):
+    help = (
+        'Scan training records, exercise performances, ground briefings and notifications for '
+        'inconsistencies, a chunk at a time. With --repair, fix them. An interrupted run resumes '
+        'where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='append', choices=list(integrity.CHECKS),
+                            help='Only run this check (repeatable; default: all)')
+        parser.add_argument('--repair', action='store_true',
+                            help='Fix what is found, in one transaction per chunk')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per query and per repair')
+        parser.add_argument('--restart', action='store_true',
+                            help='Start from the beginning instead of resuming an interrupted run')
+
+    def handle(self, *args, **options):
+        unrepaired = 0
+        for name in options['check'] or integrity.CHECKS:
+            unrepaired += self.run_check(integrity.CHECKS[name](), options)
+
+        if unrepaired:
+            raise CommandError(f'{unrepaired} problem(s) found; run with --repair to fix them')
+        self.stdout.write(self.style.SUCCESS('No unrepaired problems'))
+
+    def run_check(self, check, options):
+        """Scan for one check from its checkpoint; returns how many problems were left unrepaired"""
+        checkpoint = JobCheckpoint.load(CHECKPOINT_PREFIX + check.name)
+        if options['restart'] or checkpoint.data.get('finished', True):
+            checkpoint.position = 0
+            checkpoint.data = {'found': 0, 'repaired': 0, 'finished': False}
+        else:
+            self.stdout.write(f'{check.name}: resuming after id {checkpoint.position}')
+
+        listed = 0
+        for rows in batching.keyset_chunks(
+            check.queryset(), *check.fields, chunk_size=options['chunk_size'], after=checkpoint.position,
+        ):
+            problems = check.find(rows)
+            # The repair and the position it got to commit together, so a resumed run
+            # neither repeats nor skips a chunk
+            with transaction.atomic():
+                if problems and options['repair']:
+                    check.repair(problems)
+                    checkpoint.data['repaired'] += len(problems)
+                checkpoint.data['found'] += len(problems)
+                checkpoint.position = rows[-1][0]
+                checkpoint.save()
+
+            for problem in problems:
+                if listed < LISTED_PROBLEMS or options['verbosity'] > 1:
+                    self.stdout.write(f'  {problem.description}')
+                listed += 1
+
+        checkpoint.data['finished'] = True
+        checkpoint.save()
+        found, repaired = checkpoint.data['found'], checkpoint.data['repaired']
+        if listed > LISTED_PROBLEMS and options['verbosity'] < 2:
+            self.stdout.write(f'  ... and {listed - LISTED_PROBLEMS} more (-v 2 lists them all)')
+        style = self.style.WARNING if found else self.style.SUCCESS
+        self.stdout.write(style(f'{check.description}: {found} found, {repaired} repaired'))
+        return found - repaired
@@ -1,75 +1,47 @@
 # training_records/management/commands/import_initial_data.py
-import os
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from training_records.models import TrainingTopic, Exercise
+from training_records.services import catalogue_import
 
 class Command(BaseCommand):
-    help = 'Import training topics and exercises from Excel files if the database is empty'
-    
+    help = (
+        'Import the training topic and exercise workbooks in data/ that changed since '
+        'the last import: new rows are added and changed rows updated. Runs after every migrate.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Read every workbook even if unchanged, and overwrite changed rows of tables never synced before')
+        parser.add_argument('--dry-run', action='store_true', help='Show what would change without writing')
+
     def handle(self, *args, **options):
-        # Import required libraries
         try:
-            import pandas as pd
-        except ImportError:
-            self.stdout.write(self.style.ERROR("This command requires pandas. Please install it with: pip install pandas"))
-            return
-            
-        # Define paths to the Excel files
-        base_dir = settings.BASE_DIR
-        topics_excel = os.path.join(base_dir, 'data', 'training_topics.xlsx')
-        exercises_excel = os.path.join(base_dir, 'data', 'exercises.xlsx')
-        
-        # Check if files exist
-        if not os.path.exists(topics_excel):
-            self.stdout.write(self.style.WARNING(f'Topics Excel file not found at {topics_excel}'))
-            return
-            
-        if not os.path.exists(exercises_excel):
-            self.stdout.write(self.style.WARNING(f'Exercises Excel file not found at {exercises_excel}'))
-            return
-        
-        # Check if database is already populated
-        if TrainingTopic.objects.exists() or Exercise.objects.exists():
-            self.stdout.write(self.style.WARNING('Database already contains data. Skipping import.'))
+            result = catalogue_import.sync(dry_run=options['dry_run'], force=options['force'])
+        except catalogue_import.CatalogueImportError as e:
+            self.stdout.write(self.style.ERROR(f'Error importing data: {e}'))
             return
-        
-        # Import training topics
-        try:
-            df_topics = pd.read_excel(topics_excel)
-            topics_count = 0
-            
-            for _, row in df_topics.iterrows():
-                # Handle NaN values that pandas might introduce
-                TrainingTopic.objects.create(
-                    name=row['name'] if not pd.isna(row['name']) else '',
-                    description=row['description'] if not pd.isna(row['description']) else '',
-                    category=row['category'] if not pd.isna(row['category']) else '',
-                    required_for_certification=str(row.get('required_for_certification', '')).lower() == 'true'
-                )
-                topics_count += 1
-                
-            self.stdout.write(self.style.SUCCESS(f'Successfully imported {topics_count} training topics'))
-        
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error importing training topics: {str(e)}'))
-        
-        # Import exercises
-        try:
-            df_exercises = pd.read_excel(exercises_excel)
-            exercises_count = 0
-            
-            for _, row in df_exercises.iterrows():
-                Exercise.objects.create(
-                    name=row['name'] if not pd.isna(row['name']) else '',
-                    description=row['description'] if not pd.isna(row['description']) else '',
-                    category=row['category'] if not pd.isna(row['category']) else '',
-                    number=row['number'] if not pd.isna(row['number']) else '',
-                    is_required=str(row.get('is_required', '')).lower() == 'true'
-                )
-                exercises_count += 1
-                
-            self.stdout.write(self.style.SUCCESS(f'Successfully imported {exercises_count} exercises'))
-        
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error importing exercises: {str(e)}'))
\ No newline at end of file
+
+        if result.unchanged and options['verbosity'] > 1:
+            self.stdout.write(f"Unchanged since the last import: {', '.join(result.unchanged)}")
+        write_diff(self, result.applied, options)
+        were = 'would be' if options['dry_run'] else 'were'
+        for sheet_diff in result.baseline:
+            if options['dry_run'] or options['verbosity'] > 1:
+                for change in sheet_diff.changes:
+                    self.stdout.write(f'  {change}')
+            self.stdout.write(self.style.WARNING(
+                f'{sheet_diff.sheet.model} already has data: {len(sheet_diff.created)} new row(s) of '
+                f'{sheet_diff.sheet.filename} {were} imported, but '
+                f'{len(sheet_diff.updated)} row(s) that differ from the file {were} kept; '
+                'run import_initial_data --force to overwrite them'
+            ))
+        if not (result.applied or result.baseline) and options['verbosity'] > 0:
+            self.stdout.write('Catalogue workbooks unchanged since the last import')
+
+def write_diff(command, diffs, options):
+    """Report an import: every change on a dry run or with -v 2, and a summary per table"""
+    for result in diffs:
+        if options['dry_run'] or options['verbosity'] > 1:
+            for change in result.changes:
+                command.stdout.write(f'  {change}')
+        style = command.style.NOTICE if options['dry_run'] else command.style.SUCCESS
+        command.stdout.write(style(('Would import ' if options['dry_run'] else 'Imported ') + result.summary()))
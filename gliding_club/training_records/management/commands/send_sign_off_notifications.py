@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from training_records.services.notification_service import NotificationService
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Email students the training records and ground briefings their instructors signed off in bulk'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Sending sign-off notifications...')
+
+        try:
+            results = [
+                NotificationService.send_sign_off_notifications(),
+                NotificationService.send_briefing_sign_off_notifications(),
+            ]
+
+            sent = sum(result.get('sent_count', 0) for result in results)
+            errors = sum(result.get('error_count', 0) for result in results)
+            skipped = sum(result.get('skipped_count', 0) for result in results)
+
+            if errors == 0:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Sent {sent} sign-off notification(s). Skipped {skipped}.')
+                )
+            else:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Sent {sent} sign-off notification(s) with {errors} error(s); they will be retried. '
+                        f'Skipped {skipped}. Check logs for details.'
+                    )
+                )
+
+        except Exception as e:
+            error_msg = f'Failed to send sign-off notifications: {e}'
+            self.stdout.write(self.style.ERROR(error_msg))
+            logger.error(error_msg, exc_info=True)
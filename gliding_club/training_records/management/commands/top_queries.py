@@ -0,0 +1,102 @@
+# training_records/management/commands/top_queries.py
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, DatabaseError
+from training_records import sqlcomment
+
+class Command(BaseCommand):
+    help = (
+        'Report the most expensive call sites from pg_stat_statements, grouped by the '
+        'URL name, view or management command tags added by SQLCommentMiddleware. '
+        'Note that pg_stat_statements ignores comments when it groups statements, so a '
+        'statement issued from several places is attributed to the first one it saw.'
+    )
+
+    GROUP_BY_CHOICES = ['site', 'url_name', 'view', 'command']
+    ORDER_BY_CHOICES = {
+        'total_time': 'total_ms',
+        'calls': 'calls',
+        'rows': 'rows',
+        'mean_time': 'mean_ms',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Number of call sites to show')
+        parser.add_argument(
+            '--group-by', choices=self.GROUP_BY_CHOICES, default='site',
+            help='Tag to group by; "site" uses the URL name or the command name'
+        )
+        parser.add_argument(
+            '--order-by', choices=list(self.ORDER_BY_CHOICES), default='total_time',
+            help='Sort call sites by this column'
+        )
+        parser.add_argument('--reset', action='store_true', help='Reset pg_stat_statements after reporting')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('top_queries requires PostgreSQL')
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT query, calls, total_exec_time, rows
+                    FROM pg_stat_statements
+                    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                    """
+                )
+                statements = cursor.fetchall()
+        except DatabaseError as e:
+            raise CommandError(
+                'Could not read pg_stat_statements. Add pg_stat_statements to '
+                'shared_preload_libraries and run "CREATE EXTENSION pg_stat_statements;" '
+                f'in the database. ({e})'
+            )
+
+        sites = defaultdict(lambda: {
+            'calls': 0, 'total_ms': 0.0, 'rows': 0, 'statements': 0, 'top_query': '', 'top_ms': -1.0,
+        })
+        for query, calls, total_ms, rows in statements:
+            site = sites[self.get_site(query, options['group_by'])]
+            site['calls'] += calls
+            site['total_ms'] += total_ms
+            site['rows'] += rows
+            site['statements'] += 1
+            if total_ms > site['top_ms']:
+                site['top_ms'] = total_ms
+                site['top_query'] = query
+
+        for site in sites.values():
+            site['mean_ms'] = site['total_ms'] / site['calls'] if site['calls'] else 0.0
+
+        sort_key = self.ORDER_BY_CHOICES[options['order_by']]
+        ranked = sorted(sites.items(), key=lambda item: item[1][sort_key], reverse=True)[:options['limit']]
+
+        if not ranked:
+            self.stdout.write(self.style.WARNING('pg_stat_statements has no statements for this database yet.'))
+            return
+
+        self.stdout.write(
+            f"{'total ms':>12} {'calls':>10} {'mean ms':>10} {'rows':>12} {'stmts':>6}  call site"
+        )
+        for name, site in ranked:
+            self.stdout.write(
+                f"{site['total_ms']:>12.1f} {site['calls']:>10} {site['mean_ms']:>10.2f} "
+                f"{site['rows']:>12} {site['statements']:>6}  {name}"
+            )
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{'':>55}{' '.join(site['top_query'].split())[:200]}")
+
+        if options['reset']:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_stat_statements_reset()')
+            self.stdout.write(self.style.SUCCESS('pg_stat_statements has been reset.'))
+
+    def get_site(self, query, group_by):
+        """Name of the call site that issued a statement"""
+        tags = sqlcomment.parse_comment(query)
+        if group_by == 'site':
+            name = tags.get('url_name') or (tags.get('command') and f"command:{tags['command']}")
+        else:
+            name = tags.get(group_by)
+        return name or '(untagged)'
@@ -0,0 +1,46 @@
+# training_records/management/commands/verify_ledger.py
+from django.core.management.base import BaseCommand, CommandError
+
+from training_records.models import SignatureLedgerEntry
+from training_records.services import ledger
+
+class Command(BaseCommand):
+    help = (
+        "Verify students' signature ledgers against their checkpoints and the records they sign. "
+        'With --backfill, first add ledger entries for signed records that have none.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', type=int, help='Only this student (user id)')
+        parser.add_argument('--first', type=int, default=1, help='First ledger entry to verify')
+        parser.add_argument('--last', type=int, help='Last ledger entry to verify (default: the latest)')
+        parser.add_argument('--backfill', action='store_true',
+                            help='Add entries for records signed before the ledger existed')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            added = ledger.backfill()
+            self.stdout.write(f'Added {added} ledger entries for previously signed records')
+
+        if options['student']:
+            student_ids = [options['student']]
+        else:
+            student_ids = SignatureLedgerEntry.objects.order_by('student_id').values_list('student_id', flat=True).distinct()
+
+        failed = 0
+        entries = 0
+        for student_id in student_ids:
+            result = ledger.verify(student_id, first=options['first'], last=options['last'])
+            entries += result.entries_checked
+            if result.ok:
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  student {student_id}: entries {result.first}-{result.last} OK')
+                continue
+            failed += 1
+            self.stdout.write(self.style.ERROR(f'student {student_id}:'))
+            for problem in result.problems:
+                self.stdout.write(f'  {problem}')
+
+        if failed:
+            raise CommandError(f'{failed} ledger(s) failed verification')
+        self.stdout.write(self.style.SUCCESS(f'All ledgers verified ({entries} entries read)'))
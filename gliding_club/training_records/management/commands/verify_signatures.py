@@ -0,0 +1,123 @@
+# training_records/management/commands/verify_signatures.py
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from training_records.models import AuditLog, JobCheckpoint, SignatureLedgerEntry, TrainingRecord
+from training_records.services import signatures
+
+CHECKPOINT_NAME = 'verify_signatures'
+# Records saved by a worker whose clock runs slightly behind are still re-checked
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the signature hash of every signed training record and report the ones that '
+        'no longer match. With --incremental, only records updated since the last clean run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only check records updated since the last run that found no mismatches')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes hashing in parallel (1 hashes in this process)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Records per database fetch and per task')
+
+    def handle(self, *args, **options):
+        checkpoint = JobCheckpoint.load(CHECKPOINT_NAME)
+        started_at = timezone.now()
+        start = time.perf_counter()
+
+        records = TrainingRecord.objects.filter(signed_off=True)
+        if options['incremental'] and checkpoint.watermark:
+            records = records.filter(updated_at__gt=checkpoint.watermark)
+            self.stdout.write(f'Checking records updated since {checkpoint.watermark:%Y-%m-%d %H:%M:%S}')
+        rows = records.order_by().values_list(*signatures.SIGNED_FIELDS, 'signature_hash')
+
+        checked = 0
+        mismatches = []
+        for chunk_mismatches, chunk_size in self.verify(rows, options['workers'], options['chunk_size']):
+            checked += chunk_size
+            mismatches.extend(chunk_mismatches)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {checked} checked, {len(mismatches)} mismatches')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Checked {checked} signed records in {elapsed:.1f}s')
+
+        if mismatches:
+            self.report(mismatches)
+            # The watermark stays put, so the next incremental run reports these again
+            raise CommandError(f'{len(mismatches)} signature mismatch(es)')
+
+        checkpoint.watermark = started_at - WATERMARK_OVERLAP
+        checkpoint.data = {'checked': checked, 'seconds': round(elapsed, 1)}
+        checkpoint.save()
+        self.stdout.write(self.style.SUCCESS('All signatures match'))
+
+    def verify(self, rows, workers, chunk_size):
+        """Yield (mismatches, rows checked) per chunk, streaming rows through a server-side cursor"""
+        chunks = self.chunked(rows.iterator(chunk_size=chunk_size), chunk_size)
+        if workers <= 1:
+            for chunk in chunks:
+                yield signatures.verify_chunk(chunk), len(chunk)
+            return
+
+        # A few chunks in flight per worker keeps every process busy without
+        # reading the whole table ahead into memory
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            for chunk in chunks:
+                pending.append((pool.submit(signatures.verify_chunk, chunk), len(chunk)))
+                if len(pending) >= workers * 2:
+                    future, size = pending.pop(0)
+                    yield future.result(), size
+            for future, size in pending:
+                yield future.result(), size
+
+    def chunked(self, rows, chunk_size):
+        chunk = []
+        for row in rows:
+            chunk.append((row[:-1], row[-1]))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def report(self, mismatches):
+        """List each mismatch with the fields that differ from what was signed"""
+        ids = [values[0] for values, _, _ in mismatches]
+        snapshots = {}
+        # Bulk sign-offs from before ledger entries kept snapshots left one in the audit log
+        for record_id, new_values in AuditLog.objects.filter(
+            action='SIGN_OFF', table_name=TrainingRecord._meta.db_table, record_id__in=ids,
+        ).order_by('timestamp').values_list('record_id', 'new_values').iterator():
+            if new_values and 'signed_values' in new_values:
+                snapshots[record_id] = new_values
+        # Every sign-off and amendment keeps one on its ledger entry; the latest wins
+        for record_id, signature_hash, signed_values in SignatureLedgerEntry.objects.filter(
+            record_id__in=ids,
+        ).exclude(signed_values={}).order_by('sequence').values_list('record_id', 'signature_hash', 'signed_values'):
+            snapshots[record_id] = {'signature_hash': signature_hash, 'signed_values': signed_values}
+
+        self.stdout.write(self.style.ERROR(f'{len(mismatches)} record(s) do not match their signature:'))
+        for values, stored_hash, _ in sorted(mismatches, key=lambda mismatch: mismatch[0][0]):
+            record_id = values[0]
+            snapshot = snapshots.get(record_id)
+            if not stored_hash:
+                detail = 'signed off without a signature hash'
+            elif snapshot is None or snapshot.get('signature_hash') != stored_hash:
+                detail = 'changed fields unknown (no snapshot of what was signed)'
+            else:
+                current = dict(zip(signatures.SIGNED_FIELDS, (str(value) for value in values)))
+                changed = [
+                    f"{field}: {snapshot['signed_values'].get(field)!r} -> {current[field]!r}"
+                    for field in signatures.SIGNED_FIELDS
+                    if snapshot['signed_values'].get(field) != current[field]
+                ]
+                detail = '; '.join(changed) or 'signature hash itself was altered'
+            self.stdout.write(f'  record {record_id}: {detail}')
@@ -1,4 +1,5 @@
 # training_records/middleware.py
+import contextvars
 import json
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
@@ -9,6 +10,172 @@ from django.core.serializers.json import DjangoJSONEncoder  # Add this import
 import secrets
 from django.utils.functional import SimpleLazyObject
 import base64
+import time
+import uuid
+from contextlib import ExitStack
+from django.db import connections
+from django.conf import settings
+from django.urls import resolve
+
+class ProbeMiddleware:
+    """
+    Middleware that answers health probes and the metrics endpoint directly,
+    ahead of the rest of the stack, so they skip session, authentication,
+    CSP and audit work. Must be the first middleware. Paths come from the
+    PROBE_PATHS setting.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.probe_paths = {path.rstrip('/') for path in getattr(settings, 'PROBE_PATHS', [])}
+
+    def __call__(self, request):
+        if request.path_info.rstrip('/') in self.probe_paths:
+            match = resolve(request.path_info.rstrip('/') + '/')
+            request.resolver_match = match
+            return match.func(request, *match.args, **match.kwargs)
+        return self.get_response(request)
+
+class MetricsMiddleware:
+    """
+    Middleware that records per-view request counts, latency and database
+    query counts for the /metrics endpoint. Should be the first middleware so
+    the timings cover the whole stack.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Import here to avoid loading metrics before settings are ready
+        from .services import metrics
+
+        query_counter = metrics.QueryCounter()
+        start = time.perf_counter()
+
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(query_counter))
+            response = self.get_response(request)
+
+        metrics.observe_request(request, response, time.perf_counter() - start, query_counter.count)
+        return response
+
+class SQLCommentMiddleware:
+    """
+    Middleware that tags every SQL statement issued while handling a request
+    with the URL name and view function (see sqlcomment.py), and with the
+    request id too when SQL_COMMENT_REQUEST_ID is set. The request id is taken
+    from an X-Request-ID header when one is sent by the proxy, and echoed back
+    on the response.
+    """
+    REQUEST_ID_HEADER = 'HTTP_X_REQUEST_ID'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from . import sqlcomment
+
+        request_id = request.META.get(self.REQUEST_ID_HEADER, '')
+        if not sqlcomment.is_valid_request_id(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+
+        # Only low-cardinality tags by default; see SQL_COMMENT_REQUEST_ID
+        tags = {'request_id': request_id} if getattr(settings, 'SQL_COMMENT_REQUEST_ID', False) else {}
+        token = sqlcomment.start_request(**tags)
+        try:
+            response = self.get_response(request)
+        finally:
+            sqlcomment.end_request(token)
+
+        response['X-Request-ID'] = request_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        from . import sqlcomment
+
+        # Class-based views expose the class through view_class
+        view = getattr(view_func, 'view_class', view_func)
+        sqlcomment.update_request(
+            url_name=request.resolver_match.view_name if request.resolver_match else '',
+            view=f"{view.__module__}.{view.__qualname__}",
+        )
+        return None
+
+class CatalogueMiddleware:
+    """
+    Middleware that lets the reference data catalogue check its database
+    version at most once per request instead of on every lookup.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .services import catalogue
+        token = catalogue.start_request()
+        try:
+            return self.get_response(request)
+        finally:
+            catalogue.end_request(token)
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware that sends reads from the views in REPLICA_READ_VIEWS to the
+    replica database. After a user submits a change (any non-safe method) a
+    short-lived cookie pins their reads to the primary for
+    REPLICA_PIN_SECONDS, so they always see their own writes.
+    """
+    PIN_COOKIE = 'primary_pin'
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = 'replica' in settings.DATABASES
+        self.read_views = set(getattr(settings, 'REPLICA_READ_VIEWS', []))
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                from .routers import reset
+                reset(request._replica_token)
+
+        if request.method not in self.SAFE_METHODS:
+            response.set_cookie(
+                self.PIN_COOKIE,
+                str(int(time.time() + self.pin_seconds)),
+                max_age=self.pin_seconds,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return None
+        if not request.resolver_match or request.resolver_match.url_name not in self.read_views:
+            return None
+        if self.is_pinned_to_primary(request):
+            return None
+
+        # request.user and the session were already loaded from the primary by
+        # the middleware above, so only the view's own reads go to the replica
+        from .routers import use_replica
+        request._replica_token = use_replica()
+        return None
+
+    def is_pinned_to_primary(self, request):
+        try:
+            return float(request.COOKIES.get(self.PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
 
 class CSPNonceMiddleware:
     """
@@ -130,16 +297,24 @@ class FirstLoginMiddleware:
         response = self.get_response(request)
         return response
 
+# The request being handled, so the audit signal handlers can attribute changes to its user
+# (set by AuditLogMiddleware)
+_audit_request = contextvars.ContextVar('audit_request', default=None)
+
 class AuditLogMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         # Process the request
-        response = self.get_response(request)
+        token = _audit_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _audit_request.reset(token)
         
         # We only log actions that modify data
-        if request.method not in ['GET', 'HEAD', 'OPTIONS'] and request.user.is_authenticated:
+        if request.method not in ['GET', 'HEAD', 'OPTIONS']:
             # Log the action
             try:
                 if hasattr(request, 'audit_data'):
@@ -148,7 +323,7 @@ class AuditLogMiddleware:
                     
                     for audit_entry in request.audit_data:
                         AuditLog.objects.create(
-                            user=request.user,
+                            user=request.user if request.user.is_authenticated else None,
                             action=audit_entry.get('action', request.method),
                             table_name=audit_entry.get('table_name', ''),
                             record_id=audit_entry.get('record_id', 0),
@@ -180,10 +355,17 @@ def setup_audit_signals():
     
     def get_model_changes(instance, created=False):
         """Get the changes made to a model instance"""
+        dirty = None if created else instance.get_dirty_fields()
         if created:
             # New instance - capture all fields
             new_values = model_to_dict(instance)
             old_values = {}
+        elif dirty is not None:
+            # Loaded instance - it remembers what it was loaded with, so only the changed
+            # editable fields are logged and the row is not read again
+            fields = [field for field in instance._meta.concrete_fields if field.editable and field.attname in dirty]
+            old_values = {field.name: dirty[field.attname] for field in fields}
+            new_values = {field.name: field.value_from_object(instance) for field in fields}
         else:
             if not instance.pk:
                 return {}, {}  # No changes to record
@@ -197,51 +379,42 @@ def setup_audit_signals():
                 old_values = {}
                 new_values = model_to_dict(instance)
                 
-        return old_values, new_values
+        # Convert to safe JSON format
+        safe_old_values = json.loads(json.dumps(old_values, cls=CustomJSONEncoder))
+        safe_new_values = json.loads(json.dumps(new_values, cls=CustomJSONEncoder))
+        return safe_old_values, safe_new_values
 
-    @receiver(post_save, sender='training_records.TrainingRecord')
+    # A nested function has no other reference, so it must be connected strongly or it is
+    # garbage collected as soon as this function returns
+    @receiver(post_save, sender='training_records.TrainingRecord', weak=False,
+              dispatch_uid='training_record_audit')
     def training_record_audit(sender, instance, created, **kwargs):
         """Log changes to training records"""
         
         old_values, new_values = get_model_changes(instance, created)
+        if not created and old_values == new_values:
+            return  # Nothing audited changed, e.g. only updated_at
         
-        # Get the current request from thread local storage if available
-        request = None
-        import threading
-        current_thread = threading.current_thread()
-        if hasattr(current_thread, 'request'):
-            request = current_thread.request
-        
-        if request and hasattr(request, 'user') and request.user.is_authenticated:
-            # If we have access to the request, add audit data to be processed by middleware
-            if not hasattr(request, 'audit_data'):
-                request.audit_data = []
-                
-            request.audit_data.append({
-                'action': 'CREATE' if created else 'UPDATE',
-                'table_name': instance._meta.db_table,
-                'record_id': instance.pk,
-                'old_values': old_values,
-                'new_values': new_values
-            })
-        else:
-            # If we don't have access to request, log directly
-            # This is not ideal but ensures we still capture changes
-            try:
-                from .models import AuditLog, User
-                admin_user = User.objects.filter(is_superuser=True).first()
-                
-                if admin_user:  # Only create log if we can find an admin user
-                    AuditLog.objects.create(
-                        user=admin_user,  # Use admin as fallback
-                        action='CREATE' if created else 'UPDATE',
-                        table_name=instance._meta.db_table,
-                        record_id=instance.pk,
-                        old_values=old_values,
-                        new_values=new_values
-                    )
-            except Exception as e:
-                print(f"Error creating audit log: {str(e)}")
+        entry = {
+            'action': 'CREATE' if created else 'UPDATE',
+            'table_name': instance._meta.db_table,
+            'record_id': instance.pk,
+            'old_values': old_values,
+            'new_values': new_values
+        }
+        # Changes are attributed to the user of the request being handled
+        request = _audit_request.get()
+        if request is None:
+            # Outside a request (management commands, the shell, jobs) there is no one to
+            # attribute the change to, so it is logged now without a user
+            from .models import AuditLog
+            AuditLog.objects.create(**entry)
+            return
+
+        # Written by AuditLogMiddleware once the response is ready
+        if not hasattr(request, 'audit_data'):
+            request.audit_data = []
+        request.audit_data.append(entry)
 
 # Call this function in your app's ready method to set up signals
 # For example, in apps.py:
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_records', '0014_cacheversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groundbriefing',
+            index=models.Index(fields=['student', 'signed_off'], name='briefing_student_signed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groundbriefing',
+            index=models.Index(fields=['instructor', 'signed_off', 'date'], name='briefing_instr_signed_date_idx'),
+        ),
+    ]
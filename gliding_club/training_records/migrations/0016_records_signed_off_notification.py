@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_records', '0015_ground_briefing_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pendingnotification',
+            name='notification_type',
+            field=models.CharField(choices=[('instructor_weekly_digest', 'Weekly Pending Records Digest'), ('student_revision_needed', 'Student Record Needs Revision'), ('student_records_signed_off', 'Student Records Signed Off')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_records', '0016_records_signed_off_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingnotification',
+            name='ground_briefing',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='training_records.groundbriefing'),
+        ),
+        migrations.AlterField(
+            model_name='pendingnotification',
+            name='notification_type',
+            field=models.CharField(choices=[('instructor_weekly_digest', 'Weekly Pending Records Digest'), ('student_revision_needed', 'Student Record Needs Revision'), ('student_records_signed_off', 'Student Records Signed Off'), ('student_briefing_signed_off', 'Student Ground Briefing Signed Off')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.15 on 2026-10-19 14:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_records', '0018_jobcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignatureCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('entry_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_checkpoints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['student', 'sequence'],
+                'unique_together': {('student', 'sequence')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SignatureLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('record_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('sign_off', 'Sign-off'), ('amendment', 'Amendment after sign-off')], max_length=20)),
+                ('signature_hash', models.CharField(max_length=64)),
+                ('previous_hash', models.CharField(max_length=64)),
+                ('entry_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['student', 'sequence'],
+                'indexes': [models.Index(fields=['record_id'], name='ledger_record_idx')],
+                'unique_together': {('student', 'sequence')},
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:16
+
+import logging
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve(queryset, key, relabel):
+    """
+    Keep the oldest row of each duplicated key and relabel the others so the unique
+    constraint can be added; rows stay in place, so nothing that references them changes.
+    """
+    seen = set()
+    taken = set(queryset.model.objects.values_list(*key))
+    for row in queryset.order_by('pk'):
+        value = tuple(getattr(row, field) for field in key)
+        if value not in seen:
+            seen.add(value)
+            continue
+        copy = 2
+        while (new := relabel(row, copy)) in taken:
+            copy += 1
+        taken.add(new)
+        for field, field_value in zip(key, new):
+            setattr(row, field, field_value)
+        row.save(update_fields=list(key))
+        logger.warning(
+            f"{queryset.model.__name__} {row.pk}: duplicate {'/'.join(map(str, value))} "
+            f"renamed to {'/'.join(map(str, new))}"
+        )
+
+
+def resolve_duplicates(apps, schema_editor):
+    # Duplicates can only have been entered through the admin; imports never created them
+    TrainingTopic = apps.get_model('training_records', 'TrainingTopic')
+    Exercise = apps.get_model('training_records', 'Exercise')
+    GroundBriefingTopic = apps.get_model('training_records', 'GroundBriefingTopic')
+
+    _resolve(TrainingTopic.objects.all(), ('name',), lambda topic, copy: (f'{topic.name[:94]} ({copy})',))
+    # Unnumbered exercises are left out of the constraint
+    _resolve(
+        Exercise.objects.exclude(number=''), ('category', 'number'),
+        lambda exercise, copy: (exercise.category, f'{exercise.number[:7]}-{copy}'),
+    )
+    highest = GroundBriefingTopic.objects.aggregate(highest=models.Max('number'))['highest'] or 0
+    _resolve(GroundBriefingTopic.objects.all(), ('number',), lambda topic, copy: (highest + copy - 1,))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_records', '0019_signature_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='groundbriefingtopic',
+            name='number',
+            field=models.PositiveSmallIntegerField(unique=True, verbose_name='Briefing Number'),
+        ),
+        migrations.AlterField(
+            model_name='trainingtopic',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='exercise',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('number', ''), _negated=True), fields=('category', 'number'),
+                name='unique_exercise_number',
+            ),
+        ),
+    ]
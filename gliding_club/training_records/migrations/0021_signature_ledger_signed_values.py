@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_records', '0020_catalogue_natural_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='signatureledgerentry',
+            name='signed_values',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_records', '0021_signature_ledger_signed_values'),
+    ]
+
+    operations = [
+        # Start past every version already handed out, so none is handed out again
+        migrations.RunSQL(
+            """
+            CREATE SEQUENCE training_records_cacheversion_version_seq;
+            SELECT setval(
+                'training_records_cacheversion_version_seq',
+                (SELECT COALESCE(MAX(version), 0) + 1 FROM training_records_cacheversion),
+                false
+            );
+            """,
+            'DROP SEQUENCE training_records_cacheversion_version_seq;',
+        ),
+    ]
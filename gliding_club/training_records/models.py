@@ -1,5 +1,9 @@
 # training_records/models.py
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import BooleanField, Case, Count, OuterRef, Prefetch, Q, Subquery, Value, When
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Coalesce, Lower
+from django.contrib.postgres.indexes import OpClass
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
 from django.utils import timezone
@@ -7,6 +11,7 @@ import uuid
 import os
 import posixpath
 from datetime import date, timedelta
+from .services import signatures
 
 def get_secure_upload_path(instance, filename, subfolder):
     """
@@ -42,7 +47,71 @@ def student_medical_path(instance, filename):
     """Generate secure path for student medical ID uploads"""
     return get_secure_upload_path(instance, filename, 'student_medical')
 
-class User(AbstractUser):
+class DirtyFieldsMixin:
+    """
+    Remembers the field values an instance was loaded with. save() then writes only the
+    columns that changed (nothing at all if none did), and signal handlers can ask
+    get_dirty_fields() what a save changed instead of re-reading the row.
+    """
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def _remember_values(self, attnames=None):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            loaded = self._loaded_values = {}
+        if attnames is None:
+            attnames = [field.attname for field in self._meta.concrete_fields]
+        for name in attnames:
+            if name in self.__dict__:
+                value = self.__dict__[name]
+                # Files are renamed in place on upload, so remember the name rather than the object
+                loaded[name] = value.name if isinstance(value, FieldFile) else value
+    
+    def get_dirty_fields(self):
+        """
+        {attname: loaded value} of the fields changed since the instance was loaded or saved,
+        or None for an instance that was never loaded from the database
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            name = field.attname
+            if name not in self.__dict__:
+                continue  # deferred and never read, so it cannot have changed
+            if name not in loaded:
+                dirty[name] = None  # deferred at load, then assigned
+            elif getattr(self, name) != loaded[name]:
+                dirty[name] = loaded[name]
+        return dirty
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_values([self._meta.get_field(name).attname for name in fields] if fields else None)
+    
+    def save(self, *args, **kwargs):
+        if (not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+                and not self._state.adding):
+            dirty = self.get_dirty_fields()
+            if dirty is not None and self._meta.pk.attname not in dirty:
+                # auto_now fields are only refreshed when they are written
+                auto_now = [
+                    field.attname for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)
+                ]
+                kwargs['update_fields'] = [*dirty, *auto_now] if dirty else []
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._remember_values(
+            None if update_fields is None else [self._meta.get_field(name).attname for name in update_fields]
+        )
+
+class User(DirtyFieldsMixin, AbstractUser):
     """Extended User model to differentiate between students and instructors"""
     USER_TYPE_CHOICES = (
         ('student', 'Student'),
@@ -88,8 +157,19 @@ class User(AbstractUser):
         return self.license_expiration_date <= date.today() + timedelta(days=days)
     class Meta:
         db_table = 'auth_user'
+        indexes = [
+            models.Index(fields=['user_type', 'is_active'], name='user_type_active_idx'),
+            # lower() prefix indexes for the student typeahead search
+            models.Index(OpClass(Lower('first_name'), name='text_pattern_ops'), name='user_first_name_lower_idx'),
+            models.Index(OpClass(Lower('last_name'), name='text_pattern_ops'), name='user_last_name_lower_idx'),
+            models.Index(OpClass(Lower('username'), name='text_pattern_ops'), name='user_username_lower_idx'),
+            models.Index(
+                OpClass(Lower('student_license_number'), name='text_pattern_ops'),
+                name='user_license_lower_idx',
+            ),
+        ]
         
-class Glider(models.Model):
+class Glider(DirtyFieldsMixin, models.Model):
     """Model for glider aircraft information"""
     tail_number = models.CharField(max_length=10, unique=True)
     model = models.CharField(max_length=50)
@@ -100,9 +180,10 @@ class Glider(models.Model):
     def __str__(self):
         return f"{self.tail_number} ({self.model})"
 
-class TrainingTopic(models.Model):
+class TrainingTopic(DirtyFieldsMixin, models.Model):
     """Predefined training topics for lessons"""
-    name = models.CharField(max_length=100)
+    # Unique so catalogue imports can upsert by name
+    name = models.CharField(max_length=100, unique=True)
     description = models.TextField()
     category = models.CharField(max_length=50, blank=True)
     required_for_certification = models.BooleanField(default=False)
@@ -110,7 +191,67 @@ class TrainingTopic(models.Model):
     def __str__(self):
         return self.name
 
-class TrainingRecord(models.Model):
+# Exercise performance values that mean the exercise was actually flown
+PERFORMED_VALUES = ('performed_well', 'needs_improvement', 'performed_badly')
+
+# How long an instructor can still modify a record after signing it off
+MODIFICATION_WINDOW = timedelta(days=7)
+
+class TrainingRecordQuerySet(models.QuerySet):
+    """Reusable projections for the pages, exports and emails that list training records"""
+    
+    def with_flight_number(self):
+        """Annotate flight_number: the record's 1-based position in the student's history"""
+        earlier_records = self.model.objects.filter(
+            student=OuterRef('student')
+        ).filter(
+            Q(date__lt=OuterRef('date')) |
+            Q(date=OuterRef('date'), created_at__lte=OuterRef('created_at'))
+        ).order_by().values('student').annotate(count=Count('pk')).values('count')
+        return self.annotate(flight_number=Subquery(earlier_records))
+    
+    def with_performed_exercise_count(self):
+        """Annotate performed_exercise_count from the record's exercise performances"""
+        performed = ExercisePerformance.objects.filter(
+            training_record=OuterRef('pk'),
+            performance__in=PERFORMED_VALUES,
+        ).order_by().values('training_record').annotate(count=Count('pk')).values('count')
+        return self.annotate(performed_exercise_count=Coalesce(Subquery(performed), 0))
+    
+    def with_modifiable(self):
+        """Annotate is_modifiable: unsigned, or signed off within the modification window"""
+        cutoff = timezone.now() - MODIFICATION_WINDOW
+        return self.annotate(is_modifiable=Case(
+            When(signed_off=False, then=Value(True)),
+            When(sign_off_timestamp__gt=cutoff, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ))
+    
+    def with_performances(self):
+        """Prefetch exercise performances together with their exercises"""
+        return self.prefetch_related(Prefetch(
+            'exercise_performances',
+            queryset=ExercisePerformance.objects.select_related('exercise'),
+        ))
+    
+    def for_list(self):
+        """Everything the record tables and dashboards show per row"""
+        return self.select_related(
+            'student', 'instructor', 'training_topic', 'glider'
+        ).with_flight_number().with_performed_exercise_count().with_modifiable()
+    
+    def for_export(self):
+        """Everything the CSV and PDF exports show per row"""
+        return self.select_related(
+            'student', 'instructor', 'training_topic', 'glider'
+        ).with_flight_number()
+    
+    def for_digest(self):
+        """Everything the notification emails show per record"""
+        return self.select_related('student', 'instructor', 'glider')
+
+class TrainingRecord(DirtyFieldsMixin, models.Model):
     """Core model for recording student training sessions"""
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='student_records', 
                                 limit_choices_to={'user_type': 'student'})
@@ -146,32 +287,57 @@ class TrainingRecord(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_records')
     
+    objects = TrainingRecordQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-date', '-created_at']
     
     def __str__(self):
         return f"{self.student.username} - {self.training_topic} - {self.date}"
     
-    def get_performed_exercises(self):
-        """Get exercises that were performed (either well or needs improvement)"""
+    def _has_prefetched_performances(self):
+        return 'exercise_performances' in getattr(self, '_prefetched_objects_cache', {})
+    
+    def _exercises_with_performance(self, performances):
+        """Exercises with one of the given performance values, from the prefetch cache when available"""
+        if self._has_prefetched_performances():
+            exercises = [
+                perf.exercise for perf in self.exercise_performances.all()
+                if perf.performance in performances
+            ]
+            return sorted(exercises, key=lambda exercise: (exercise.category, exercise.number, exercise.name))
         return Exercise.objects.filter(
             performances__training_record=self, 
-            performances__performance__in=['performed_well', 'needs_improvement']
+            performances__performance__in=performances
         )
     
+    def get_performed_exercises(self):
+        """Get exercises that were performed (either well or needs improvement)"""
+        return self._exercises_with_performance(['performed_well', 'needs_improvement'])
+    
     def get_well_performed_exercises(self):
         """Get exercises that were performed well"""
-        return Exercise.objects.filter(
-            performances__training_record=self, 
-            performances__performance='performed_well'
-        )
+        return self._exercises_with_performance(['performed_well'])
     
     def get_needs_improvement_exercises(self):
         """Get exercises that need improvement"""
-        return Exercise.objects.filter(
-            performances__training_record=self, 
-            performances__performance='needs_improvement'
-        )
+        return self._exercises_with_performance(['needs_improvement'])
+    
+    def get_performed_performances_by_category(self):
+        """
+        Performances of exercises that were flown, keyed by exercise category and
+        sorted by exercise number. One query, or none when prefetched with with_performances().
+        """
+        if self._has_prefetched_performances():
+            performances = self.exercise_performances.all()
+        else:
+            performances = self.exercise_performances.select_related('exercise')
+        
+        by_category = {category: [] for category, _ in Exercise.CATEGORY_CHOICES}
+        for perf in sorted(performances, key=lambda perf: (perf.exercise.number, perf.exercise.name)):
+            if perf.performance in PERFORMED_VALUES:
+                by_category.setdefault(perf.exercise.category, []).append(perf)
+        return by_category
     
     def reset_notification_flags(self):
         """Reset notification flags when record is updated"""
@@ -184,25 +350,42 @@ class TrainingRecord(models.Model):
             training_record=self,
             notification_type='student_revision_needed'
         ).update(is_sent=False)
+    def compute_signature_hash(self):
+        """Signature hash over the record data and sign-off timestamp; needs no related objects"""
+        return signatures.signature_hash([getattr(self, field) for field in signatures.SIGNED_FIELDS])
+    
     # Keep the sign method the same as before
     def sign(self, instructor):
         """Method to sign off a training record"""
-        if not self.signed_off and instructor.is_instructor() and instructor.id == self.instructor.id:
+        if not self.signed_off and instructor.is_instructor() and instructor.id == self.instructor_id:
             self.signed_off = True
             self.sign_off_timestamp = timezone.now()
             
             # Generate a signature hash based on the record data and timestamp
-            import hashlib
-            data_string = (
-                f"{self.id}|{self.student.id}|{self.instructor.id}|{self.training_topic.id}|"
-                f"{self.glider.id}|{self.date}|{self.flight_duration}|{self.sign_off_timestamp}"
-            )
-            self.signature_hash = hashlib.sha256(data_string.encode()).hexdigest()
+            self.signature_hash = self.compute_signature_hash()
             
-            self.save()
+            from .services import ledger
+            with transaction.atomic():
+                self.save()
+                ledger.append([self])
             return True
         return False
     
+    def amend_signature(self):
+        """Re-sign a signed record after an allowed modification, keeping its sign-off time"""
+        if not self.signed_off:
+            return False
+        signature_hash = self.compute_signature_hash()
+        if signature_hash == self.signature_hash:
+            return False
+        
+        from .services import ledger
+        with transaction.atomic():
+            self.signature_hash = signature_hash
+            self.save(update_fields=['signature_hash', 'updated_at'])
+            ledger.append([self], kind=ledger.AMENDMENT)
+        return True
+    
     def get_flight_number(self):
         """Get this flight's number for the student (1-based)"""
         student_records = TrainingRecord.objects.filter(
@@ -232,17 +415,20 @@ class TrainingRecord(models.Model):
         if hasattr(self, 'signed_by') and self.signed_by != user:
             return False
         
+        # Computed in SQL when loaded through TrainingRecordQuerySet.with_modifiable()
+        if hasattr(self, 'is_modifiable'):
+            return self.is_modifiable
+        
         # Check if it's been less than 7 days since sign-off
         if self.sign_off_timestamp:
-            seven_days_ago = timezone.now() - timedelta(days=7)
-            return self.sign_off_timestamp > seven_days_ago
+            return self.sign_off_timestamp > timezone.now() - MODIFICATION_WINDOW
         
         return False
     
     def get_modification_deadline(self):
         """Get the deadline for modifications after sign-off"""
         if self.sign_off_timestamp:
-            return self.sign_off_timestamp + timedelta(days=7)
+            return self.sign_off_timestamp + MODIFICATION_WINDOW
         return None
     
     def days_until_modification_deadline(self):
@@ -256,7 +442,8 @@ class TrainingRecord(models.Model):
 
 class AuditLog(models.Model):
     """Audit logging for all changes to training records"""
-    user = models.ForeignKey(User, on_delete=models.PROTECT)
+    # Empty for changes made outside a request (management commands, the shell)
+    user = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True)
     action = models.CharField(max_length=50)
     table_name = models.CharField(max_length=50)
     record_id = models.PositiveIntegerField()
@@ -269,7 +456,7 @@ class AuditLog(models.Model):
     class Meta:
         ordering = ['-timestamp']
 
-class Exercise(models.Model):
+class Exercise(DirtyFieldsMixin, models.Model):
     """Model for specific flight exercises that can be performed during training"""
     name = models.CharField(max_length=100)
     description = models.TextField()
@@ -285,13 +472,21 @@ class Exercise(models.Model):
     
     class Meta:
         ordering = ['category', 'number', 'name']
+        constraints = [
+            # The syllabus numbers exercises within each category and catalogue imports match
+            # by it; exercises added by hand may be left unnumbered
+            models.UniqueConstraint(
+                fields=['category', 'number'], condition=~Q(number=''),
+                name='unique_exercise_number',
+            ),
+        ]
     
     def __str__(self):
         if self.number:
             return f"{self.number} - {self.name}"
         return self.name
     
-class ExercisePerformance(models.Model):
+class ExercisePerformance(DirtyFieldsMixin, models.Model):
     """Model to track individual exercise performance in a training session"""
     PERFORMANCE_CHOICES = [
         ('performed_well', 'Performed Well'),
@@ -313,9 +508,9 @@ class ExercisePerformance(models.Model):
         return f"{self.exercise.name} - {self.get_performance_display()}"
     
 # Add this class with your other models
-class GroundBriefingTopic(models.Model):
+class GroundBriefingTopic(DirtyFieldsMixin, models.Model):
     """Model representing a topic that must be covered in ground briefings"""
-    number = models.PositiveSmallIntegerField(verbose_name='Briefing Number')
+    number = models.PositiveSmallIntegerField(unique=True, verbose_name='Briefing Number')
     name = models.CharField(max_length=100, verbose_name='Topic Name')
     details = models.TextField(blank=True, verbose_name='Topic Details')
     
@@ -327,7 +522,7 @@ class GroundBriefingTopic(models.Model):
     def __str__(self):
         return f"{self.number}. {self.name}"
 
-class GroundBriefing(models.Model):
+class GroundBriefing(DirtyFieldsMixin, models.Model):
     """Model representing a ground briefing session with an instructor"""
     student = models.ForeignKey(
         User, 
@@ -362,6 +557,11 @@ class GroundBriefing(models.Model):
         verbose_name_plural = 'Ground Briefings'
         # Ensure a student can't have the same topic briefed multiple times
         unique_together = ['student', 'topic']
+        indexes = [
+            # Ground briefing list filters and the student status pivot
+            models.Index(fields=['student', 'signed_off'], name='briefing_student_signed_idx'),
+            models.Index(fields=['instructor', 'signed_off', 'date'], name='briefing_instr_signed_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.student.get_full_name()} - {self.topic}"
@@ -376,37 +576,19 @@ class GroundBriefing(models.Model):
             return True
         return False
     
-    def reset_notification_flags(self):
-        """Reset notification flags when record is updated"""
-        # Import inside method to avoid circular imports
-        from django.apps import apps
-        PendingNotification = apps.get_model('training_records', 'PendingNotification')
-        
-        # Reset any pending notifications for this record
-        PendingNotification.objects.filter(
-            training_record=self,
-            notification_type='student_revision_needed'
-        ).update(is_sent=False)
-    
-    def save(self, *args, **kwargs):
-        """Override save to reset notification flags on updates"""
-        is_update = self.pk is not None
-        super().save(*args, **kwargs)
-        
-        # Reset notification flags if this is an update to an existing record
-        if is_update:
-            self.reset_notification_flags()
-    
 class PendingNotification(models.Model):
     """Track notifications that need to be sent"""
     NOTIFICATION_TYPES = [
         ('instructor_weekly_digest', 'Weekly Pending Records Digest'),
         ('student_revision_needed', 'Student Record Needs Revision'),
+        ('student_records_signed_off', 'Student Records Signed Off'),
+        ('student_briefing_signed_off', 'Student Ground Briefing Signed Off'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     notification_type = models.CharField(max_length=50, choices=NOTIFICATION_TYPES)
     training_record = models.ForeignKey(TrainingRecord, on_delete=models.CASCADE, null=True, blank=True)
+    ground_briefing = models.ForeignKey(GroundBriefing, on_delete=models.CASCADE, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True)
     is_sent = models.BooleanField(default=False)
@@ -415,4 +597,126 @@ class PendingNotification(models.Model):
         unique_together = ['user', 'notification_type', 'training_record']
     
     def __str__(self):
-        return f"{self.get_notification_type_display()} for {self.user.username}"
\ No newline at end of file
+        return f"{self.get_notification_type_display()} for {self.user.username}"
+class CacheVersion(models.Model):
+    """Version counter shared by all worker processes, bumped to invalidate their in-process caches"""
+    # Bumps take their new version from this sequence rather than adding one to the row:
+    # nextval() is not rolled back, so a version handed out inside a transaction that
+    # rolls back is never handed out again, and nothing built under it looks current
+    SEQUENCE = 'training_records_cacheversion_version_seq'
+    
+    name = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+    
+    @classmethod
+    def get_version(cls, name):
+        """Current version of a counter (0 if it was never bumped)"""
+        # Always read the primary so a lagging replica cannot hide a bump
+        version = cls.objects.using(DEFAULT_DB_ALIAS).filter(name=name).values_list('version', flat=True).first()
+        return version or 0
+    
+    @classmethod
+    def get_versions(cls, names, using=DEFAULT_DB_ALIAS):
+        """Current versions of several counters in one query, as a dict (0 for counters never bumped)"""
+        versions = dict.fromkeys(names, 0)
+        versions.update(cls.objects.using(using).filter(name__in=versions).values_list('name', 'version'))
+        return versions
+    
+    @classmethod
+    def bump_many(cls, names):
+        """Move several counters to new versions in a single statement"""
+        names = sorted(set(names))  # a fixed order avoids deadlocks between concurrent bumps
+        if not names:
+            return
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {cls._meta.db_table} (name, version)
+                VALUES {', '.join([f"(%s, nextval('{cls.SEQUENCE}'))"] * len(names))}
+                ON CONFLICT (name) DO UPDATE SET version = EXCLUDED.version
+                """,
+                names,
+            )
+    
+    @classmethod
+    def bump(cls, name):
+        """Move a counter to a new version in a single statement and return it"""
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {cls._meta.db_table} (name, version) VALUES (%s, nextval('{cls.SEQUENCE}'))
+                ON CONFLICT (name) DO UPDATE SET version = EXCLUDED.version
+                RETURNING version
+                """,
+                [name],
+            )
+            return cursor.fetchone()[0]
+
+class JobCheckpoint(models.Model):
+    """Where a long-running maintenance command got to, so the next run can resume or work incrementally"""
+    name = models.CharField(max_length=100, unique=True)
+    # Last primary key processed, for keyset-chunked scans
+    position = models.BigIntegerField(default=0)
+    # Rows changed after this time still need processing
+    watermark = models.DateTimeField(null=True, blank=True)
+    # Anything else the command wants to keep between runs
+    data = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} at {self.position}"
+    
+    @classmethod
+    def load(cls, name):
+        """The named checkpoint, created empty on first use"""
+        return cls.objects.get_or_create(name=name)[0]
+
+class SignatureLedgerEntry(models.Model):
+    """
+    Append-only, per-student chain of sign-offs: each entry hashes the one before it, so
+    rewriting any earlier entry changes every later hash and the checkpoints that hold them
+    """
+    KIND_CHOICES = [
+        ('sign_off', 'Sign-off'),
+        ('amendment', 'Amendment after sign-off'),
+    ]
+    
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='signature_ledger')
+    sequence = models.PositiveIntegerField()
+    # Not a foreign key: deleting a signed record must not rewrite the ledger
+    record_id = models.BigIntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    signature_hash = models.CharField(max_length=64)
+    previous_hash = models.CharField(max_length=64)
+    entry_hash = models.CharField(max_length=64)
+    # The signed fields as they were hashed, so verify_signatures can name what changed since.
+    # Not covered by entry_hash: it explains a mismatch, it does not prove anything
+    signed_values = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['student', 'sequence']
+        unique_together = ['student', 'sequence']
+        indexes = [
+            models.Index(fields=['record_id'], name='ledger_record_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.student_id} #{self.sequence} {self.kind} of record {self.record_id}"
+
+class SignatureCheckpoint(models.Model):
+    """The chain hash after every CHECKPOINT_INTERVAL-th entry of a student's ledger"""
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='signature_checkpoints')
+    sequence = models.PositiveIntegerField()
+    entry_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['student', 'sequence']
+        unique_together = ['student', 'sequence']
+    
+    def __str__(self):
+        return f"{self.student_id} checkpoint #{self.sequence}"
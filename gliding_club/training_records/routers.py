@@ -0,0 +1,41 @@
+# training_records/routers.py
+"""
+Database router that sends reads from read-only views to a replica.
+
+ReplicaRoutingMiddleware switches routing on for requests to the views listed
+in REPLICA_READ_VIEWS. Everything else, including all writes and any read
+made outside those views, goes to the primary ('default').
+"""
+import contextvars
+
+REPLICA_ALIAS = 'replica'
+
+_read_from_replica = contextvars.ContextVar('read_from_replica', default=False)
+
+
+def use_replica():
+    """Route reads for the rest of the current request to the replica. Returns a reset token."""
+    return _read_from_replica.set(True)
+
+
+def reset(token):
+    """Undo use_replica()"""
+    _read_from_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects from either can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Migrations only run on the primary; the replica receives them through replication
+        return db == 'default'
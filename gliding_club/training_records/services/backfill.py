@@ -0,0 +1,134 @@
+# training_records/services/backfill.py
+"""
+Chunked, resumable, throttled data backfills.
+
+A backfill walks one model in keyset chunks (see batching) and writes each chunk with
+bulk statements in its own transaction, together with its position in the JobCheckpoint
+table. Locks are held for one chunk at a time, an interrupted backfill resumes where it
+stopped, and BACKFILL_SLEEP seconds between chunks leave a live database room for
+other work.
+
+Backfills are registered here and run the same way from a migration, with the
+migration's historical apps:
+
+    def forwards(apps, schema_editor):
+        backfill.run('exercise_performances', apps)
+
+    class Migration(migrations.Migration):
+        atomic = False  # a transaction per chunk, not one around the whole backfill
+
+and from the command line: python manage.py backfill exercise_performances.
+
+Backfills must be idempotent. Migrations older than the JobCheckpoint table (0018)
+have nowhere to store progress, so a rerun of those starts from the beginning.
+"""
+import logging
+import time
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+
+from . import batching
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PREFIX = 'backfill.'
+BACKFILLS = {}
+
+def register(cls):
+    """Class decorator adding a backfill to BACKFILLS under its name"""
+    BACKFILLS[cls.name] = cls
+    return cls
+
+class Backfill:
+    """Set name, model ('app_label.Model') and the fields each row needs besides its pk, and implement process()"""
+    name = None
+    model = None
+    fields = ()
+
+    def queryset(self, apps):
+        return apps.get_model(self.model)._default_manager.all()
+
+    def process(self, rows, apps):
+        """Write one chunk of (pk, *fields) rows with bulk statements"""
+        raise NotImplementedError
+
+def _checkpoint(name, apps):
+    try:
+        JobCheckpoint = apps.get_model('training_records', 'JobCheckpoint')
+    except LookupError:
+        return None  # Run from a migration older than the progress table
+    return JobCheckpoint._default_manager.get_or_create(name=CHECKPOINT_PREFIX + name)[0]
+
+def run(name, apps=None, chunk_size=None, sleep=None, restart=False, report=None):
+    """
+    Run the named backfill from where its last run stopped (or from the start with restart);
+    returns the rows processed. report(message) is called after every chunk.
+    """
+    apps = apps or global_apps
+    backfill = BACKFILLS[name]()
+    chunk_size = chunk_size or settings.BACKFILL_CHUNK_SIZE
+    sleep = settings.BACKFILL_SLEEP if sleep is None else sleep
+    report = report or logger.info
+
+    checkpoint = _checkpoint(name, apps)
+    after = 0
+    if checkpoint is not None:
+        if restart or checkpoint.data.get('finished', True):
+            checkpoint.position = 0
+            checkpoint.data = {'rows': 0, 'finished': False}
+        else:
+            report(f'{name}: resuming after id {checkpoint.position}')
+        after = checkpoint.position
+
+    processed = 0
+    started = time.perf_counter()
+    for rows in batching.keyset_chunks(backfill.queryset(apps), *backfill.fields, chunk_size=chunk_size, after=after):
+        if processed and sleep:
+            time.sleep(sleep)
+        with transaction.atomic():
+            backfill.process(rows, apps)
+            if checkpoint is not None:
+                checkpoint.position = rows[-1][0]
+                checkpoint.data['rows'] += len(rows)
+                checkpoint.save()
+        processed += len(rows)
+        report(f'{name}: {processed} rows, up to id {rows[-1][0]} ({time.perf_counter() - started:.1f}s)')
+
+    if checkpoint is not None:
+        checkpoint.data['finished'] = True
+        checkpoint.save()
+    return processed
+
+@register
+class ExercisePerformances(Backfill):
+    """
+    A performance for every exercise on every training record (migration 0008). Exercises
+    in the record's old exercises list were performed well; existing performances are kept.
+    """
+    name = 'exercise_performances'
+    model = 'training_records.TrainingRecord'
+
+    def __init__(self):
+        self.exercise_ids = None
+
+    def process(self, rows, apps):
+        Exercise = apps.get_model('training_records', 'Exercise')
+        ExercisePerformance = apps.get_model('training_records', 'ExercisePerformance')
+        TrainingRecord = apps.get_model('training_records', 'TrainingRecord')
+
+        if self.exercise_ids is None:
+            self.exercise_ids = list(Exercise._default_manager.values_list('pk', flat=True))
+        record_ids = [row[0] for row in rows]
+        flown = set(TrainingRecord.exercises.through._default_manager.filter(
+            trainingrecord_id__in=record_ids,
+        ).values_list('trainingrecord_id', 'exercise_id'))
+        ExercisePerformance._default_manager.bulk_create([
+            ExercisePerformance(
+                training_record_id=record_id, exercise_id=exercise_id,
+                performance='performed_well' if (record_id, exercise_id) in flown else 'not_performed',
+            )
+            for record_id in record_ids
+            for exercise_id in self.exercise_ids
+        ], batch_size=1000, ignore_conflicts=True)
@@ -0,0 +1,24 @@
+# training_records/services/batching.py
+"""
+Walk large tables a chunk at a time in primary key order.
+
+Each chunk is its own `pk > last ORDER BY pk LIMIT n` query, so no cursor stays open
+between chunks: work committed between them (repairs, progress checkpoints) does not
+force the database to materialise the rest of the scan, memory stays at one chunk,
+and the last primary key seen is all a resumed run needs.
+"""
+
+def keyset_chunks(queryset, *fields, chunk_size=1000, after=0):
+    """
+    Yield lists of (pk, *fields) rows of the queryset after the given primary key,
+    chunk_size rows at a time
+    """
+    rows_after = queryset.order_by('pk').values_list('pk', *fields)
+    while True:
+        rows = list(rows_after.filter(pk__gt=after)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][0]
@@ -0,0 +1,83 @@
+# training_records/services/boot.py
+"""
+Helpers for fast_boot, which replaces the unconditional migrate and collectstatic
+of every container start.
+
+Pending migrations are found from the migration plan, which costs loading the
+migration files and one query of django_migrations; migrate itself also runs the
+post_migrate handlers for every app. Replicas starting together serialise on a
+Postgres advisory lock and check the plan again once they hold it, so only the
+first one migrates.
+
+collectstatic leaves a fingerprint of the source static files in STATIC_ROOT; while
+the sources hash to the same value, the collected files are current.
+"""
+import hashlib
+import os
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# pg_advisory_lock key shared by every replica of the app
+MIGRATE_LOCK_ID = 0x676c6964
+FINGERPRINT_NAME = '.fingerprint'
+# collectstatic's default ignore patterns
+IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+def pending_migrations(using=DEFAULT_DB_ALIAS):
+    """(app_label, migration name) of every migration migrate would apply"""
+    from django.db.migrations.executor import MigrationExecutor
+
+    executor = MigrationExecutor(connections[using])
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return [(migration.app_label, migration.name) for migration, backwards in plan]
+
+@contextmanager
+def advisory_lock(lock_id, using=DEFAULT_DB_ALIAS):
+    """Hold a session-level Postgres advisory lock, waiting for other holders"""
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s)', [lock_id])
+    try:
+        yield
+    finally:
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [lock_id])
+
+def migrate_lock(using=DEFAULT_DB_ALIAS):
+    """The advisory lock on Postgres; other databases run one process against them"""
+    if connections[using].vendor != 'postgresql':
+        return nullcontext()
+    return advisory_lock(MIGRATE_LOCK_ID, using)
+
+def static_fingerprint():
+    """SHA-256 over the path and content of every file collectstatic would collect"""
+    from django.contrib.staticfiles.finders import get_finders
+
+    found = {}
+    for finder in get_finders():
+        for path, storage in finder.list(IGNORE_PATTERNS):
+            # Like collectstatic, the first finder to list a path wins
+            found.setdefault(path, storage)
+    digest = hashlib.sha256()
+    for path in sorted(found):
+        digest.update(path.encode() + b'\0')
+        with found[path].open(path) as source:
+            for block in iter(lambda: source.read(1 << 16), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def fingerprint_path():
+    return os.path.join(settings.STATIC_ROOT, FINGERPRINT_NAME)
+
+def collected_fingerprint():
+    """The fingerprint left by the last collect, or None"""
+    try:
+        with open(fingerprint_path()) as stored:
+            return stored.read().strip()
+    except FileNotFoundError:
+        return None
+
+def record_fingerprint(fingerprint):
+    with open(fingerprint_path(), 'w') as stored:
+        stored.write(fingerprint + '\n')
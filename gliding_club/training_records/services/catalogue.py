@@ -0,0 +1,151 @@
+# training_records/services/catalogue.py
+"""
+In-process cache of the reference data that rarely changes: exercises,
+training topics, gliders, ground briefing topics and the instructor list.
+
+Each worker keeps one immutable Catalogue snapshot. A version counter stored
+in the database (CacheVersion 'catalogue') is bumped by model signals whenever
+any of these tables change, and every worker compares it with its snapshot at
+most once per request, so all workers see a change on their next request
+without an external cache.
+"""
+import contextvars
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+
+from .fragment_cache import SIGN_IN_FIELDS
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_VERSION_NAME = 'catalogue'
+
+# Set by CatalogueMiddleware to a per-request marker, so the version is checked
+# once per request. Outside requests (commands, shell) it is checked on every call.
+_current_request = contextvars.ContextVar('catalogue_request', default=None)
+
+_lock = threading.Lock()
+_catalogue = None
+_checked_for_request = None
+
+class Catalogue:
+    """Immutable snapshot of the reference data, as ordered tuples and id -> object maps"""
+
+    def __init__(self, version, exercises, training_topics, gliders, briefing_topics, instructors):
+        self.version = version
+
+        # Exercises and briefing topics follow Meta.ordering; topics and gliders are in creation order
+        self.exercises = tuple(exercises)
+        self.training_topics = tuple(training_topics)
+        self.gliders = tuple(gliders)
+        self.briefing_topics = tuple(briefing_topics)
+        self.instructors = tuple(instructors)
+
+        self.exercises_by_id = {exercise.pk: exercise for exercise in self.exercises}
+        self.training_topics_by_id = {topic.pk: topic for topic in self.training_topics}
+        self.gliders_by_id = {glider.pk: glider for glider in self.gliders}
+        self.briefing_topics_by_id = {topic.pk: topic for topic in self.briefing_topics}
+        self.instructors_by_id = {instructor.pk: instructor for instructor in self.instructors}
+
+        # Views list exercises by category, ordered by number and name
+        by_number = sorted(self.exercises, key=lambda exercise: (exercise.number, exercise.name))
+        self.pre_solo_exercises = tuple(e for e in by_number if e.category == 'pre-solo')
+        self.post_solo_exercises = tuple(e for e in by_number if e.category == 'post-solo')
+        self.active_gliders = tuple(glider for glider in self.gliders if glider.is_active)
+
+    @classmethod
+    def load(cls, version):
+        """Build a snapshot from the primary database, which the version was read from"""
+        from ..models import Exercise, TrainingTopic, Glider, GroundBriefingTopic, User
+        return cls(
+            version=version,
+            exercises=Exercise.objects.using(DEFAULT_DB_ALIAS),
+            training_topics=TrainingTopic.objects.using(DEFAULT_DB_ALIAS).order_by('pk'),
+            gliders=Glider.objects.using(DEFAULT_DB_ALIAS).order_by('pk'),
+            briefing_topics=GroundBriefingTopic.objects.using(DEFAULT_DB_ALIAS),
+            instructors=User.objects.using(DEFAULT_DB_ALIAS).filter(
+                user_type='instructor'
+            ).order_by('first_name', 'last_name'),
+        )
+
+def _load(version):
+    """Load a catalogue, through the shared snapshot file when CATALOGUE_SNAPSHOT_PATH is set"""
+    path = getattr(settings, 'CATALOGUE_SNAPSHOT_PATH', '')
+    if not path:
+        return Catalogue.load(version)
+
+    from . import catalogue_snapshot
+    catalogue = catalogue_snapshot.load(path, version)
+    if catalogue is None:
+        # First worker to see this version refreshes the snapshot for the others
+        catalogue = Catalogue.load(version)
+        try:
+            catalogue_snapshot.write(path, catalogue)
+        except OSError as e:
+            logger.warning(f"Could not write catalogue snapshot to {path}: {e}")
+    return catalogue
+
+def write_snapshot():
+    """Write the current catalogue to CATALOGUE_SNAPSHOT_PATH; called by the gunicorn master before forking"""
+    from ..models import CacheVersion
+    from . import catalogue_snapshot
+    catalogue = Catalogue.load(CacheVersion.get_version(CATALOGUE_VERSION_NAME))
+    catalogue_snapshot.write(settings.CATALOGUE_SNAPSHOT_PATH, catalogue)
+    return catalogue
+
+def get_catalogue():
+    """Return the current catalogue snapshot, reloading it if another process changed the data"""
+    global _catalogue, _checked_for_request
+    from ..models import CacheVersion
+
+    request_marker = _current_request.get()
+    catalogue = _catalogue
+    if catalogue is not None and request_marker is not None and _checked_for_request is request_marker:
+        return catalogue
+
+    version = CacheVersion.get_version(CATALOGUE_VERSION_NAME)
+    if catalogue is None or catalogue.version != version:
+        with _lock:
+            if _catalogue is None or _catalogue.version != version:
+                _catalogue = _load(version)
+                logger.debug(f"Loaded reference data catalogue version {version}")
+            catalogue = _catalogue
+
+    _checked_for_request = request_marker
+    return catalogue
+
+def start_request():
+    """Mark the start of a request; returns a token for end_request()"""
+    return _current_request.set(object())
+
+def end_request(token):
+    _current_request.reset(token)
+
+def invalidate():
+    """Bump the catalogue version so every worker reloads it"""
+    from ..models import CacheVersion
+    return CacheVersion.bump(CATALOGUE_VERSION_NAME)
+
+def _reference_data_changed(sender, instance, **kwargs):
+    invalidate()
+
+def _user_changed(sender, instance, **kwargs):
+    # Only instructors are in the catalogue; sign-ins and password changes are ignored
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= SIGN_IN_FIELDS:
+        return
+    catalogue = _catalogue
+    if instance.user_type == 'instructor' or (catalogue and instance.pk in catalogue.instructors_by_id):
+        invalidate()
+
+def connect_signals():
+    """Invalidate the catalogue whenever reference data is saved or deleted"""
+    for model in ('Exercise', 'TrainingTopic', 'Glider', 'GroundBriefingTopic'):
+        sender = f'training_records.{model}'
+        post_save.connect(_reference_data_changed, sender=sender, dispatch_uid=f'catalogue_save_{model}')
+        post_delete.connect(_reference_data_changed, sender=sender, dispatch_uid=f'catalogue_delete_{model}')
+    post_save.connect(_user_changed, sender='training_records.User', dispatch_uid='catalogue_save_User')
+    post_delete.connect(_user_changed, sender='training_records.User', dispatch_uid='catalogue_delete_User')
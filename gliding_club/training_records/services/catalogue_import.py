@@ -0,0 +1,259 @@
+# training_records/services/catalogue_import.py
+"""
+Import the reference data workbooks (training topics, exercises, ground briefing topics).
+
+A sheet is streamed with openpyxl in read-only mode into one list per column, and each
+column is validated as a whole before anything is written. Rows are matched to the
+database by their natural key; only new and changed rows are written, with one
+bulk_create(update_conflicts=True) per table, all in one transaction. Changed rows carry
+the primary key diff() matched them to and conflict on it: Postgres cannot infer the
+partial unique index on exercise numbers from the columns alone. diff() gives the
+same comparison without writing, for --dry-run.
+
+sync() imports the topic and exercise workbooks in data/ after every migrate. It keeps a
+SHA-256 of each file in the JobCheckpoint table and only reads the files whose content
+changed, so a boot with unchanged workbooks costs one query and no spreadsheet parsing.
+"""
+import hashlib
+import os
+from dataclasses import dataclass, field, replace
+
+from django.conf import settings
+from django.db import transaction
+
+class CatalogueImportError(Exception):
+    """The workbook cannot be imported; the message lists every problem found"""
+
+def _text(value):
+    return '' if value is None else str(value)
+
+def _boolean(value):
+    return str(value).strip().lower() == 'true'
+
+def _integer(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{value!r} is not a whole number')
+    return value
+
+@dataclass(frozen=True)
+class Sheet:
+    """How one workbook maps onto a model: its columns, their converters and the natural key"""
+    model: str
+    filename: str
+    columns: dict
+    key: tuple
+    required: tuple
+
+    def get_model(self):
+        from django.apps import apps
+        return apps.get_model('training_records', self.model)
+
+SHEETS = {
+    'training_topics': Sheet(
+        model='TrainingTopic', filename='training_topics.xlsx',
+        columns={'name': _text, 'description': _text, 'category': _text, 'required_for_certification': _boolean},
+        key=('name',), required=('name',),
+    ),
+    'exercises': Sheet(
+        model='Exercise', filename='exercises.xlsx',
+        columns={'name': _text, 'description': _text, 'category': _text, 'number': _text, 'is_required': _boolean},
+        # The syllabus has numbered exercises without a name, so name may be empty
+        key=('category', 'number'), required=('category', 'number'),
+    ),
+    'ground_briefings': Sheet(
+        model='GroundBriefingTopic', filename='ground_briefings.xlsx',
+        columns={'number': _integer, 'name': _text, 'details': _text},
+        key=('number',), required=('number', 'name'),
+    ),
+}
+
+CHECKPOINT_NAME = 'catalogue_import'
+# Workbooks sync() keeps imported; ground briefing topics are imported by hand
+SYNCED_SHEETS = ('training_topics', 'exercises')
+
+def default_path(sheet):
+    return os.path.join(settings.BASE_DIR, 'data', sheet.filename)
+
+def read_sheet(sheet, path):
+    """
+    The sheet's rows as dicts of converted values, for the columns the file has.
+    Raises CatalogueImportError listing every problem found.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_text(cell).strip() for cell in next(rows, ())]
+        missing = [column for column in sheet.required if column not in header]
+        if missing:
+            raise CatalogueImportError(f"{os.path.basename(path)}: missing column(s) {', '.join(missing)}")
+        indexes = {column: header.index(column) for column in sheet.columns if column in header}
+        columns = {column: [] for column in indexes}
+        row_numbers = []
+        for row_number, row in enumerate(rows, start=2):
+            if all(cell is None or _text(cell).strip() == '' for cell in row):
+                continue
+            row_numbers.append(row_number)
+            for column, index in indexes.items():
+                columns[column].append(row[index] if index < len(row) else None)
+    finally:
+        workbook.close()
+
+    errors = []
+    for column, values in columns.items():
+        if column in sheet.required:
+            errors += [
+                f'row {row_numbers[i]}: {column} is empty'
+                for i, value in enumerate(values) if value is None or _text(value).strip() == ''
+            ]
+        convert = sheet.columns[column]
+        converted = []
+        for i, value in enumerate(values):
+            try:
+                converted.append(convert(value))
+            except ValueError as e:
+                errors.append(f'row {row_numbers[i]}: {column} {e}')
+                converted.append(None)
+        columns[column] = converted
+
+    seen = set()
+    for row_number, key in zip(row_numbers, zip(*(columns[column] for column in sheet.key))):
+        if key in seen:
+            errors.append(f"row {row_number}: duplicate {'/'.join(sheet.key)} {'/'.join(map(str, key))}")
+        seen.add(key)
+    if errors:
+        raise CatalogueImportError(f'{os.path.basename(path)}: ' + '; '.join(errors))
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+@dataclass
+class Diff:
+    """What importing a sheet would change; existing rows not in the sheet are left alone"""
+    sheet: Sheet
+    created: list = field(default_factory=list)
+    # Rows also carry the primary key of the row they change
+    updated: list = field(default_factory=list)
+    changes: list = field(default_factory=list)
+    unchanged: int = 0
+    not_in_file: int = 0
+
+    def __bool__(self):
+        return bool(self.created or self.updated)
+
+    def summary(self):
+        return (
+            f'{self.sheet.model}: {len(self.created)} new, {len(self.updated)} changed, '
+            f'{self.unchanged} unchanged, {self.not_in_file} not in the file (kept)'
+        )
+
+def diff(sheet, rows):
+    """Compare imported rows with the database by natural key"""
+    model = sheet.get_model()
+    existing = {
+        tuple(values[1:len(sheet.key) + 1]): (values[0], dict(zip(sheet.columns, values[len(sheet.key) + 1:])))
+        for values in model.objects.values_list('pk', *sheet.key, *sheet.columns)
+    }
+    result = Diff(sheet)
+    for row in rows:
+        key = tuple(row[column] for column in sheet.key)
+        label = '/'.join(map(str, key))
+        if key not in existing:
+            result.created.append(row)
+            result.changes.append(f'+ {label}')
+            continue
+        pk, current = existing.pop(key)
+        changed = [column for column in row if column not in sheet.key and row[column] != current[column]]
+        if changed:
+            result.updated.append({**row, 'pk': pk})
+            result.changes += [f'~ {label} {column}: {current[column]!r} -> {row[column]!r}' for column in changed]
+        else:
+            result.unchanged += 1
+    result.not_in_file = len(existing)
+    return result
+
+def apply(diffs):
+    """Write the new and changed rows of each diff, one bulk upsert per table in one transaction"""
+    from . import catalogue
+
+    with transaction.atomic():
+        for result in diffs:
+            if not result:
+                continue
+            model = result.sheet.get_model()
+            rows = result.created + result.updated
+            update_fields = [
+                column for column in result.sheet.columns if column in rows[0] and column not in result.sheet.key
+            ]
+            model.objects.bulk_create(
+                [model(**row) for row in rows],
+                update_conflicts=True, unique_fields=['pk'], update_fields=update_fields,
+            )
+        # bulk_create sends no signals
+        if any(diffs):
+            catalogue.invalidate()
+
+def import_sheets(sheets_and_paths, dry_run=False):
+    """Read every sheet first, then write them together unless dry_run; returns the diffs"""
+    diffs = [diff(sheet, read_sheet(sheet, path)) for sheet, path in sheets_and_paths]
+    if not dry_run:
+        apply(diffs)
+    return diffs
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as workbook:
+        for block in iter(lambda: workbook.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+@dataclass
+class Sync:
+    """
+    What sync() found: unchanged workbooks, diffs it applied, and first-sync diffs of which
+    only the new rows were applied (baseline)
+    """
+    unchanged: list = field(default_factory=list)
+    applied: list = field(default_factory=list)
+    baseline: list = field(default_factory=list)
+
+def sync(dry_run=False, force=False):
+    """
+    Import the SYNCED_SHEETS workbooks whose checksum differs from the last sync (all of them
+    with force). The first sync of a table whose rows differ from the file adds the new rows
+    but leaves the differing ones: they may have been edited in the admin since they were
+    imported, so they are only overwritten once the file changes, or with force.
+    """
+    from ..models import JobCheckpoint
+
+    checkpoint = JobCheckpoint.load(CHECKPOINT_NAME)
+    stored = checkpoint.data.get('checksums', {})
+    result = Sync()
+    checksums = {}
+    for name in SYNCED_SHEETS:
+        sheet = SHEETS[name]
+        path = default_path(sheet)
+        if not os.path.exists(path):
+            continue
+        checksum = file_checksum(path)
+        if checksum == stored.get(name) and not force:
+            result.unchanged.append(name)
+        else:
+            checksums[name] = checksum
+    if not checksums:
+        return result
+
+    for name in checksums:
+        sheet = SHEETS[name]
+        sheet_diff = diff(sheet, read_sheet(sheet, default_path(sheet)))
+        if name not in stored and not force and sheet_diff.updated:
+            result.baseline.append(sheet_diff)
+        else:
+            result.applied.append(sheet_diff)
+    if not dry_run:
+        with transaction.atomic():
+            apply(result.applied + [replace(sheet_diff, updated=[]) for sheet_diff in result.baseline])
+            checkpoint.data = {'checksums': {**stored, **checksums}}
+            checkpoint.save()
+    return result
@@ -0,0 +1,187 @@
+# training_records/services/catalogue_snapshot.py
+"""
+Read-only snapshot file of the reference data catalogue.
+
+When CATALOGUE_SNAPSHOT_PATH is set (ideally a file on /dev/shm), the gunicorn
+master writes the catalogue there before forking the workers, and workers build
+their catalogue from the file instead of querying the database. What this saves
+is the queries: each worker still decodes every row into its own model
+instances and closes the mapping, so it holds its own copy as before. When the
+catalogue version changes, the first worker to notice writes a new file and
+atomically renames it into place; the others load it on their next version check.
+
+File layout (little-endian):
+
+    header    magic, catalogue version, section count, string blob offset/length
+    sections  one entry per section: name, row count, row size, rows offset
+    rows      fixed-width struct rows; strings are (offset, length) pairs
+    strings   UTF-8 blob shared by all sections
+"""
+import datetime
+import logging
+import mmap
+import os
+import struct
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GCCAT001'
+HEADER = struct.Struct('<8sQI4xQQ')
+SECTION = struct.Struct('<24sIIQ')
+
+# Stand-in for NULL in nullable integer columns
+NULL_INT = -2 ** 63
+
+# Struct format for each column type
+COLUMN_FORMATS = {
+    'int': 'q',
+    'nullable_int': 'q',
+    'bool': '?',
+    'date': 'i',  # proleptic ordinal, 0 for NULL
+    'str': 'II',  # offset and length in the string blob
+}
+
+# Catalogue attribute -> (model, columns). Only these columns are loaded;
+# any other field is deferred and fetched from the database if accessed.
+SECTIONS = {
+    'exercises': ('Exercise', (
+        ('id', 'int'), ('name', 'str'), ('description', 'str'), ('category', 'str'),
+        ('number', 'str'), ('is_required', 'bool'),
+    )),
+    'training_topics': ('TrainingTopic', (
+        ('id', 'int'), ('name', 'str'), ('description', 'str'), ('category', 'str'),
+        ('required_for_certification', 'bool'),
+    )),
+    'gliders': ('Glider', (
+        ('id', 'int'), ('tail_number', 'str'), ('model', 'str'), ('manufacturer', 'str'),
+        ('year', 'nullable_int'), ('is_active', 'bool'),
+    )),
+    'briefing_topics': ('GroundBriefingTopic', (
+        ('id', 'int'), ('number', 'int'), ('name', 'str'), ('details', 'str'),
+    )),
+    'instructors': ('User', (
+        ('id', 'int'), ('username', 'str'), ('first_name', 'str'), ('last_name', 'str'),
+        ('email', 'str'), ('user_type', 'str'), ('is_active', 'bool'),
+        ('instructor_license_number', 'str'), ('license_expiration_date', 'date'),
+    )),
+}
+
+def _row_struct(columns):
+    return struct.Struct('<' + ''.join(COLUMN_FORMATS[kind] for _, kind in columns))
+
+def _encode_row(obj, columns, strings):
+    values = []
+    for field, kind in columns:
+        value = getattr(obj, field)
+        if kind == 'str':
+            encoded = (value or '').encode('utf-8')
+            values.extend((len(strings), len(encoded)))
+            strings.extend(encoded)
+        elif kind == 'nullable_int':
+            values.append(NULL_INT if value is None else value)
+        elif kind == 'date':
+            values.append(value.toordinal() if value else 0)
+        else:
+            values.append(value)
+    return values
+
+def _decode_row(raw, columns, strings):
+    values = []
+    index = 0
+    for _, kind in columns:
+        if kind == 'str':
+            offset, length = raw[index], raw[index + 1]
+            values.append(str(strings[offset:offset + length], 'utf-8'))
+            index += 2
+            continue
+        value = raw[index]
+        if kind == 'nullable_int' and value == NULL_INT:
+            value = None
+        elif kind == 'date':
+            value = datetime.date.fromordinal(value) if value else None
+        values.append(value)
+        index += 1
+    return values
+
+def write(path, catalogue):
+    """Serialise a catalogue to path, replacing any previous snapshot atomically"""
+    strings = bytearray()
+    sections = []
+    for name, (_, columns) in SECTIONS.items():
+        row_struct = _row_struct(columns)
+        rows = b''.join(
+            row_struct.pack(*_encode_row(obj, columns, strings))
+            for obj in getattr(catalogue, name)
+        )
+        sections.append((name, len(getattr(catalogue, name)), row_struct.size, rows))
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    section_table = []
+    for name, count, size, rows in sections:
+        section_table.append(SECTION.pack(name.encode(), count, size, offset))
+        offset += len(rows)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as snapshot:
+        snapshot.write(HEADER.pack(MAGIC, catalogue.version, len(sections), offset, len(strings)))
+        snapshot.writelines(section_table)
+        snapshot.writelines(rows for _, _, _, rows in sections)
+        snapshot.write(strings)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote catalogue snapshot version {catalogue.version} to {path} ({offset + len(strings)} bytes)")
+
+def read_version(path):
+    """Catalogue version stored in the snapshot at path, or None if there is no usable snapshot"""
+    try:
+        with open(path, 'rb') as snapshot:
+            magic, version, *_ = HEADER.unpack(snapshot.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return version if magic == MAGIC else None
+
+def load(path, version):
+    """
+    Map the snapshot at path and build a Catalogue from it.
+    Returns None if the file is missing or holds a different version.
+    """
+    from .catalogue import Catalogue
+
+    try:
+        with open(path, 'rb') as snapshot:
+            mapping = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    with mapping:
+        magic, stored_version, section_count, strings_offset, strings_length = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC or stored_version != version:
+            return None
+
+        view = memoryview(mapping)
+        try:
+            strings = view[strings_offset:strings_offset + strings_length]
+            objects = {}
+            for i in range(section_count):
+                raw_name, count, size, rows_offset = SECTION.unpack_from(mapping, HEADER.size + i * SECTION.size)
+                name = raw_name.rstrip(b'\0').decode()
+                if name not in SECTIONS:
+                    continue
+                model_name, columns = SECTIONS[name]
+                model = apps.get_model('training_records', model_name)
+                row_struct = _row_struct(columns)
+                # from_db() takes values in the model's field order
+                columns_by_field = [field for field, _ in columns]
+                field_names = [f.attname for f in model._meta.concrete_fields if f.attname in columns_by_field]
+                order = [columns_by_field.index(field) for field in field_names]
+                objects[name] = []
+                for row in range(count):
+                    values = _decode_row(row_struct.unpack_from(view, rows_offset + row * size), columns, strings)
+                    objects[name].append(model.from_db(DEFAULT_DB_ALIAS, field_names, [values[i] for i in order]))
+            del strings
+        finally:
+            view.release()
+
+    return Catalogue(version=version, **objects)
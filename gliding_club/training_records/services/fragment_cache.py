@@ -0,0 +1,158 @@
+# training_records/services/fragment_cache.py
+"""
+Cache for rendered template fragments (dashboards, student history, record lists).
+
+Fragments are stored in the 'fragments' cache (file or database backend, shared by
+all workers) under a key built from the viewer, the active language, the reference
+data catalogue version and the version counters the fragment depends on:
+
+    student:<id>       that student's records, exercise performances, briefings and profile
+    instructor:<id>    records and briefings with that instructor
+    training_records   any training record (lists that show every record)
+    students           any student's profile (names shown on instructor pages)
+
+Model signals bump the counters, so a changed fragment simply gets a new key and
+stale entries expire on their own. When a fragment is missing, only one process
+renders it; concurrent requests wait briefly for that result instead of all
+running the same queries at once.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save, pre_save
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'fragments'
+ALL_RECORDS = 'training_records'
+ALL_STUDENTS = 'students'
+
+# User fields written by sign-ins and password changes, which change nothing displayed
+SIGN_IN_FIELDS = frozenset({'last_login', 'password', 'password_change_required'})
+
+# Single-flight: how long a render may hold the lock, and how long others wait for it
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 2.0
+POLL_INTERVAL = 0.05
+
+def student_counter(student_id):
+    return f'student:{student_id}'
+
+def instructor_counter(instructor_id):
+    return f'instructor:{instructor_id}'
+
+def is_enabled():
+    return getattr(settings, 'FRAGMENT_CACHE_BACKEND', 'off') != 'off'
+
+def make_key(name, parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'fragment:{name}:{digest}'
+
+def get_or_render(key, render):
+    """Return the cached fragment for key, rendering and storing it once if it is missing"""
+    cache = caches[CACHE_ALIAS]
+    lock_key = f'{key}:lock'
+    # Only the cache calls are guarded; an error from render() is the page's own
+    try:
+        html = cache.get(key)
+        if html is not None:
+            return html
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+        if not locked:
+            # Someone else is rendering this fragment; use their result if it arrives in time
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                html = cache.get(key)
+                if html is not None:
+                    return html
+    except Exception as e:
+        # A broken cache must never break the page
+        logger.warning(f"Fragment cache unavailable: {e}")
+        locked = False
+    if not locked:
+        return render()
+
+    try:
+        html = render()
+        try:
+            cache.set(key, html)
+        except Exception as e:
+            # The page is rendered; it just is not cached this time (e.g. a full disk)
+            logger.warning(f"Could not store fragment {key}: {e}")
+        return html
+    finally:
+        try:
+            cache.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Could not release fragment lock {lock_key}: {e}")
+
+def bump(names):
+    from ..models import CacheVersion
+    CacheVersion.bump_many(names)
+
+def _record_owners(instance):
+    """Counters for a record's student and instructor, including the ones it had before this save"""
+    owners = getattr(instance, '_fragment_owners', set())
+    owners |= {(instance.student_id, instance.instructor_id)}
+    return [
+        counter
+        for student_id, instructor_id in owners
+        for counter in (student_counter(student_id), instructor_counter(instructor_id))
+    ]
+
+def _remember_record_owners(sender, instance, raw=False, **kwargs):
+    # A record moved to another student or instructor must invalidate the old owner's pages too
+    if raw or instance.pk is None:
+        return
+    dirty = instance.get_dirty_fields()
+    if dirty is not None:
+        previous = (dirty.get('student_id', instance.student_id), dirty.get('instructor_id', instance.instructor_id))
+    else:
+        previous = sender._default_manager.filter(pk=instance.pk).values_list('student_id', 'instructor_id').first()
+    instance._fragment_owners = {previous} if previous else set()
+
+def _training_record_changed(sender, instance, **kwargs):
+    bump(_record_owners(instance) + [ALL_RECORDS])
+    instance._fragment_owners = set()
+
+def _performance_changed(sender, instance, **kwargs):
+    if sender.training_record.is_cached(instance):
+        record = instance.training_record
+        owners = (record.student_id, record.instructor_id)
+    else:
+        owners = sender.training_record.field.related_model._default_manager.filter(
+            pk=instance.training_record_id
+        ).values_list('student_id', 'instructor_id').first()
+    if owners:
+        bump([student_counter(owners[0]), instructor_counter(owners[1]), ALL_RECORDS])
+
+def _ground_briefing_changed(sender, instance, **kwargs):
+    bump(_record_owners(instance))
+    instance._fragment_owners = set()
+
+def _student_changed(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= SIGN_IN_FIELDS:
+        return
+    if instance.user_type == 'student':
+        bump([student_counter(instance.pk), ALL_STUDENTS])
+
+def connect_signals():
+    """Bump the fragment version counters whenever the data they cover is saved or deleted"""
+    for model, handler in (
+        ('TrainingRecord', _training_record_changed),
+        ('ExercisePerformance', _performance_changed),
+        ('GroundBriefing', _ground_briefing_changed),
+        ('User', _student_changed),
+    ):
+        sender = f'training_records.{model}'
+        post_save.connect(handler, sender=sender, dispatch_uid=f'fragment_save_{model}')
+        post_delete.connect(handler, sender=sender, dispatch_uid=f'fragment_delete_{model}')
+    for model in ('TrainingRecord', 'GroundBriefing'):
+        pre_save.connect(
+            _remember_record_owners, sender=f'training_records.{model}', dispatch_uid=f'fragment_owners_{model}'
+        )
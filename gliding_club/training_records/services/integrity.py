@@ -0,0 +1,168 @@
+# training_records/services/integrity.py
+"""
+Consistency checks run by check_integrity.
+
+Each check walks one table in keyset chunks (see batching) and looks only at the rows
+of the current chunk and what they reference, so memory stays constant however large
+the table. repair() fixes one chunk's problems with a few batched statements; the
+command runs it in the same transaction that records how far the scan got.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.utils import timezone
+
+from . import fragment_cache
+
+@dataclass
+class Problem:
+    pk: int
+    description: str
+    data: dict = field(default_factory=dict)
+
+def _bump_owners(problems):
+    """Scanned rows were changed without signals, so their owners' fragments are invalidated here"""
+    counters = {fragment_cache.ALL_RECORDS}
+    for problem in problems:
+        counters.add(fragment_cache.student_counter(problem.data['student_id']))
+        if problem.data.get('instructor_id'):
+            counters.add(fragment_cache.instructor_counter(problem.data['instructor_id']))
+    fragment_cache.bump(sorted(counters))
+
+class ExercisePerformanceCheck:
+    """Every training record has exactly one performance for every exercise"""
+    name = 'exercise_performances'
+    description = 'training records with missing or duplicate exercise performances'
+    fields = ('student_id', 'instructor_id')
+
+    def __init__(self):
+        self.exercise_ids = None
+
+    def queryset(self):
+        from ..models import TrainingRecord
+        return TrainingRecord.objects.all()
+
+    def find(self, rows):
+        from ..models import Exercise, ExercisePerformance
+
+        if self.exercise_ids is None:
+            self.exercise_ids = sorted(Exercise.objects.values_list('pk', flat=True))
+        performances = defaultdict(lambda: defaultdict(list))
+        for pk, record_id, exercise_id in ExercisePerformance.objects.filter(
+            training_record_id__in=[row[0] for row in rows],
+        ).order_by('pk').values_list('pk', 'training_record_id', 'exercise_id'):
+            performances[record_id][exercise_id].append(pk)
+
+        problems = []
+        for record_id, student_id, instructor_id in rows:
+            by_exercise = performances.get(record_id, {})
+            missing = [exercise_id for exercise_id in self.exercise_ids if exercise_id not in by_exercise]
+            # The oldest performance of an exercise is kept
+            duplicates = [pk for pks in by_exercise.values() for pk in pks[1:]]
+            if not missing and not duplicates:
+                continue
+            details = []
+            if missing:
+                details.append(f"no performance for exercise(s) {', '.join(map(str, missing))}")
+            if duplicates:
+                details.append(f"duplicate performance(s) {', '.join(map(str, duplicates))}")
+            problems.append(Problem(record_id, f"training record {record_id}: {'; '.join(details)}", {
+                'student_id': student_id, 'instructor_id': instructor_id,
+                'missing': missing, 'duplicates': duplicates,
+            }))
+        return problems
+
+    def repair(self, problems):
+        """Add the missing performances as migration 0008 did, and delete the duplicates"""
+        from ..models import ExercisePerformance, TrainingRecord
+
+        missing = [(problem.pk, exercise_id) for problem in problems for exercise_id in problem.data['missing']]
+        if missing:
+            flown = set(TrainingRecord.exercises.through.objects.filter(
+                trainingrecord_id__in={record_id for record_id, _ in missing},
+            ).values_list('trainingrecord_id', 'exercise_id'))
+            ExercisePerformance.objects.bulk_create([
+                ExercisePerformance(
+                    training_record_id=record_id, exercise_id=exercise_id,
+                    performance='performed_well' if (record_id, exercise_id) in flown else 'not_performed',
+                )
+                for record_id, exercise_id in missing
+            ], ignore_conflicts=True)
+        duplicates = [pk for problem in problems for pk in problem.data['duplicates']]
+        if duplicates:
+            ExercisePerformance.objects.filter(pk__in=duplicates).delete()
+        _bump_owners(problems)
+
+class BriefingSignOffCheck:
+    """A signed-off ground briefing names the instructor who signed it"""
+    name = 'briefing_sign_offs'
+    description = 'ground briefings signed off without an instructor'
+    fields = ('student_id', 'topic_id')
+
+    def queryset(self):
+        from ..models import GroundBriefing
+        return GroundBriefing.objects.filter(signed_off=True, instructor__isnull=True)
+
+    def find(self, rows):
+        return [
+            Problem(pk, f'ground briefing {pk} (student {student_id}, topic {topic_id}) has no instructor', {
+                'student_id': student_id,
+            })
+            for pk, student_id, topic_id in rows
+        ]
+
+    def repair(self, problems):
+        """Reopen the briefings, so an instructor signs them off again"""
+        from ..models import GroundBriefing
+
+        GroundBriefing.objects.filter(
+            pk__in=[problem.pk for problem in problems], signed_off=True, instructor__isnull=True,
+        ).update(signed_off=False, sign_off_date=None, updated_at=timezone.now())
+        _bump_owners(problems)
+
+class NotificationTargetCheck:
+    """A notification about a training record or briefing still has that row to show"""
+    name = 'notification_targets'
+    description = 'notifications whose training record or ground briefing is missing'
+    fields = ('notification_type', 'training_record_id', 'ground_briefing_id')
+    # The row each notification type is about; the weekly digest is about no single row
+    TARGETS = {
+        'student_revision_needed': 'training record',
+        'student_records_signed_off': 'training record',
+        'student_briefing_signed_off': 'ground briefing',
+    }
+
+    def queryset(self):
+        from ..models import PendingNotification
+        return PendingNotification.objects.all()
+
+    def find(self, rows):
+        from ..models import GroundBriefing, TrainingRecord
+
+        records = set(TrainingRecord.objects.filter(
+            pk__in={row[2] for row in rows if row[2]},
+        ).values_list('pk', flat=True))
+        briefings = set(GroundBriefing.objects.filter(
+            pk__in={row[3] for row in rows if row[3]},
+        ).values_list('pk', flat=True))
+
+        problems = []
+        for pk, notification_type, record_id, briefing_id in rows:
+            target = self.TARGETS.get(notification_type)
+            if record_id and record_id not in records:
+                detail = f'points at deleted training record {record_id}'
+            elif briefing_id and briefing_id not in briefings:
+                detail = f'points at deleted ground briefing {briefing_id}'
+            elif (target == 'training record' and not record_id) or (target == 'ground briefing' and not briefing_id):
+                detail = f'has no {target}'
+            else:
+                continue
+            problems.append(Problem(pk, f'{notification_type} notification {pk} {detail}'))
+        return problems
+
+    def repair(self, problems):
+        """Delete the notifications; there is nothing left for them to send"""
+        from ..models import PendingNotification
+        PendingNotification.objects.filter(pk__in=[problem.pk for problem in problems]).delete()
+
+CHECKS = {check.name: check for check in (ExercisePerformanceCheck, BriefingSignOffCheck, NotificationTargetCheck)}
@@ -0,0 +1,182 @@
+# training_records/services/ledger.py
+"""
+Per-student signature ledger.
+
+Every sign-off (and every amendment of a signed record) appends an entry holding the
+record's signature hash and the hash of the previous entry. After every
+CHECKPOINT_INTERVAL entries the chain hash is stored as a checkpoint. Each entry hash
+covers the whole history before it, so:
+
+- a range of a logbook is verified by recomputing the chain from the checkpoint before
+  the range to the checkpoint after it, at most CHECKPOINT_INTERVAL entries beyond
+  the range itself;
+- an export carries the entry hashes, so a reader holding a checkpoint from an earlier
+  export can confirm offline, with one comparison, that nothing before it was rewritten.
+"""
+import logging
+from dataclasses import dataclass, field
+
+from . import signatures
+
+logger = logging.getLogger(__name__)
+
+SIGN_OFF = 'sign_off'
+AMENDMENT = 'amendment'
+CHECKPOINT_INTERVAL = 32
+
+def append(records, kind=SIGN_OFF):
+    """
+    Chain ledger entries for signed records, in the given order. Must run inside the
+    transaction that signed them; the students are locked so their sequences stay gapless.
+    """
+    from ..models import SignatureCheckpoint, SignatureLedgerEntry, User
+
+    records = [record for record in records if record.signed_off]
+    if not records:
+        return []
+    student_ids = sorted({record.student_id for record in records})
+    # Lock in a fixed order so concurrent sign-offs for overlapping students cannot deadlock
+    list(User.objects.select_for_update().filter(pk__in=student_ids).order_by('pk').values_list('pk'))
+    heads = {
+        student_id: (sequence, entry_hash)
+        for student_id, sequence, entry_hash in SignatureLedgerEntry.objects.filter(
+            student_id__in=student_ids,
+        ).order_by('student_id', '-sequence').distinct('student_id').values_list(
+            'student_id', 'sequence', 'entry_hash',
+        )
+    }
+
+    entries = []
+    checkpoints = []
+    for record in records:
+        sequence, previous_hash = heads.get(record.student_id, (0, signatures.LEDGER_GENESIS))
+        sequence += 1
+        entry_hash = signatures.ledger_entry_hash(
+            previous_hash, record.student_id, sequence, record.pk, kind, record.signature_hash,
+        )
+        entries.append(SignatureLedgerEntry(
+            student_id=record.student_id, sequence=sequence, record_id=record.pk, kind=kind,
+            signature_hash=record.signature_hash, previous_hash=previous_hash, entry_hash=entry_hash,
+            signed_values=signatures.signed_values(record),
+        ))
+        if sequence % CHECKPOINT_INTERVAL == 0:
+            checkpoints.append(SignatureCheckpoint(
+                student_id=record.student_id, sequence=sequence, entry_hash=entry_hash,
+            ))
+        heads[record.student_id] = (sequence, entry_hash)
+
+    SignatureLedgerEntry.objects.bulk_create(entries, batch_size=500)
+    SignatureCheckpoint.objects.bulk_create(checkpoints)
+    return entries
+
+def head(student_id):
+    """The student's latest ledger entry, or None"""
+    from ..models import SignatureLedgerEntry
+    return SignatureLedgerEntry.objects.filter(student_id=student_id).order_by('-sequence').first()
+
+def latest_checkpoint(student_id):
+    """The student's latest checkpoint, or None"""
+    from ..models import SignatureCheckpoint
+    return SignatureCheckpoint.objects.filter(student_id=student_id).order_by('-sequence').first()
+
+def latest_entries(student_id):
+    """The latest ledger entry of each of the student's records, keyed by record id"""
+    from ..models import SignatureLedgerEntry
+    return {
+        entry.record_id: entry
+        for entry in SignatureLedgerEntry.objects.filter(student_id=student_id).order_by('sequence')
+    }
+
+@dataclass
+class Verification:
+    student_id: int
+    first: int
+    last: int
+    entries_checked: int = 0
+    problems: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return not self.problems
+
+def verify(student_id, first=1, last=None):
+    """
+    Verify ledger entries first..last (default: to the head) of one student, and that the
+    records those entries sign still carry that signature and still hash to it.
+    Only the entries between the surrounding checkpoints are read.
+    """
+    from ..models import SignatureCheckpoint, SignatureLedgerEntry, TrainingRecord
+
+    checkpoints = dict(
+        SignatureCheckpoint.objects.filter(student_id=student_id).values_list('sequence', 'entry_hash')
+    )
+    first = max(first, 1)
+    # Start from the last checkpoint before the range, stop at the first one at or after it
+    start = max((sequence for sequence in checkpoints if sequence < first), default=0)
+    stop = None
+    if last is not None:
+        stop = min((sequence for sequence in checkpoints if sequence >= last), default=None)
+
+    entries = SignatureLedgerEntry.objects.filter(student_id=student_id, sequence__gt=start)
+    if stop is not None:
+        entries = entries.filter(sequence__lte=stop)
+    entries = list(entries.order_by('sequence'))
+    if last is None:
+        last = entries[-1].sequence if entries else start
+
+    result = Verification(student_id=student_id, first=first, last=last)
+    previous_hash = checkpoints[start] if start else signatures.LEDGER_GENESIS
+    expected_sequence = start + 1
+    in_range = []
+    for entry in entries:
+        result.entries_checked += 1
+        if entry.sequence != expected_sequence:
+            result.problems.append(f'entry #{expected_sequence} is missing')
+        expected_sequence = entry.sequence + 1
+        computed = signatures.ledger_entry_hash(
+            previous_hash, student_id, entry.sequence, entry.record_id, entry.kind, entry.signature_hash,
+        )
+        if entry.previous_hash != previous_hash or entry.entry_hash != computed:
+            result.problems.append(f'entry #{entry.sequence} does not chain to the entry before it')
+        if entry.sequence in checkpoints and checkpoints[entry.sequence] != computed:
+            result.problems.append(f'entry #{entry.sequence} does not match its checkpoint')
+        previous_hash = computed
+        if first <= entry.sequence <= last:
+            in_range.append(entry)
+
+    # Only the latest entry of each record describes its current signature
+    latest = {}
+    for entry in in_range:
+        latest[entry.record_id] = entry
+    superseded = set(SignatureLedgerEntry.objects.filter(
+        student_id=student_id, record_id__in=latest, sequence__gt=last,
+    ).values_list('record_id', flat=True)) if latest else set()
+    records = TrainingRecord.objects.in_bulk([pk for pk in latest if pk not in superseded])
+    for record_id, entry in latest.items():
+        if record_id in superseded:
+            continue
+        record = records.get(record_id)
+        if record is None:
+            result.problems.append(f'record {record_id} (entry #{entry.sequence}) was deleted')
+        elif record.signature_hash != entry.signature_hash:
+            result.problems.append(f'record {record_id} signature differs from entry #{entry.sequence}')
+        elif record.compute_signature_hash() != record.signature_hash:
+            result.problems.append(f'record {record_id} was changed after entry #{entry.sequence}')
+    return result
+
+def backfill():
+    """Append ledger entries for signed records that have none, in sign-off order; returns how many"""
+    from django.db import transaction
+    from ..models import SignatureLedgerEntry, TrainingRecord
+
+    missing = TrainingRecord.objects.filter(signed_off=True).exclude(
+        pk__in=SignatureLedgerEntry.objects.values('record_id'),
+    ).order_by('student_id', 'sign_off_timestamp', 'pk')
+    student_ids = list(missing.values_list('student_id', flat=True).distinct().order_by('student_id'))
+    added = 0
+    for student_id in student_ids:
+        # One transaction per student keeps locks short on large logbooks
+        with transaction.atomic():
+            added += len(append(list(missing.filter(student_id=student_id))))
+    logger.info(f'Backfilled {added} signature ledger entries for {len(student_ids)} students')
+    return added
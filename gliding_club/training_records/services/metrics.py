@@ -0,0 +1,243 @@
+# training_records/services/metrics.py
+"""
+Prometheus metrics for the Gliding Club Training Records system.
+
+In multi-process gunicorn mode set PROMETHEUS_MULTIPROC_DIR to a shared,
+writable directory before the workers start. Every worker then writes its
+samples to mmap'd files in that directory and /metrics aggregates them, so a
+scrape sees one consistent view no matter which worker answers it.
+"""
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+logger = logging.getLogger(__name__)
+
+# Label used when a request did not resolve to a named URL (404s, static files).
+# Keeps label cardinality bounded instead of recording raw paths.
+UNMATCHED_URL_NAME = 'unmatched'
+
+# Export formats recorded as they are; anything else a client asks for is counted as
+# OTHER_EXPORT_FORMAT, for the same reason
+EXPORT_FORMATS = frozenset({'csv', 'matrix', 'pdf', 'instructor_csv', 'instructor_pdf'})
+OTHER_EXPORT_FORMAT = 'other'
+
+REQUEST_COUNT = Counter(
+    'http_requests_total',
+    'Total HTTP requests by URL name, method and status',
+    ['url_name', 'method', 'status'],
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by URL name and status',
+    ['url_name', 'status'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Number of database queries issued per request',
+    ['url_name'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+EXPORT_DURATION = Histogram(
+    'export_duration_seconds',
+    'Time spent generating record exports',
+    ['format'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+
+# Exports run synchronously inside the request, so the queue depth is the
+# number of exports currently being generated across all workers.
+EXPORT_QUEUE_DEPTH = Gauge(
+    'export_jobs_in_progress',
+    'Exports currently being generated',
+    ['format'],
+    multiprocess_mode='livesum',
+)
+
+OUTBOX_BACKLOG = Gauge(
+    'notification_outbox_backlog',
+    'Pending notifications that have not been sent yet',
+    multiprocess_mode='mostrecent',
+)
+
+EMAILS_SENT = Counter(
+    'emails_sent_total',
+    'Notification emails by type and result',
+    ['notification_type', 'result'],
+)
+
+WORKER_RSS = Gauge(
+    'worker_resident_memory_bytes',
+    'Resident memory of each worker process',
+    multiprocess_mode='liveall',
+)
+
+DB_POOL_CONNECTIONS_IN_USE = Gauge(
+    'db_pool_connections_in_use',
+    'Pooled database connections currently checked out, per worker',
+    ['alias'],
+    multiprocess_mode='liveall',
+)
+
+DB_POOL_CONNECTIONS_IDLE = Gauge(
+    'db_pool_connections_idle',
+    'Pooled database connections available for checkout, per worker',
+    ['alias'],
+    multiprocess_mode='liveall',
+)
+
+DB_POOL_REQUESTS_WAITING = Gauge(
+    'db_pool_requests_waiting',
+    'Requests currently waiting for a pooled database connection, per worker',
+    ['alias'],
+    multiprocess_mode='liveall',
+)
+
+DB_POOL_WAIT_SECONDS = Gauge(
+    'db_pool_wait_seconds_total',
+    'Cumulative time spent waiting for a pooled database connection, per worker',
+    ['alias'],
+    multiprocess_mode='liveall',
+)
+
+
+class QueryCounter:
+    """Database execute wrapper that counts the queries run through it"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def get_url_name(request):
+    """Return the resolved URL name (including namespace) for a request"""
+    match = getattr(request, 'resolver_match', None)
+    if match and match.view_name:
+        return match.view_name
+    return UNMATCHED_URL_NAME
+
+
+def current_rss_bytes():
+    """Resident set size of the current process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Not on Linux - fall back to the peak RSS reported by the kernel
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_db_pool_stats(alias=DEFAULT_DB_ALIAS):
+    """
+    Statistics of this worker's connection pool for a database alias,
+    or None when the alias is not configured with a pool.
+    """
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+
+    stats = pool.get_stats()
+    return {
+        'min_size': stats.get('pool_min', 0),
+        'max_size': stats.get('pool_max', 0),
+        'size': stats.get('pool_size', 0),
+        'in_use': stats.get('pool_size', 0) - stats.get('pool_available', 0),
+        'idle': stats.get('pool_available', 0),
+        'waiting': stats.get('requests_waiting', 0),
+        'wait_ms_total': stats.get('requests_wait_ms', 0),
+        'requests_total': stats.get('requests_num', 0),
+        'requests_errors': stats.get('requests_errors', 0),
+    }
+
+
+def update_db_pool_gauges():
+    """Copy this worker's connection pool statistics into the pool gauges"""
+    for alias in connections:
+        stats = get_db_pool_stats(alias)
+        if stats is None:
+            continue
+        DB_POOL_CONNECTIONS_IN_USE.labels(alias=alias).set(stats['in_use'])
+        DB_POOL_CONNECTIONS_IDLE.labels(alias=alias).set(stats['idle'])
+        DB_POOL_REQUESTS_WAITING.labels(alias=alias).set(stats['waiting'])
+        DB_POOL_WAIT_SECONDS.labels(alias=alias).set(stats['wait_ms_total'] / 1000)
+
+
+def observe_request(request, response, duration, query_count):
+    """Record the metrics for a single completed request"""
+    url_name = get_url_name(request)
+    status = str(response.status_code)
+
+    REQUEST_COUNT.labels(url_name=url_name, method=request.method, status=status).inc()
+    REQUEST_LATENCY.labels(url_name=url_name, status=status).observe(duration)
+    REQUEST_DB_QUERIES.labels(url_name=url_name).observe(query_count)
+    WORKER_RSS.set(current_rss_bytes())
+    update_db_pool_gauges()
+
+
+@contextmanager
+def track_export(format_type):
+    """Count an export as in progress and record how long it took"""
+    format_type = (format_type or '').lower()
+    if format_type not in EXPORT_FORMATS:
+        format_type = OTHER_EXPORT_FORMAT
+    EXPORT_QUEUE_DEPTH.labels(format=format_type).inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        EXPORT_DURATION.labels(format=format_type).observe(time.perf_counter() - start)
+        EXPORT_QUEUE_DEPTH.labels(format=format_type).dec()
+
+
+def record_email(notification_type, success):
+    """Count a notification email send attempt"""
+    EMAILS_SENT.labels(
+        notification_type=notification_type,
+        result='success' if success else 'failure',
+    ).inc()
+
+
+def refresh_scrape_gauges():
+    """Update gauges that are sampled at scrape time rather than per request"""
+    from django.apps import apps
+    PendingNotification = apps.get_model('training_records', 'PendingNotification')
+
+    try:
+        OUTBOX_BACKLOG.set(PendingNotification.objects.filter(is_sent=False).count())
+    except Exception as e:
+        logger.warning(f"Could not sample notification outbox backlog: {e}")
+
+    WORKER_RSS.set(current_rss_bytes())
+    update_db_pool_gauges()
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Aggregate the per-worker mmap files into a fresh registry
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -5,6 +5,7 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from . import metrics
 
 # Get the User model
 User = get_user_model()
@@ -73,6 +74,8 @@ class NotificationService:
                 fail_silently=False,
             )
             
+            metrics.record_email('student_revision_needed', success=True)
+            
             # Mark as sent
             notification.sent_at = timezone.now()
             notification.is_sent = True
@@ -83,6 +86,7 @@ class NotificationService:
             
         except Exception as e:
             logger.error(f'Failed to send revision notification for record {training_record.pk}: {e}', exc_info=True)
+            metrics.record_email('student_revision_needed', success=False)
             
             # Determine error type for better user messaging
             error_msg = str(e).lower()
@@ -119,28 +123,28 @@ class NotificationService:
                 continue
                 
             # Get unsigned records assigned to this instructor
-            pending_records = TrainingRecord.objects.filter(
+            pending_records = list(TrainingRecord.objects.filter(
                 instructor=instructor,
                 signed_off=False
-            ).order_by('-date')
+            ).for_digest().order_by('-date'))
             
-            if pending_records.exists():
-                logger.info(f'Sending weekly digest to {instructor.email} - {pending_records.count()} pending records')
+            if pending_records:
+                logger.info(f'Sending weekly digest to {instructor.email} - {len(pending_records)} pending records')
                 
                 try:
-                    subject = f"Weekly Digest - {pending_records.count()} Records Awaiting Sign-Off"
+                    subject = f"Weekly Digest - {len(pending_records)} Records Awaiting Sign-Off"
                     
                     html_message = render_to_string('training_records/emails/weekly_digest.html', {
                         'instructor': instructor,
                         'pending_records': pending_records,
-                        'count': pending_records.count(),
+                        'count': len(pending_records),
                         'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
                     })
                     
                     plain_message = render_to_string('training_records/emails/weekly_digest.txt', {
                         'instructor': instructor,
                         'pending_records': pending_records,
-                        'count': pending_records.count(),
+                        'count': len(pending_records),
                         'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
                     })
                     
@@ -154,11 +158,13 @@ class NotificationService:
                     )
                     
                     sent_count += 1
+                    metrics.record_email('instructor_weekly_digest', success=True)
                     logger.info(f'Successfully sent weekly digest to {instructor.email}')
                     time.sleep(0.1) # Throttle to avoid hitting email provider limits
 
                 except Exception as e:
                     error_count += 1
+                    metrics.record_email('instructor_weekly_digest', success=False)
                     logger.error(f'Failed to send weekly digest to {instructor.email}: {e}', exc_info=True)
                     time.sleep(0.1) # Throttle on error as well
             else:
@@ -171,4 +177,139 @@ class NotificationService:
             'error_count': error_count,
             'skipped_count': skipped_count,
             'total_instructors': instructors.count()
-        }
\ No newline at end of file
+        }    
+    @staticmethod
+    def send_sign_off_notifications():
+        """Email each student the records an instructor signed off from the sign-off queue"""
+        
+        # Import inside function to avoid circular imports
+        from django.apps import apps
+        PendingNotification = apps.get_model('training_records', 'PendingNotification')
+        TrainingRecord = apps.get_model('training_records', 'TrainingRecord')
+        
+        notifications = list(PendingNotification.objects.filter(
+            notification_type='student_records_signed_off', is_sent=False,
+        ).select_related('user', 'training_record'))
+        sent_count = 0
+        error_count = 0
+        skipped_count = 0
+        
+        # Each notification points at one record of its batch; the batch shares the student,
+        # instructor and sign-off timestamp, so all batches load in one query
+        batches = {}
+        for record in TrainingRecord.objects.filter(
+            student__in={n.user_id for n in notifications},
+            sign_off_timestamp__in={n.training_record.sign_off_timestamp for n in notifications if n.training_record},
+            signed_off=True,
+        ).for_digest().order_by('date', 'created_at'):
+            batches.setdefault((record.student_id, record.instructor_id, record.sign_off_timestamp), []).append(record)
+        
+        for notification in notifications:
+            student = notification.user
+            first = notification.training_record
+            records = batches.get((student.id, first.instructor_id, first.sign_off_timestamp), []) if first else []
+            
+            if not records or not student.email or student.email.strip() == '':
+                # Nothing left to report (record deleted) or nowhere to send it
+                logger.warning(f'Skipping sign-off notification {notification.pk} for student {student.pk}')
+                notification.is_sent = True
+                notification.save(update_fields=['is_sent'])
+                skipped_count += 1
+                continue
+            
+            context = {
+                'student': student,
+                'instructor': records[0].instructor,
+                'records': records,
+                'count': len(records),
+                'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
+            }
+            try:
+                send_mail(
+                    subject=f"{len(records)} Training Record{'s' if len(records) != 1 else ''} Signed Off",
+                    message=render_to_string('training_records/emails/records_signed_off.txt', context),
+                    html_message=render_to_string('training_records/emails/records_signed_off.html', context),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipient_list=[student.email],
+                    fail_silently=False,
+                )
+                metrics.record_email('student_records_signed_off', success=True)
+                notification.sent_at = timezone.now()
+                notification.is_sent = True
+                notification.save(update_fields=['sent_at', 'is_sent'])
+                sent_count += 1
+            except Exception as e:
+                # Left unsent, so the next run retries it
+                error_count += 1
+                metrics.record_email('student_records_signed_off', success=False)
+                logger.error(f'Failed to send sign-off notification to {student.email}: {e}', exc_info=True)
+            time.sleep(0.1) # Throttle to avoid hitting email provider limits
+        
+        logger.info(f'Sign-off notifications sent: {sent_count}, errors: {error_count}, skipped: {skipped_count}')
+        
+        return {
+            'sent_count': sent_count,
+            'error_count': error_count,
+            'skipped_count': skipped_count,
+        }
+    
+    @staticmethod
+    def send_briefing_sign_off_notifications():
+        """Email each student whose ground briefing was signed off at a classroom session"""
+        
+        # Import inside function to avoid circular imports
+        from django.apps import apps
+        PendingNotification = apps.get_model('training_records', 'PendingNotification')
+        
+        notifications = PendingNotification.objects.filter(
+            notification_type='student_briefing_signed_off', is_sent=False,
+        ).select_related('user', 'ground_briefing__topic', 'ground_briefing__instructor')
+        sent_count = 0
+        error_count = 0
+        skipped_count = 0
+        
+        for notification in notifications:
+            student = notification.user
+            briefing = notification.ground_briefing
+            
+            if not student.email or student.email.strip() == '':
+                logger.warning(f'Skipping briefing notification {notification.pk} - student {student.pk} has no email address')
+                notification.is_sent = True
+                notification.save(update_fields=['is_sent'])
+                skipped_count += 1
+                continue
+            
+            context = {
+                'student': student,
+                'briefing': briefing,
+                'instructor': briefing.instructor,
+                'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
+            }
+            try:
+                send_mail(
+                    subject=f"Ground Briefing Signed Off - {briefing.topic}",
+                    message=render_to_string('training_records/emails/briefing_signed_off.txt', context),
+                    html_message=render_to_string('training_records/emails/briefing_signed_off.html', context),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipient_list=[student.email],
+                    fail_silently=False,
+                )
+                metrics.record_email('student_briefing_signed_off', success=True)
+                notification.sent_at = timezone.now()
+                notification.is_sent = True
+                notification.save(update_fields=['sent_at', 'is_sent'])
+                sent_count += 1
+            except Exception as e:
+                # Left unsent, so the next run retries it
+                error_count += 1
+                metrics.record_email('student_briefing_signed_off', success=False)
+                logger.error(f'Failed to send briefing notification to {student.email}: {e}', exc_info=True)
+            time.sleep(0.1) # Throttle to avoid hitting email provider limits
+        
+        logger.info(f'Briefing notifications sent: {sent_count}, errors: {error_count}, skipped: {skipped_count}')
+        
+        return {
+            'sent_count': sent_count,
+            'error_count': error_count,
+            'skipped_count': skipped_count,
+        }
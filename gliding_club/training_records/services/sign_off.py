@@ -0,0 +1,162 @@
+# training_records/services/sign_off.py
+"""
+Sign off many training records or ground briefings at once.
+
+sign() and sign_off() save one row at a time, and every save runs its signals.
+Here one bulk_update writes the whole batch with a shared timestamp, and the audit
+entries and student notifications are bulk-inserted, all in a single transaction.
+bulk_update sends no signals, so the fragment version counters are bumped here.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import fragment_cache, ledger, signatures
+
+logger = logging.getLogger(__name__)
+
+# Columns a batch sign-off writes (not the signed content; that is signatures.SIGNED_FIELDS)
+SIGN_OFF_UPDATE_FIELDS = ('signed_off', 'sign_off_timestamp', 'signature_hash', 'updated_at')
+BATCH_SIZE = 500
+
+def _client_ip(request):
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded_for:
+        return forwarded_for.split(',')[0]
+    return request.META.get('REMOTE_ADDR')
+
+def _audit_entries(instructor, rows, request, old_values, new_values):
+    """Unsaved AuditLog entries for a batch sign-off; old_values(row) and new_values(row) give the values"""
+    from ..models import AuditLog
+
+    ip_address = _client_ip(request) if request is not None else None
+    user_agent = request.META.get('HTTP_USER_AGENT', '') if request is not None else ''
+    return [
+        AuditLog(
+            user=instructor,
+            action='SIGN_OFF',
+            table_name=row._meta.db_table,
+            record_id=row.pk,
+            ip_address=ip_address,
+            user_agent=user_agent,
+            old_values=old_values(row),
+            new_values=new_values(row),
+        )
+        for row in rows
+    ]
+
+def sign_off_records(instructor, record_ids, request=None):
+    """
+    Sign off the given records that are unsigned and assigned to this instructor;
+    others are skipped. Returns the signed records.
+    """
+    from ..models import AuditLog, PendingNotification, TrainingRecord
+
+    with transaction.atomic():
+        # Lock the rows so two submissions of the same queue cannot both sign a record
+        records = list(
+            TrainingRecord.objects.select_for_update()
+            .filter(pk__in=record_ids, instructor=instructor, signed_off=False)
+            .order_by('pk')
+        )
+        if not records:
+            return []
+
+        now = timezone.now()
+        for record in records:
+            record.signed_off = True
+            record.sign_off_timestamp = now
+            record.updated_at = now
+            record.signature_hash = record.compute_signature_hash()
+        TrainingRecord.objects.bulk_update(records, SIGN_OFF_UPDATE_FIELDS, batch_size=BATCH_SIZE)
+        ledger.append(records)
+
+        AuditLog.objects.bulk_create(_audit_entries(
+            instructor, records, request,
+            old_values=lambda record: {'signed_off': False, 'sign_off_timestamp': None, 'signature_hash': ''},
+            new_values=lambda record: {
+                'signed_off': True,
+                'sign_off_timestamp': now.isoformat(),
+                'signature_hash': record.signature_hash,
+                # What was signed, so verify_signatures can name the fields changed since
+                'signed_values': signatures.signed_values(record),
+            },
+        ), batch_size=BATCH_SIZE)
+
+        # One notification per student; it points at one record of the batch, and the
+        # sender finds the rest by their shared instructor and sign-off timestamp
+        records_by_student = {}
+        for record in records:
+            records_by_student.setdefault(record.student_id, record)
+        PendingNotification.objects.bulk_create([
+            PendingNotification(
+                user_id=student_id, notification_type='student_records_signed_off', training_record=record,
+            )
+            for student_id, record in records_by_student.items()
+        ], ignore_conflicts=True)
+
+        fragment_cache.bump(
+            [fragment_cache.student_counter(student_id) for student_id in records_by_student]
+            + [fragment_cache.instructor_counter(instructor.pk), fragment_cache.ALL_RECORDS]
+        )
+
+    logger.info(f'{instructor.username} signed off {len(records)} records for {len(records_by_student)} students')
+    return records
+
+def sign_off_briefings(instructor, briefing_ids, request=None):
+    """
+    Sign off the given pending ground briefings, e.g. everyone at one classroom session;
+    briefings that are already signed off are skipped. Returns the signed briefings.
+    Raises ValueError, signing nothing, if the briefings are on more than one topic.
+    """
+    from ..models import AuditLog, GroundBriefing, PendingNotification
+
+    with transaction.atomic():
+        briefings = list(
+            GroundBriefing.objects.select_for_update()
+            .filter(pk__in=briefing_ids, signed_off=False)
+            .order_by('pk')
+        )
+        if not briefings:
+            return []
+        # A session covers one topic; ids from several mean a tampered or stale form
+        if len({briefing.topic_id for briefing in briefings}) > 1:
+            raise ValueError('Briefings on different topics cannot be signed off together')
+
+        now = timezone.now()
+        # Pages of the instructor each briefing was requested with change too
+        previous_instructors = {briefing.instructor_id for briefing in briefings} - {None}
+        old_values = {briefing.pk: {'instructor': briefing.instructor_id} for briefing in briefings}
+        for briefing in briefings:
+            briefing.instructor = instructor
+            briefing.signed_off = True
+            briefing.sign_off_date = now.date()
+            briefing.updated_at = now
+        GroundBriefing.objects.bulk_update(
+            briefings, ['instructor', 'signed_off', 'sign_off_date', 'updated_at'], batch_size=BATCH_SIZE
+        )
+
+        AuditLog.objects.bulk_create(_audit_entries(
+            instructor, briefings, request,
+            old_values=lambda briefing: {**old_values[briefing.pk], 'signed_off': False, 'sign_off_date': None},
+            new_values=lambda briefing: {
+                'instructor': instructor.pk, 'signed_off': True, 'sign_off_date': now.date().isoformat(),
+            },
+        ), batch_size=BATCH_SIZE)
+
+        # A student has one briefing per topic, so this is one notification per student
+        PendingNotification.objects.bulk_create([
+            PendingNotification(
+                user_id=briefing.student_id, notification_type='student_briefing_signed_off', ground_briefing=briefing,
+            )
+            for briefing in briefings
+        ], batch_size=BATCH_SIZE)
+
+        fragment_cache.bump(
+            [fragment_cache.student_counter(briefing.student_id) for briefing in briefings]
+            + [fragment_cache.instructor_counter(pk) for pk in previous_instructors | {instructor.pk}]
+        )
+
+    logger.info(f'{instructor.username} signed off {len(briefings)} ground briefings')
+    return briefings
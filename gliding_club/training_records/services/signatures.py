@@ -0,0 +1,42 @@
+# training_records/services/signatures.py
+"""
+The training record signature: a SHA-256 over the record's key fields and its
+sign-off timestamp. Plain functions with no Django imports, so verify_signatures
+can run them in worker processes.
+"""
+import hashlib
+
+# Fields the signature covers, in hash order
+SIGNED_FIELDS = (
+    'id', 'student_id', 'instructor_id', 'training_topic_id', 'glider_id',
+    'date', 'flight_duration', 'sign_off_timestamp',
+)
+
+def signature_hash(values):
+    """Hash of the SIGNED_FIELDS values, in that order"""
+    return hashlib.sha256('|'.join(str(value) for value in values).encode()).hexdigest()
+
+def signed_values(record):
+    """The signed fields as strings, kept on the ledger entry so a later mismatch can name what changed"""
+    return {field: str(getattr(record, field)) for field in SIGNED_FIELDS}
+
+def verify_chunk(rows):
+    """
+    rows are (values, stored_hash) pairs, values in SIGNED_FIELDS order.
+    Returns (values, stored_hash, computed_hash) for every row whose hash does not match.
+    """
+    mismatches = []
+    for values, stored_hash in rows:
+        computed_hash = signature_hash(values)
+        if computed_hash != stored_hash:
+            mismatches.append((values, stored_hash, computed_hash))
+    return mismatches
+
+# previous_hash of a student's first ledger entry
+LEDGER_GENESIS = '0' * 64
+
+def ledger_entry_hash(previous_hash, student_id, sequence, record_id, kind, signature_hash):
+    """Hash of one ledger entry, chained to the entry before it"""
+    return hashlib.sha256(
+        f"{previous_hash}|{student_id}|{sequence}|{record_id}|{kind}|{signature_hash}".encode()
+    ).hexdigest()
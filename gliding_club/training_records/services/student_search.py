@@ -0,0 +1,53 @@
+# training_records/services/student_search.py
+"""
+Name search for the student typeahead.
+
+Each word typed must match the start of the student's first name, last name,
+username or license number. These lookups use the lower() expression indexes
+on auth_user, so the cost does not grow with the size of the club. When
+STUDENT_SEARCH_TRIGRAM is enabled (requires the pg_trgm extension), a
+trigram match on the full name fills the remaining slots to catch typos.
+"""
+from django.conf import settings
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Lower
+from django.contrib.postgres.search import TrigramWordSimilarity
+from ..models import User
+
+# Fields matched by prefix; each has a lower() index in User.Meta.indexes
+PREFIX_SEARCH_FIELDS = ('first_name', 'last_name', 'username', 'student_license_number')
+
+# Minimum word similarity for a trigram match to be returned
+TRIGRAM_THRESHOLD = 0.4
+
+def search_students(query, limit=10):
+    """Return up to limit active students matching query, best matches first"""
+    terms = query.lower().split()
+    if not terms:
+        return []
+
+    students = User.objects.filter(user_type='student', is_active=True).alias(
+        **{f'{field}_lower': Lower(field) for field in PREFIX_SEARCH_FIELDS}
+    )
+
+    prefix_filter = Q()
+    for term in terms:
+        term_filter = Q()
+        for field in PREFIX_SEARCH_FIELDS:
+            term_filter |= Q(**{f'{field}_lower__startswith': term})
+        prefix_filter &= term_filter
+
+    results = list(students.filter(prefix_filter).order_by('first_name', 'last_name')[:limit])
+
+    if getattr(settings, 'STUDENT_SEARCH_TRIGRAM', False) and len(results) < limit:
+        # Fall back to fuzzy matching on the full name for misspelt names
+        similar = students.annotate(
+            similarity=TrigramWordSimilarity(query, Concat('first_name', Value(' '), 'last_name'))
+        ).filter(
+            similarity__gte=TRIGRAM_THRESHOLD
+        ).exclude(
+            pk__in=[student.pk for student in results]
+        ).order_by('-similarity', 'first_name', 'last_name')[:limit - len(results)]
+        results.extend(similar)
+
+    return results
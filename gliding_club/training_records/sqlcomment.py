@@ -0,0 +1,101 @@
+# training_records/sqlcomment.py
+"""
+Tag SQL statements with a comment identifying the code that issued them.
+
+Comments follow the sqlcommenter format and are appended to every statement:
+
+    SELECT ... /*command='send_weekly_digest'*/
+    SELECT ... /*url_name='student_lookup',view='training_records.views.instructor.student_lookup'*/
+
+(plus request_id='4f0c...' with SQL_COMMENT_REQUEST_ID), so slow queries in pg_stat_statements or the Postgres logs can be traced back
+to the Django view or management command that ran them.
+"""
+import contextvars
+import re
+
+# Tags for the request currently being handled (set by SQLCommentMiddleware)
+_request_tags = contextvars.ContextVar('sql_comment_request_tags', default=None)
+
+# Name of the management command this process is running, if any
+_command_name = None
+
+# Tag values end up inside the SQL text, so only allow a conservative character set.
+# This also keeps '%' out of the statement, which psycopg would treat as a placeholder.
+_UNSAFE_CHARS = re.compile(r'[^\w.:\-]')
+_COMMENT_RE = re.compile(r"/\*((?:\w+='[\w.:\-]*',?)+)\*/\s*$")
+_TAG_RE = re.compile(r"(\w+)='([\w.:\-]*)'")
+
+
+def is_valid_request_id(value):
+    """Whether a client-supplied request id can be used as a tag as-is"""
+    return bool(value) and len(value) <= 64 and not _UNSAFE_CHARS.search(value)
+
+
+def set_command(name):
+    """Record the management command this process is running"""
+    global _command_name
+    _command_name = name
+
+
+def start_request(**tags):
+    """Start tagging queries for a request. Returns a token for end_request()"""
+    return _request_tags.set(dict(tags))
+
+
+def update_request(**tags):
+    """Add tags to the request currently being handled"""
+    current = _request_tags.get()
+    if current is not None:
+        current.update(tags)
+
+
+def end_request(token):
+    """Stop tagging queries with the tags from start_request()"""
+    _request_tags.reset(token)
+
+
+def current_tags():
+    """Tags that apply to queries issued right now"""
+    tags = {}
+    if _command_name:
+        tags['command'] = _command_name
+    request_tags = _request_tags.get()
+    if request_tags:
+        tags.update(request_tags)
+    return tags
+
+
+def format_comment(tags):
+    """Render tags as a sqlcommenter comment with keys in sorted order"""
+    pairs = [
+        f"{key}='{_UNSAFE_CHARS.sub('_', str(value))}'"
+        for key, value in sorted(tags.items())
+        if value
+    ]
+    if not pairs:
+        return ''
+    return '/*' + ','.join(pairs) + '*/'
+
+
+def parse_comment(sql):
+    """Extract the tags from a statement tagged by this module"""
+    match = _COMMENT_RE.search(sql or '')
+    if not match:
+        return {}
+    return dict(_TAG_RE.findall(match.group(1)))
+
+
+def sql_comment_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper that appends the current tags to each statement"""
+    comment = format_comment(current_tags())
+    if comment:
+        sql = f"{sql} {comment}"
+    return execute(sql, params, many, context)
+
+
+def install_wrapper(sender, connection, **kwargs):
+    """connection_created receiver that installs the wrapper on new connections"""
+    if sql_comment_wrapper not in connection.execute_wrappers:
+        # Insert rather than append: connection.execute_wrapper() pops the last
+        # wrapper on exit, so appending while one is active would get ours removed
+        connection.execute_wrappers.insert(0, sql_comment_wrapper)
@@ -0,0 +1,108 @@
+# training_records/templatetags/fragment_cache.py
+import os
+
+from django import template
+from django.db import router
+from django.utils import translation
+
+from ..services import fragment_cache
+from ..services.catalogue import get_catalogue
+
+register = template.Library()
+
+# Keyword arguments that name version counters, and the counter each one maps to
+COUNTER_ARGUMENTS = {
+    'student': fragment_cache.student_counter,
+    'instructor': fragment_cache.instructor_counter,
+    'counters': None,  # literal counter name, or a list of them
+}
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on, counters):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+        self.counters = counters
+        self._template_version = None
+
+    def template_version(self):
+        """The template file's modification time, so a deploy never serves fragments rendered by old templates"""
+        if self._template_version is None:
+            try:
+                self._template_version = os.stat(self.origin.name).st_mtime_ns
+            except (AttributeError, OSError, TypeError):
+                self._template_version = 0
+        return self._template_version
+
+    def counter_names(self, context):
+        names = set()
+        for argument, expression in self.counters.items():
+            value = expression.resolve(context)
+            if argument == 'counters':
+                names.update([value] if isinstance(value, str) else value or ())
+            elif value not in (None, ''):
+                names.add(COUNTER_ARGUMENTS[argument](value))
+        return names
+
+    def render(self, context):
+        if not fragment_cache.is_enabled():
+            return self.nodelist.render(context)
+
+        request = context.get('request')
+        user = context.get('user') or getattr(request, 'user', None)
+        names = self.counter_names(context)
+
+        # Read each counter once per request, however many fragments use it
+        versions = getattr(request, '_fragment_versions', None)
+        if versions is None:
+            versions = {}
+            if request is not None:
+                request._fragment_versions = versions
+        missing = names - versions.keys()
+        if missing:
+            from ..models import CacheVersion
+            # Read the counters from the database the page reads from: a lagging replica then
+            # shows old versions along with the old rows, never new versions with old rows
+            versions.update(CacheVersion.get_versions(missing, using=router.db_for_read(CacheVersion)))
+
+        key = fragment_cache.make_key(self.name, [
+            self.template_version(),
+            getattr(user, 'pk', None),
+            translation.get_language(),
+            get_catalogue().version,
+            *(f'{name}={versions[name]}' for name in sorted(names)),
+            *(expression.resolve(context) for expression in self.vary_on),
+        ])
+        return fragment_cache.get_or_render(key, lambda: self.nodelist.render(context))
+
+@register.tag('fragmentcache')
+def do_fragmentcache(parser, token):
+    """
+    Cache the enclosed fragment until the data it shows changes:
+
+        {% fragmentcache "student_history" page_number student=student.pk instructor=user.pk %}
+            ...
+        {% endfragmentcache %}
+
+    The key always varies on the user, the language and the reference data catalogue.
+    student=, instructor= and counters= name the version counters it depends on;
+    other arguments are added to the key as they are.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name")
+    nodelist = parser.parse(('endfragmentcache',))
+    parser.delete_first_token()
+
+    name = bits[1].strip('"\'')
+    vary_on = []
+    counters = {}
+    for bit in bits[2:]:
+        argument, sep, value = bit.partition('=')
+        if sep and argument in COUNTER_ARGUMENTS:
+            counters[argument] = parser.compile_filter(value)
+        elif sep:
+            raise template.TemplateSyntaxError(f"'{bits[0]}' got an unknown argument '{argument}'")
+        else:
+            vary_on.append(parser.compile_filter(bit))
+    return FragmentCacheNode(nodelist, name, vary_on, counters)
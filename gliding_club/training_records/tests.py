@@ -1,3 +1,1474 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from datetime import date, timedelta
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .models import (
+    User, Glider, TrainingTopic, TrainingRecord, Exercise, ExercisePerformance,
+    GroundBriefing, GroundBriefingTopic, CacheVersion, AuditLog, PendingNotification, JobCheckpoint,
+    SignatureLedgerEntry, SignatureCheckpoint,
+)
+from .forms import TrainingRecordForm
+from .services import backfill, catalogue, catalogue_import, catalogue_snapshot, fragment_cache, ledger
+from .services.notification_service import NotificationService
+from .services.sign_off import sign_off_briefings
 
-# Create your tests here.
+@override_settings(
+    FRAGMENT_CACHE_BACKEND='locmem',
+    CACHES={**settings.CACHES, 'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class ClubTestCase(TestCase):
+    """An instructor, a glider, a topic and an exercise; add_students() adds flown records"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.instructor = User.objects.create_user(
+            username='instructor', password='pass', user_type='instructor',
+            first_name='Ina', last_name='Structor', password_change_required=False,
+        )
+        cls.glider = Glider.objects.create(tail_number='4X-GAA', model='ASK 21', manufacturer='Schleicher')
+        cls.topic = TrainingTopic.objects.create(name='Circuits')
+        cls.exercise = Exercise.objects.create(name='Lookout', category='pre-solo')
+
+    def setUp(self):
+        # Each test's data is rolled back, so fragments rendered from it must go; counters a
+        # test never bumped still have the versions those fragments were cached under
+        caches['fragments'].clear()
+        catalogue.get_catalogue()
+        self.client.force_login(self.instructor)
+        self.student_count = 0
+
+    def add_students(self, count, records_each=3):
+        for _ in range(count):
+            self.student_count += 1
+            student = User.objects.create_user(
+                username=f'student{self.student_count}', password='pass', user_type='student',
+                first_name='Student', last_name=str(self.student_count), password_change_required=False,
+            )
+            for day in range(records_each):
+                record = TrainingRecord.objects.create(
+                    student=student, instructor=self.instructor, training_topic=self.topic,
+                    glider=self.glider, is_solo=day % 2 == 1, date=date.today() - timedelta(days=day),
+                    field='Megiddo', flight_duration=timedelta(minutes=20),
+                )
+                record.exercises.add(self.exercise)
+                ExercisePerformance.objects.create(
+                    training_record=record, exercise=self.exercise, performance='performed_well'
+                )
+
+class InstructorStudentViewTests(ClubTestCase):
+    """Instructor pages should cost the same number of queries however big the club gets"""
+
+    # Generous upper bound so the test catches N+1 regressions, not slow CI machines
+    MAX_DASHBOARD_SECONDS = 2.0
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = self.client.get(reverse('instructor_dashboard'))
+            elapsed = time.perf_counter() - start
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries), elapsed
+
+    def test_query_count_does_not_grow_with_club_size(self):
+        self.add_students(2)
+        _, small_queries, _ = self.get_dashboard()
+
+        self.add_students(30)
+        response, large_queries, elapsed = self.get_dashboard()
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertLess(elapsed, self.MAX_DASHBOARD_SECONDS)
+        self.assertEqual(response.context['stats']['students_count'], 32)
+        self.assertEqual(response.context['stats']['pending_count'], 96)
+        self.assertEqual(response.context['stats']['total_instructional_flights'], 64)
+        self.assertEqual(response.context['stats']['total_supervised_solo_flights'], 32)
+
+    def test_recent_students_are_distinct_with_flight_counts(self):
+        self.add_students(7)
+        response, _, _ = self.get_dashboard()
+
+        recent_students = response.context['recent_students']
+        self.assertEqual(len(recent_students), 5)
+        self.assertEqual(len({student.pk for student in recent_students}), 5)
+        for student in recent_students:
+            self.assertEqual(student.training_count, 3)
+            self.assertEqual(student.last_training_date, date.today())
+
+    def test_student_lookup_query_count_does_not_grow_with_club_size(self):
+        self.add_students(2)
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.get(reverse('student_lookup'))
+
+        self.add_students(20)
+        with CaptureQueriesContext(connection) as large_queries:
+            response = self.client.get(reverse('student_lookup'))
+
+        self.assertEqual(len(small_queries), len(large_queries))
+        students = response.context['students_with_recent_activity']
+        self.assertEqual(len(students), 15)
+        self.assertEqual(len({student.pk for student in students}), 15)
+        for student in students:
+            self.assertEqual(student.recent_topic, 'Circuits')
+            self.assertEqual(student.recent_date, date.today())
+
+    def test_student_search(self):
+        self.add_students(3)
+        response = self.client.get(reverse('student_search'), {'q': 'stud'})
+        self.assertEqual(len(response.json()['results']), 3)
+
+        response = self.client.get(reverse('student_search'), {'q': 's'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_student_search_matches_each_word_and_license_number(self):
+        self.add_students(2)
+        User.objects.filter(username='student2').update(student_license_number='GL-4471')
+
+        response = self.client.get(reverse('student_search'), {'q': 'Student 2'})
+        self.assertEqual([result['name'] for result in response.json()['results']], ['Student 2'])
+
+        response = self.client.get(reverse('student_search'), {'q': 'gl-44'})
+        self.assertEqual([result['license_number'] for result in response.json()['results']], ['GL-4471'])
+
+        User.objects.filter(username='student2').update(is_active=False)
+        response = self.client.get(reverse('student_search'), {'q': 'gl-44'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_student_search_is_instructor_only(self):
+        self.add_students(1)
+        self.client.force_login(User.objects.get(username='student1'))
+        response = self.client.get(reverse('student_search'), {'q': 'stud'})
+        self.assertEqual(response.status_code, 403)
+
+class TrainingRecordQuerySetTests(ClubTestCase):
+    """The list projections should match the per-record model methods"""
+
+    def test_record_list_query_count_does_not_grow_with_page_size(self):
+        self.add_students(1, records_each=2)
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.get(reverse('record_list'))
+
+        self.add_students(6)
+        with CaptureQueriesContext(connection) as large_queries:
+            response = self.client.get(reverse('record_list'))
+
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertEqual(len(response.context['records']), 20)
+
+    def test_for_list_matches_model_methods(self):
+        self.add_students(2)
+        TrainingRecord.objects.filter(student__username='student1').update(
+            signed_off=True, sign_off_timestamp=timezone.now() - timedelta(days=8)
+        )
+
+        for record in TrainingRecord.objects.for_list():
+            plain = TrainingRecord.objects.get(pk=record.pk)
+            self.assertEqual(record.flight_number, plain.get_flight_number())
+            self.assertEqual(record.performed_exercise_count, plain.get_performed_exercises().count())
+            self.assertEqual(
+                record.is_modifiable_by_instructor(self.instructor),
+                plain.is_modifiable_by_instructor(self.instructor),
+            )
+
+    def test_detail_and_sign_pages_cost_constant_queries(self):
+        self.add_students(2, records_each=1)
+        small, large = TrainingRecord.objects.order_by('pk')
+        # The second record has a performance for every exercise in the syllabus
+        for exercise in Exercise.objects.exclude(pk=self.exercise.pk):
+            ExercisePerformance.objects.create(
+                training_record=large, exercise=exercise, performance='needs_improvement'
+            )
+
+        for url_name in ('record_detail', 'sign_record'):
+            with CaptureQueriesContext(connection) as small_queries:
+                self.client.get(reverse(url_name, args=[small.pk]))
+            with CaptureQueriesContext(connection) as large_queries:
+                response = self.client.get(reverse(url_name, args=[large.pk]))
+            self.assertEqual(len(small_queries), len(large_queries), url_name)
+
+        performed = len(response.context['pre_solo_performances']) + len(response.context['post_solo_performances'])
+        self.assertEqual(performed, Exercise.objects.count())
+
+    def test_prefetched_exercise_getters_match_queries(self):
+        self.add_students(1, records_each=1)
+        plain = TrainingRecord.objects.get()
+        prefetched = TrainingRecord.objects.with_performances().get()
+        with self.assertNumQueries(0):
+            well_performed = prefetched.get_well_performed_exercises()
+        self.assertEqual(list(well_performed), list(plain.get_well_performed_exercises()))
+        self.assertEqual(list(prefetched.get_needs_improvement_exercises()), [])
+
+class CatalogueTests(ClubTestCase):
+    """The reference data catalogue is cached per process and reloaded when its version changes"""
+
+    def test_catalogue_is_reused_until_reference_data_changes(self):
+        first = catalogue.get_catalogue()
+        with self.assertNumQueries(1):
+            # Only the version check
+            self.assertIs(catalogue.get_catalogue(), first)
+
+        Glider.objects.create(tail_number='4X-GBB', model='Discus', manufacturer='Schempp-Hirth')
+        second = catalogue.get_catalogue()
+        self.assertIsNot(second, first)
+        self.assertIn('4X-GBB', [glider.tail_number for glider in second.active_gliders])
+
+    def test_rolled_back_bump_is_not_handed_out_again(self):
+        from django.db import transaction
+        before = CacheVersion.get_version('test')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            rolled_back = CacheVersion.bump('test')
+            raise RuntimeError
+        self.assertEqual(CacheVersion.get_version('test'), before)
+        self.assertGreater(CacheVersion.bump('test'), rolled_back)
+        CacheVersion.bump_many(['test', 'other'])
+        versions = CacheVersion.get_versions(['test', 'other'])
+        self.assertGreater(versions['test'], rolled_back)
+        self.assertGreater(versions['other'], rolled_back)
+
+    def test_version_is_checked_once_per_request(self):
+        catalogue.get_catalogue()
+        token = catalogue.start_request()
+        try:
+            catalogue.get_catalogue()
+            with self.assertNumQueries(0):
+                catalogue.get_catalogue()
+        finally:
+            catalogue.end_request(token)
+
+    def test_instructor_logins_do_not_invalidate(self):
+        version = catalogue.get_catalogue().version
+        self.client.force_login(self.instructor)
+        self.assertEqual(catalogue.get_catalogue().version, version)
+
+        self.instructor.first_name = 'Renamed'
+        self.instructor.save()
+        self.assertEqual(catalogue.get_catalogue().instructors_by_id[self.instructor.pk].first_name, 'Renamed')
+
+    def test_record_form_renders_choices_from_catalogue(self):
+        self.add_students(1, records_each=0)
+        student = User.objects.get(username='student1')
+        catalogue.get_catalogue()
+        token = catalogue.start_request()
+        try:
+            catalogue.get_catalogue()
+            with self.assertNumQueries(0):
+                form = TrainingRecordForm(user=student)
+                html = str(form['glider']) + str(form['instructor']) + str(form['training_topic'])
+        finally:
+            catalogue.end_request(token)
+        self.assertIn('4X-GAA', html)
+        self.assertIn('Circuits', html)
+
+    def test_record_create_stores_a_performance_for_every_exercise(self):
+        self.add_students(1, records_each=0)
+        student = User.objects.get(username='student1')
+        self.client.force_login(student)
+        response = self.client.post(reverse('record_create'), {
+            'instructor': self.instructor.pk, 'training_topic': self.topic.pk, 'glider': self.glider.pk,
+            'date': date.today().isoformat(), 'field': 'Megiddo', 'duration_display': '0:25',
+            'form-TOTAL_FORMS': 1, 'form-0-exercise': self.exercise.pk, 'form-0-performance': 'performed_well',
+        })
+        self.assertEqual(response.status_code, 302)
+        record = TrainingRecord.objects.get(student=student)
+        self.assertEqual(record.exercise_performances.count(), Exercise.objects.count())
+        self.assertEqual(record.exercise_performances.get(exercise=self.exercise).performance, 'performed_well')
+
+class CatalogueSnapshotTests(ClubTestCase):
+    """The catalogue can be shared between workers through a mapped snapshot file"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.path = os.path.join(directory, 'catalogue.bin')
+        self.addCleanup(os.rmdir, directory)
+        self.addCleanup(lambda: os.path.exists(self.path) and os.unlink(self.path))
+        Glider.objects.create(tail_number='4X-GÖÖ', model='Ka 8', manufacturer='Schleicher', is_active=False)
+        self.instructor.license_expiration_date = date(2030, 1, 31)
+        self.instructor.save()
+
+    def test_snapshot_round_trip(self):
+        original = catalogue.Catalogue.load(catalogue.invalidate())
+        catalogue_snapshot.write(self.path, original)
+        self.assertEqual(catalogue_snapshot.read_version(self.path), original.version)
+
+        with self.assertNumQueries(0):
+            loaded = catalogue_snapshot.load(self.path, original.version)
+            gliders = [(g.pk, g.tail_number, g.year, g.is_active) for g in loaded.gliders]
+            instructor = loaded.instructors_by_id[self.instructor.pk]
+            self.assertEqual(instructor.license_expiration_date, date(2030, 1, 31))
+            self.assertEqual(str(loaded.exercises[0]), str(original.exercises[0]))
+        self.assertEqual(gliders, [(g.pk, g.tail_number, g.year, g.is_active) for g in original.gliders])
+        self.assertEqual([e.pk for e in loaded.pre_solo_exercises], [e.pk for e in original.pre_solo_exercises])
+        self.assertEqual([t.pk for t in loaded.briefing_topics], [t.pk for t in original.briefing_topics])
+
+        # Stale or missing snapshots are not used
+        self.assertIsNone(catalogue_snapshot.load(self.path, original.version + 1))
+        self.assertIsNone(catalogue_snapshot.load(self.path + '.missing', original.version))
+
+    def test_get_catalogue_refreshes_the_snapshot_when_the_version_changes(self):
+        with override_settings(CATALOGUE_SNAPSHOT_PATH=self.path):
+            version = catalogue.write_snapshot().version
+            self.assertEqual(catalogue.get_catalogue().version, version)
+
+            self.glider.model = 'ASK 21 Mi'
+            self.glider.save()
+            refreshed = catalogue.get_catalogue()
+            self.assertGreater(refreshed.version, version)
+            self.assertEqual(catalogue_snapshot.read_version(self.path), refreshed.version)
+            self.assertEqual(
+                catalogue_snapshot.load(self.path, refreshed.version).gliders_by_id[self.glider.pk].model, 'ASK 21 Mi'
+            )
+
+class FullDiskCache(LocMemCache):
+    """A fragments cache that can be read but not written, like a file cache on a full disk"""
+
+    def set(self, *args, **kwargs):
+        raise OSError(28, 'No space left on device')
+
+class FragmentCacheTests(ClubTestCase):
+    """Dashboard and history fragments are cached until the records they show change"""
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    @override_settings(CACHES={**settings.CACHES, 'fragments': {'BACKEND': 'training_records.tests.FullDiskCache'}})
+    def test_failed_cache_write_still_serves_the_page(self):
+        with self.assertLogs('training_records.services.fragment_cache', 'WARNING'):
+            self.assertEqual(fragment_cache.get_or_render('fragment:test', lambda: '<p>page</p>'), '<p>page</p>')
+        self.add_students(1)
+        with self.assertLogs('training_records.services.fragment_cache', 'WARNING'):
+            self.assertContains(self.get(reverse('instructor_dashboard'))[0], 'Student 1')
+
+    def test_instructor_dashboard_is_served_from_cache_until_a_record_changes(self):
+        self.add_students(3)
+        url = reverse('instructor_dashboard')
+        _, first_queries = self.get(url)
+        response, cached_queries = self.get(url)
+        self.assertLess(cached_queries, first_queries)
+        self.assertContains(response, 'Student 3')
+
+        record = TrainingRecord.objects.filter(student__username='student1').first()
+        record.student = User.objects.get(username='student2')
+        record.save()
+        self.assertNotEqual(self.get(url)[1], cached_queries)
+
+        student = User.objects.get(username='student3')
+        student.first_name = 'Renamed'
+        student.save()
+        self.assertContains(self.get(url)[0], 'Renamed 3')
+
+    def test_student_history_reflects_sign_offs_and_briefings(self):
+        self.add_students(1)
+        student = User.objects.get(username='student1')
+        url = reverse('student_history', args=[student.pk])
+        response, first_queries = self.get(url)
+        self.assertNotContains(response, 'bi-check-circle-fill')
+        self.assertLess(self.get(url)[1], first_queries)
+
+        record = TrainingRecord.objects.filter(student=student).first()
+        record.signed_off = True
+        record.save()
+        response, _ = self.get(url)
+        self.assertContains(response, 'Lookout')
+
+        version = fragment_cache.student_counter(student.pk)
+        before = CacheVersion.get_version(version)
+        GroundBriefing.objects.create(
+            student=student, instructor=self.instructor, date=date.today(),
+            topic=GroundBriefingTopic.objects.create(number=1, name='Weather'),
+        )
+        self.assertGreater(CacheVersion.get_version(version), before)
+
+    def test_fragments_vary_by_viewer(self):
+        self.add_students(1)
+        student = User.objects.get(username='student1')
+        url = reverse('student_history', args=[student.pk])
+        self.assertContains(self.get(url)[0], reverse('sign_record', args=[student.student_records.first().pk]))
+
+        other = User.objects.create_user(
+            username='other', password='pass', user_type='instructor', password_change_required=False,
+        )
+        self.client.force_login(other)
+        self.assertNotContains(self.get(url)[0], 'btn-outline-success')
+
+    def test_student_dashboard_stats(self):
+        self.add_students(1)
+        student = User.objects.get(username='student1')
+        self.client.force_login(student)
+        response, _ = self.get(reverse('student_dashboard'))
+        self.assertEqual(response.context['stats']['total_flights'], 3)
+        self.assertEqual(response.context['stats']['solo_flights'], 1)
+        self.assertEqual(response.context['stats']['recent_flight_hours'], timedelta(minutes=60))
+        self.assertEqual(response.context['stats']['solo_flight_hours'], timedelta(minutes=20))
+
+    def test_concurrent_misses_render_once(self):
+        cache = caches['fragments']
+        cache.add('fragment:test:lock', 1)
+
+        def finish_other_render():
+            time.sleep(0.1)
+            cache.set('fragment:test', 'rendered elsewhere')
+
+        other = threading.Thread(target=finish_other_render)
+        other.start()
+        renders = []
+        html = fragment_cache.get_or_render('fragment:test', lambda: renders.append(1) or 'rendered here')
+        other.join()
+        self.assertEqual(html, 'rendered elsewhere')
+        self.assertEqual(renders, [])
+
+        # The winner stores its result and releases the lock
+        self.assertEqual(fragment_cache.get_or_render('fragment:new', lambda: 'fresh'), 'fresh')
+        self.assertEqual(cache.get('fragment:new'), 'fresh')
+        self.assertIsNone(cache.get('fragment:new:lock'))
+
+    def test_render_errors_propagate_once(self):
+        renders = []
+
+        def broken():
+            renders.append(1)
+            raise ValueError('template error')
+
+        with self.assertRaises(ValueError), self.assertNoLogs('training_records.services.fragment_cache'):
+            fragment_cache.get_or_render('fragment:test', broken)
+        self.assertEqual(renders, [1])
+        self.assertIsNone(caches['fragments'].get('fragment:test:lock'))
+
+        # Also after waiting in vain for another render
+        caches['fragments'].add('fragment:test:lock', 1)
+        self.addCleanup(setattr, fragment_cache, 'WAIT_TIMEOUT', fragment_cache.WAIT_TIMEOUT)
+        fragment_cache.WAIT_TIMEOUT = 0.1
+        with self.assertRaises(ValueError), self.assertNoLogs('training_records.services.fragment_cache'):
+            fragment_cache.get_or_render('fragment:test', broken)
+        self.assertEqual(renders, [1, 1])
+
+class ConditionalGetTests(ClubTestCase):
+    """Record detail, student history and exports answer 304 until anything they show changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_students(1)
+        self.student = User.objects.get(username='student1')
+        self.record = self.student.student_records.first()
+
+    def etag(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return response['ETag']
+
+    def assertNotModified(self, url, etag, **params):
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('Content-Security-Policy', response)
+
+    def assertChanges(self, url, change, **params):
+        etag = self.etag(url, **params)
+        self.assertNotModified(url, etag, **params)
+        change()
+        self.assertNotEqual(self.etag(url, **params), etag)
+
+    def test_record_detail(self):
+        url = reverse('record_detail', args=[self.record.pk])
+
+        def edit_record():
+            self.record.instructor_comments = 'Good lookout'
+            self.record.save()
+
+        def change_performance():
+            performance = self.record.exercise_performances.get()
+            performance.performance = 'needs_improvement'
+            performance.save()
+
+        def rename_exercise():
+            self.exercise.name = 'Lookout and collision avoidance'
+            self.exercise.save()
+
+        def sign_long_ago():
+            # Leaving the modification window changes the page without touching updated_at
+            TrainingRecord.objects.filter(pk=self.record.pk).update(
+                signed_off=True, sign_off_timestamp=timezone.now() - timedelta(days=8),
+            )
+
+        for change in (edit_record, change_performance, rename_exercise, sign_long_ago):
+            self.assertChanges(url, change)
+
+        # Validators are per viewer
+        etag = self.etag(url)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since_alone_never_answers_304(self):
+        url = reverse('record_detail', args=[self.record.pk])
+        last_modified = self.client.get(url)['Last-Modified']
+        self.exercise.name = 'Lookout and collision avoidance'
+        self.exercise.save()
+        # The rename moved the ETag but not Last-Modified
+        self.assertEqual(self.client.get(url)['Last-Modified'], last_modified)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_student_history(self):
+        url = reverse('student_history', args=[self.student.pk])
+
+        def add_briefing():
+            GroundBriefing.objects.create(
+                student=self.student, instructor=self.instructor, date=date.today(),
+                topic=GroundBriefingTopic.objects.create(number=1, name='Weather'),
+            )
+
+        def rename_student():
+            self.student.first_name = 'Renamed'
+            self.student.save()
+
+        def delete_record():
+            TrainingRecord.objects.filter(pk=self.record.pk).delete()
+
+        for change in (add_briefing, rename_student, delete_record):
+            self.assertChanges(url, change)
+
+    def test_exports(self):
+        url = reverse('export_student_records', args=[self.student.pk, 'csv'])
+
+        def add_record():
+            TrainingRecord.objects.create(
+                student=self.student, instructor=self.instructor, training_topic=self.topic,
+                glider=self.glider, date=date.today(), field='Megiddo', flight_duration=timedelta(minutes=30),
+            )
+
+        self.assertChanges(url, add_record)
+        self.add_students(1)
+
+        # No 304 for users who may not see the export
+        etag = self.etag(url)
+        self.client.force_login(User.objects.get(username='student2'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 403)
+
+    def test_instructor_flight_export(self):
+        url = reverse('instructor_flight_history')
+        record = self.student.student_records.filter(is_solo=False).first()
+
+        def shorten_flight():
+            record.flight_duration = timedelta(minutes=10)
+            record.save()
+
+        self.assertChanges(url, shorten_flight, export='csv')
+
+class GroundBriefingListTests(ClubTestCase):
+    """Filtered, paginated briefing list and the student's topic status pivot"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_students(2, records_each=0)
+        self.student, self.other = User.objects.filter(user_type='student').order_by('username')
+        self.topics = [GroundBriefingTopic.objects.create(number=n, name=f'Topic {n}') for n in range(1, 31)]
+        for topic in self.topics:
+            GroundBriefing.objects.create(
+                student=self.student, instructor=self.instructor, topic=topic,
+                date=date.today() - timedelta(days=topic.number), signed_off=topic.number <= 10,
+            )
+        GroundBriefing.objects.create(
+            student=self.other, instructor=self.instructor, topic=self.topics[0], date=date.today(),
+        )
+
+    def test_filters_and_pagination(self):
+        url = reverse('ground_briefing_list')
+        response = self.client.get(url)
+        self.assertEqual(response.context['paginator'].count, 31)
+        self.assertEqual(len(response.context['briefings']), 25)
+
+        response = self.client.get(url, {'student': self.student.pk, 'signed_off': 'no', 'page': 1})
+        self.assertEqual(response.context['paginator'].count, 20)
+        self.assertEqual(response.context['filter_query'], f'student={self.student.pk}&signed_off=no')
+
+        response = self.client.get(url, {
+            'topic': self.topics[0].pk, 'date_from': date.today(), 'date_to': date.today(),
+        })
+        self.assertEqual([b.student for b in response.context['briefings']], [self.other])
+
+        # Students never see other students' briefings, whatever they ask for
+        self.client.force_login(self.other)
+        response = self.client.get(url, {'student': self.student.pk})
+        self.assertEqual(response.context['paginator'].count, 1)
+
+    def test_student_filter_uses_the_typeahead(self):
+        url = reverse('ground_briefing_list')
+        response = self.client.get(url)
+        # No list of every student in the club
+        self.assertNotContains(response, f'<option value="{self.other.pk}"')
+        self.assertContains(response, 'data-select-into="id_student"')
+
+        response = self.client.get(url, {'student': self.other.pk})
+        self.assertEqual(response.context['paginator'].count, 1)
+        self.assertContains(response, f'value="{self.other.get_full_name()}"')
+
+    def test_status_pivot(self):
+        self.client.force_login(self.student)
+        url = reverse('student_ground_briefings')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        statuses = [item['status'] for item in response.context['topics_with_status']]
+        self.assertEqual(statuses.count('completed'), 10)
+        self.assertEqual(statuses.count('requested'), 20)
+        self.assertEqual(response.context['stats']['total'], len(self.topics))
+        self.assertEqual(response.context['stats']['remaining'], 0)
+
+        # The pivot costs the same queries however many topics the student has been briefed on
+        GroundBriefing.objects.filter(student=self.student, topic__number__gt=5).delete()
+        with CaptureQueriesContext(connection) as fewer:
+            response = self.client.get(url)
+        self.assertEqual(response.context['stats']['remaining'], 25)
+        self.assertEqual(len(fewer), len(queries))
+
+    def test_topic_newer_than_the_catalogue(self):
+        self.client.force_login(self.other)
+        self.client.get(reverse('student_ground_briefings'))
+        # bulk_create sends no signals, so the loaded catalogue does not know this topic
+        topic, = GroundBriefingTopic.objects.bulk_create([GroundBriefingTopic(number=31, name='Topic 31')])
+        GroundBriefing.objects.create(student=self.other, topic=topic, date=date.today())
+
+        response = self.client.get(reverse('student_ground_briefings'))
+        self.assertIn(topic, [briefing.topic for briefing in response.context['briefings']])
+        response = self.client.get(reverse('ground_briefing_list'))
+        self.assertContains(response, 'Topic 31')
+
+class SignOffQueueTests(ClubTestCase):
+    """Signing many records at once from the sign-off queue"""
+
+    def sign_all(self):
+        ids = list(TrainingRecord.objects.filter(signed_off=False).values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('sign_off_queue'), {'record_ids': ids})
+        self.assertRedirects(response, reverse('sign_off_queue'))
+        return len(queries)
+
+    def test_bulk_sign_off_costs_constant_queries(self):
+        self.add_students(2, records_each=2)
+        few_queries = self.sign_all()
+
+        self.add_students(20, records_each=5)
+        many_queries = self.sign_all()
+        self.assertEqual(few_queries, many_queries)
+
+        records = TrainingRecord.objects.all()
+        self.assertFalse(records.filter(signed_off=False).exists())
+        for record in records:
+            self.assertEqual(record.signature_hash, record.compute_signature_hash())
+        self.assertEqual(AuditLog.objects.filter(action='SIGN_OFF').count(), 104)
+        self.assertEqual(
+            PendingNotification.objects.filter(notification_type='student_records_signed_off').count(), 22
+        )
+
+    def test_only_own_unsigned_records_are_signed(self):
+        self.add_students(1)
+        student = User.objects.get(username='student1')
+        other = User.objects.create_user(
+            username='other', password='pass', user_type='instructor', password_change_required=False,
+        )
+        theirs = TrainingRecord.objects.create(
+            student=student, instructor=other, training_topic=self.topic, glider=self.glider,
+            date=date.today(), field='Megiddo', flight_duration=timedelta(minutes=20),
+        )
+        counter = fragment_cache.student_counter(student.pk)
+        before = CacheVersion.get_version(counter)
+
+        self.sign_all()
+        theirs.refresh_from_db()
+        self.assertFalse(theirs.signed_off)
+        self.assertEqual(student.student_records.filter(signed_off=True).count(), 3)
+        self.assertGreater(CacheVersion.get_version(counter), before)
+
+        # The student hears about the batch once, listing every record in it
+        student.email = 'student1@example.com'
+        student.save()
+        result = NotificationService.send_sign_off_notifications()
+        self.assertEqual(result['sent_count'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('3 Training Records Signed Off', mail.outbox[0].subject)
+
+class GroundBriefingSessionSignOffTests(ClubTestCase):
+    """Signing off everyone at one classroom briefing"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_students(12, records_each=0)
+        self.briefing_topic = GroundBriefingTopic.objects.create(number=1, name='Weather')
+        for student in User.objects.filter(user_type='student'):
+            GroundBriefing.objects.create(student=student, topic=self.briefing_topic, date=date.today())
+
+    def test_session_sign_off(self):
+        url = reverse('ground_briefing_session_sign_off')
+        response = self.client.get(url, {'topic': self.briefing_topic.pk})
+        self.assertEqual(len(response.context['briefings']), 12)
+
+        ids = [briefing.pk for briefing in response.context['briefings']]
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(url, {'topic': self.briefing_topic.pk, 'briefing_ids': ids[:2]})
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.post(url, {'topic': self.briefing_topic.pk, 'briefing_ids': ids})
+        self.assertRedirects(response, f'{url}?topic={self.briefing_topic.pk}')
+        self.assertEqual(len(few), len(many))
+
+        briefings = GroundBriefing.objects.all()
+        self.assertEqual(briefings.filter(signed_off=True, instructor=self.instructor).count(), 12)
+        self.assertEqual(AuditLog.objects.filter(action='SIGN_OFF', table_name=GroundBriefing._meta.db_table).count(), 12)
+        self.assertEqual(PendingNotification.objects.filter(notification_type='student_briefing_signed_off').count(), 12)
+
+    def test_session_sign_off_rejects_mixed_topics(self):
+        url = reverse('ground_briefing_session_sign_off')
+        other_topic = GroundBriefingTopic.objects.create(number=2, name='Airspace')
+        student = User.objects.get(username='student1')
+        other = GroundBriefing.objects.create(student=student, topic=other_topic, date=date.today())
+        ids = [GroundBriefing.objects.filter(topic=self.briefing_topic).first().pk, other.pk]
+
+        response = self.client.post(url, {'topic': f'{self.briefing_topic.pk}&next=/evil', 'briefing_ids': ids})
+        self.assertRedirects(response, url)
+        self.assertFalse(GroundBriefing.objects.filter(signed_off=True).exists())
+        self.assertFalse(AuditLog.objects.filter(action='SIGN_OFF').exists())
+        with self.assertRaises(ValueError):
+            sign_off_briefings(self.instructor, ids)
+
+    def test_single_sign_off_saves(self):
+        briefing = GroundBriefing.objects.first()
+        response = self.client.post(reverse('ground_briefing_sign_off', args=[briefing.pk]), {'notes': 'Good'})
+        self.assertRedirects(response, reverse('instructor_dashboard'), fetch_redirect_response=False)
+        briefing.refresh_from_db()
+        self.assertTrue(briefing.signed_off)
+
+class VerifySignaturesTests(ClubTestCase):
+    """verify_signatures recomputes hashes and names the fields changed since sign-off"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_students(3)
+        self.client.post(reverse('sign_off_queue'), {
+            'record_ids': list(TrainingRecord.objects.values_list('pk', flat=True)),
+        })
+
+    def verify(self, *args):
+        out = StringIO()
+        call_command('verify_signatures', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_tampered_fields(self):
+        self.assertIn('Checked 9 signed records', self.verify('--workers', '2', '--chunk-size', '2'))
+
+        record = TrainingRecord.objects.order_by('pk').first()
+        TrainingRecord.objects.filter(pk=record.pk).update(flight_duration=timedelta(hours=2))
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 signature mismatch'):
+            call_command('verify_signatures', '--workers', '1', stdout=out)
+        self.assertIn(f"record {record.pk}: flight_duration: '0:20:00' -> '2:00:00'", out.getvalue())
+
+    def test_names_fields_of_records_signed_one_by_one(self):
+        self.add_students(1, records_each=1)
+        record = TrainingRecord.objects.get(student__username='student4')
+        self.assertTrue(record.sign(self.instructor))
+        TrainingRecord.objects.filter(pk=record.pk).update(date=record.date - timedelta(days=1))
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 signature mismatch'):
+            call_command('verify_signatures', '--workers', '1', stdout=out)
+        self.assertIn(f"record {record.pk}: date: '{record.date}' -> '{record.date - timedelta(days=1)}'", out.getvalue())
+
+        # An amendment re-signs the record and snapshots it again
+        record.refresh_from_db()
+        record.glider = Glider.objects.create(tail_number='4X-GBB', model='Duo Discus', manufacturer='Schempp-Hirth')
+        record.save()
+        self.assertTrue(record.amend_signature())
+        TrainingRecord.objects.filter(pk=record.pk).update(glider=self.glider)
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 signature mismatch'):
+            call_command('verify_signatures', '--workers', '1', stdout=out)
+        self.assertIn(f"record {record.pk}: glider_id: '{record.glider_id}' -> '{self.glider.pk}'", out.getvalue())
+
+    def test_incremental_checks_only_updated_records(self):
+        self.verify('--workers', '1')
+        checkpoint = JobCheckpoint.objects.get(name='verify_signatures')
+        self.assertIsNotNone(checkpoint.watermark)
+
+        # Everything was saved within the overlap window, so move the watermark past it
+        JobCheckpoint.objects.filter(pk=checkpoint.pk).update(watermark=timezone.now())
+        record = TrainingRecord.objects.first()
+        record.instructor_comments = 'Nice landing'
+        record.save()
+        self.assertIn('Checked 1 signed records', self.verify('--incremental', '--workers', '1'))
+
+class SignatureLedgerTests(ClubTestCase):
+    """Sign-offs chain into a per-student ledger that verifies from its checkpoints"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_students(1, records_each=40)
+        self.student = User.objects.get(username='student1')
+        records = list(self.student.student_records.order_by('date'))
+        # 35 in one batch from the queue, then the rest one by one
+        self.client.post(reverse('sign_off_queue'), {'record_ids': [record.pk for record in records[:35]]})
+        for record in records[35:]:
+            record.sign(self.instructor)
+
+    def test_chain_and_checkpoints(self):
+        self.assertEqual(SignatureLedgerEntry.objects.filter(student=self.student).count(), 40)
+        self.assertEqual(list(SignatureCheckpoint.objects.values_list('sequence', flat=True)), [32])
+        self.assertTrue(ledger.verify(self.student.pk).ok)
+
+        # A range reads only up to the surrounding checkpoints
+        result = ledger.verify(self.student.pk, first=36, last=38)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.entries_checked, 8)
+
+        # Exports carry each record's ledger entry hash, the latest being the head
+        response = self.client.get(reverse('export_student_records', args=[self.student.pk, 'csv']))
+        self.assertIn(ledger.head(self.student.pk).entry_hash, response.content.decode())
+
+    def test_detects_rewrites(self):
+        entry = SignatureLedgerEntry.objects.get(student=self.student, sequence=10)
+        record = TrainingRecord.objects.get(pk=entry.record_id)
+        TrainingRecord.objects.filter(pk=record.pk).update(date=record.date - timedelta(days=1))
+        self.assertIn(f'record {record.pk} was changed after entry #10', ledger.verify(self.student.pk).problems)
+
+        # Re-signing the record in place breaks the chain
+        SignatureLedgerEntry.objects.filter(pk=entry.pk).update(signature_hash='0' * 64)
+        result = ledger.verify(self.student.pk, first=5, last=12)
+        self.assertIn('entry #10 does not chain to the entry before it', result.problems)
+        with self.assertRaises(CommandError):
+            call_command('verify_ledger', stdout=StringIO())
+
+    def test_amendment_re_signs(self):
+        record = self.student.student_records.order_by('date').last()
+        record.field = 'Sde Teiman'
+        record.date = record.date - timedelta(days=1)
+        record.save()
+        self.assertTrue(record.amend_signature())
+        self.assertEqual(ledger.head(self.student.pk).kind, 'amendment')
+        self.assertTrue(ledger.verify(self.student.pk).ok)
+
+    def test_backfill(self):
+        SignatureLedgerEntry.objects.all().delete()
+        SignatureCheckpoint.objects.all().delete()
+        out = StringIO()
+        call_command('verify_ledger', '--backfill', stdout=out)
+        self.assertIn('Added 40 ledger entries', out.getvalue())
+        self.assertIn('All ledgers verified', out.getvalue())
+
+class DirtyFieldsTests(ClubTestCase):
+    """Saves write only the changed columns, and side effects follow only real changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_students(1, records_each=1)
+        self.record = TrainingRecord.objects.get()
+
+    def record_updates(self, func):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        return [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('UPDATE "training_records_trainingrecord"')]
+
+    def test_save_writes_changed_fields_only(self):
+        with self.assertNumQueries(0):
+            self.record.save()
+
+        self.record.instructor_comments = 'Good lookout'
+        updates = self.record_updates(self.record.save)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"instructor_comments"', updates[0])
+        self.assertIn('"updated_at"', updates[0])
+        self.assertNotIn('"field"', updates[0])
+        self.assertEqual(self.record.get_dirty_fields(), {})
+
+        updates = self.record_updates(lambda: self.record.sign(self.instructor))
+        self.assertNotIn('"instructor_comments"', updates[0])
+        self.assertIn('"signature_hash"', updates[0])
+
+    def test_briefing_sign_off_writes_sign_off_fields(self):
+        topic = GroundBriefingTopic.objects.create(number=1, name='Lookout')
+        briefing = GroundBriefing.objects.create(student=self.record.student, topic=topic, date=date.today())
+        briefing = GroundBriefing.objects.get(pk=briefing.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            briefing.sign_off(self.instructor)
+        updates = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('UPDATE "training_records_groundbriefing"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"sign_off_date"', updates[0])
+        self.assertNotIn('"notes"', updates[0])
+
+    def test_audit_logs_changed_fields(self):
+        data = {
+            'date': self.record.date.isoformat(), 'glider': self.glider.pk, 'training_topic': self.topic.pk,
+            'field': self.record.field, 'tow_height': '', 'student_comments': '', 'instructor_comments': '',
+            'duration_display': '0:20', 'action': 'save_only',
+        }
+        # setUp created the record outside a request, which logged it without a user
+        updates = AuditLog.objects.filter(action='UPDATE')
+        self.client.post(reverse('sign_record', args=[self.record.pk]), data)
+        self.assertFalse(updates.exists())
+
+        self.client.post(reverse('sign_record', args=[self.record.pk]), {**data, 'field': 'Sde Teiman'})
+        log = updates.get()
+        self.assertEqual(log.user, self.instructor)
+        self.assertEqual(log.old_values, {'field': 'Megiddo'})
+        self.assertEqual(log.new_values, {'field': 'Sde Teiman'})
+
+    def test_audit_outside_a_request_has_no_user(self):
+        User.objects.create_superuser(username='admin', password='pass', user_type='admin')
+        self.record.field = 'Sde Teiman'
+        self.record.save()
+        log = AuditLog.objects.get(action='UPDATE')
+        self.assertIsNone(log.user)
+        self.assertEqual(log.record_id, self.record.pk)
+        self.assertEqual(log.new_values, {'field': 'Sde Teiman'})
+
+    def test_unchanged_sign_record_keeps_notification(self):
+        notification = PendingNotification.objects.create(
+            user=self.record.student, training_record=self.record, notification_type='student_revision_needed',
+            is_sent=True,
+        )
+        data = {
+            'date': self.record.date.isoformat(), 'glider': self.glider.pk, 'training_topic': self.topic.pk,
+            'field': self.record.field, 'tow_height': '', 'student_comments': '', 'instructor_comments': '',
+            'duration_display': '0:20', 'action': 'save_only',
+        }
+        self.client.post(reverse('sign_record', args=[self.record.pk]), data)
+        notification.refresh_from_db()
+        self.assertTrue(notification.is_sent)
+
+        self.client.post(reverse('sign_record', args=[self.record.pk]), {**data, 'instructor_comments': 'Watch speed'})
+        notification.refresh_from_db()
+        self.assertFalse(notification.is_sent)
+
+class CheckIntegrityTests(ClubTestCase):
+    """check_integrity finds and repairs inconsistent rows, resuming from its checkpoint"""
+
+    def setUp(self):
+        super().setUp()
+        # Only the exercise add_students() records a performance for
+        Exercise.objects.exclude(pk=self.exercise.pk).delete()
+        self.add_students(2, records_each=3)
+        self.record = TrainingRecord.objects.order_by('pk').first()
+        self.record.exercise_performances.all().delete()
+        topic = GroundBriefingTopic.objects.create(number=1, name='Lookout')
+        self.briefing = GroundBriefing.objects.create(
+            student=self.record.student, topic=topic, date=date.today(), signed_off=True, sign_off_date=date.today(),
+        )
+        PendingNotification.objects.create(user=self.record.student, notification_type='student_revision_needed')
+
+    def check_integrity(self, *args):
+        out = StringIO()
+        call_command('check_integrity', '--chunk-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_then_repairs(self):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '3 problem(s) found'):
+            call_command('check_integrity', '--chunk-size', '2', stdout=out)
+        self.assertIn(f'training record {self.record.pk}: no performance for exercise(s) {self.exercise.pk}', out.getvalue())
+        self.assertIn(f'ground briefing {self.briefing.pk}', out.getvalue())
+        self.assertIn('student_revision_needed notification', out.getvalue())
+
+        self.check_integrity('--repair')
+        performance = ExercisePerformance.objects.get(training_record=self.record)
+        # The record's exercises say it was flown
+        self.assertEqual(performance.performance, 'performed_well')
+        self.briefing.refresh_from_db()
+        self.assertFalse(self.briefing.signed_off)
+        self.assertFalse(PendingNotification.objects.exists())
+        self.assertIn('No unrepaired problems', self.check_integrity())
+
+    def test_resumes_from_checkpoint(self):
+        last = TrainingRecord.objects.order_by('pk').last()
+        last.exercise_performances.all().delete()
+        JobCheckpoint.objects.create(
+            name='check_integrity.exercise_performances', position=self.record.pk,
+            data={'found': 0, 'repaired': 0, 'finished': False},
+        )
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 problem(s) found'):
+            call_command('check_integrity', '--check', 'exercise_performances', stdout=out)
+        self.assertIn(f'resuming after id {self.record.pk}', out.getvalue())
+        self.assertNotIn(f'training record {self.record.pk}:', out.getvalue())
+
+        # A finished run starts over
+        with self.assertRaisesMessage(CommandError, '2 problem(s) found'):
+            call_command('check_integrity', '--check', 'exercise_performances', stdout=StringIO())
+
+class BackfillTests(ClubTestCase):
+    """Backfills run in chunks from the command or a migration and resume from their checkpoint"""
+
+    def setUp(self):
+        super().setUp()
+        Exercise.objects.exclude(pk=self.exercise.pk).delete()
+        self.add_students(2, records_each=3)
+        ExercisePerformance.objects.all().delete()
+
+    def test_command_backfills_and_resumes(self):
+        records = list(TrainingRecord.objects.order_by('pk').values_list('pk', flat=True))
+        JobCheckpoint.objects.create(
+            name='backfill.exercise_performances', position=records[3], data={'rows': 4, 'finished': False},
+        )
+        out = StringIO()
+        call_command('backfill', 'exercise_performances', '--chunk-size', '2', '--sleep', '0', stdout=out)
+        self.assertIn(f'resuming after id {records[3]}', out.getvalue())
+        self.assertEqual(
+            sorted(ExercisePerformance.objects.values_list('training_record_id', flat=True)), records[4:]
+        )
+
+        # The finished run starts over; existing performances are kept
+        call_command('backfill', 'exercise_performances', '--chunk-size', '4', stdout=StringIO())
+        self.assertEqual(ExercisePerformance.objects.count(), 6)
+        self.assertEqual(set(ExercisePerformance.objects.values_list('performance', flat=True)), {'performed_well'})
+        self.assertEqual(JobCheckpoint.objects.get(name='backfill.exercise_performances').data, {'rows': 6, 'finished': True})
+
+    def test_runs_with_migration_state(self):
+        from django.db.migrations.loader import MigrationLoader
+        state = MigrationLoader(connection).project_state(('training_records', '0008_populate_exercise_performances'))
+        # That state has no progress table, so nothing is checkpointed
+        self.assertEqual(backfill.run('exercise_performances', state.apps, chunk_size=4), 6)
+        self.assertEqual(ExercisePerformance.objects.count(), 6)
+        self.assertFalse(JobCheckpoint.objects.filter(name__startswith='backfill.').exists())
+
+class CatalogueImportTests(ClubTestCase):
+    """Catalogue workbooks are validated as a whole and upserted by natural key"""
+
+    def write_workbook(self, rows):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        path = os.path.join(tempfile.mkdtemp(), 'briefings.xlsx')
+        workbook.save(path)
+        return path
+
+    def import_briefings(self, rows, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_ground_briefings', self.write_workbook(rows), *args, stdout=out, stderr=err)
+        return out.getvalue() + err.getvalue()
+
+    def test_dry_run_then_upsert(self):
+        GroundBriefingTopic.objects.create(number=1, name='Weather', details='Fronts')
+        rows = [('number', 'name', 'details'), (1, 'Weather', 'Fronts and sea breeze'), (2, 'Launch', None)]
+
+        output = self.import_briefings(rows, '--dry-run')
+        self.assertIn("~ 1 details: 'Fronts' -> 'Fronts and sea breeze'", output)
+        self.assertIn('+ 2', output)
+        self.assertEqual(GroundBriefingTopic.objects.count(), 1)
+
+        self.assertIn('1 new, 1 changed, 0 unchanged', self.import_briefings(rows))
+        self.assertEqual(
+            list(GroundBriefingTopic.objects.values_list('number', 'name', 'details')),
+            [(1, 'Weather', 'Fronts and sea breeze'), (2, 'Launch', '')],
+        )
+        self.assertIn('0 new, 0 changed, 2 unchanged', self.import_briefings(rows))
+
+    def test_invalid_rows_write_nothing(self):
+        output = self.import_briefings([
+            ('number', 'name', 'details'), (1, 'Weather', ''), ('two', 'Launch', ''), (1, 'Again', ''), (3, None, ''),
+        ])
+        self.assertIn("row 3: number 'two' is not a whole number", output)
+        self.assertIn('row 4: duplicate number 1', output)
+        self.assertIn('row 5: name is empty', output)
+        self.assertFalse(GroundBriefingTopic.objects.exists())
+
+        self.assertIn('missing column(s) name', self.import_briefings([('number', 'details'), (1, '')]))
+
+    def test_unnumbered_exercises_may_share_a_category(self):
+        from django.db import IntegrityError, transaction
+        Exercise.objects.create(name='Aerotow emergencies', description='', category='pre-solo')
+        Exercise.objects.create(name='Winch launch', description='', category='pre-solo')
+        Exercise.objects.create(name='Spins', description='', category='pre-solo', number='X1')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Exercise.objects.create(name='Spirals', description='', category='pre-solo', number='X1')
+
+    def test_migration_relabels_duplicates(self):
+        import importlib
+        from django.apps import apps
+        migration = importlib.import_module('training_records.migrations.0020_catalogue_natural_keys')
+        with connection.schema_editor() as schema_editor:
+            schema_editor.remove_constraint(Exercise, Exercise._meta.constraints[0])
+        first = Exercise.objects.create(name='Spins', description='', category='pre-solo', number='X1')
+        second = Exercise.objects.create(name='Spirals', description='', category='pre-solo', number='X1')
+        unnumbered = [
+            Exercise.objects.create(name=name, description='', category='pre-solo') for name in ('A', 'B')
+        ]
+
+        with self.assertLogs(migration.__name__, 'WARNING') as logs:
+            migration.resolve_duplicates(apps, None)
+        self.assertIn(f'Exercise {second.pk}: duplicate pre-solo/X1 renamed to pre-solo/X1-2', logs.output[0])
+        self.assertEqual(Exercise.objects.get(pk=first.pk).number, 'X1')
+        self.assertEqual(Exercise.objects.get(pk=second.pk).number, 'X1-2')
+        self.assertEqual({Exercise.objects.get(pk=e.pk).number for e in unnumbered}, {''})
+
+    def test_initial_data_dry_run_against_imported_catalogue(self):
+        out = StringIO()
+        call_command('import_initial_data', '--force', '--dry-run', stdout=out)
+        self.assertIn(f'TrainingTopic: 0 new, 0 changed, {TrainingTopic.objects.count() - 1} unchanged, 1 not in the file', out.getvalue())
+        self.assertIn('Exercise: 0 new, 0 changed', out.getvalue())
+
+    def copy_data_dir(self):
+        import shutil
+        base_dir = tempfile.mkdtemp()
+        shutil.copytree(os.path.join(settings.BASE_DIR, 'data'), os.path.join(base_dir, 'data'))
+        return base_dir
+
+    def append_topic(self, base_dir, name):
+        from openpyxl import load_workbook
+        path = os.path.join(base_dir, 'data', 'training_topics.xlsx')
+        workbook = load_workbook(path)
+        header = [cell.value for cell in workbook.active[1]]
+        workbook.active.append([name if column == 'name' else None for column in header])
+        workbook.save(path)
+
+    def test_unchanged_workbooks_are_not_read(self):
+        # migrate already synced the shipped workbooks
+        with CaptureQueriesContext(connection) as queries:
+            result = catalogue_import.sync()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(result.unchanged, list(catalogue_import.SYNCED_SHEETS))
+        self.assertFalse(result.applied or result.baseline)
+
+        out = StringIO()
+        call_command('import_initial_data', stdout=out)
+        self.assertIn('Catalogue workbooks unchanged since the last import', out.getvalue())
+
+    def test_changed_workbook_is_imported_alone(self):
+        base_dir = self.copy_data_dir()
+        self.append_topic(base_dir, 'Field landings')
+        with override_settings(BASE_DIR=base_dir):
+            self.assertIn('Would import TrainingTopic: 1 new', self.call_initial_data('--dry-run'))
+            self.assertFalse(TrainingTopic.objects.filter(name='Field landings').exists())
+
+            result = catalogue_import.sync()
+            self.assertEqual(result.unchanged, ['exercises'])
+            self.assertEqual([d.sheet.model for d in result.applied], ['TrainingTopic'])
+            self.assertTrue(TrainingTopic.objects.filter(name='Field landings').exists())
+            self.assertFalse(catalogue_import.sync().applied)
+
+    def test_first_sync_of_populated_table_keeps_changed_rows(self):
+        JobCheckpoint.objects.filter(name=catalogue_import.CHECKPOINT_NAME).delete()
+        # Circuits is not in the file
+        TrainingTopic.objects.filter(name='Circuits').delete()
+        removed = TrainingTopic.objects.order_by('pk').first()
+        removed.delete()
+        TrainingTopic.objects.update(description='Edited by hand')
+        edited = TrainingTopic.objects.count()
+
+        output = self.call_initial_data()
+        self.assertIn('TrainingTopic already has data: 1 new row(s)', output)
+        self.assertIn(f'but {edited} row(s) that differ from the file were kept', output)
+        self.assertIn('run import_initial_data --force', output)
+        # New rows are added; the edited ones are left alone
+        self.assertEqual(TrainingTopic.objects.get(name=removed.name).description, removed.description)
+        self.assertEqual(
+            set(TrainingTopic.objects.exclude(name=removed.name).values_list('description', flat=True)),
+            {'Edited by hand'},
+        )
+        self.assertEqual(
+            set(JobCheckpoint.load(catalogue_import.CHECKPOINT_NAME).data['checksums']),
+            set(catalogue_import.SYNCED_SHEETS),
+        )
+        self.assertIn('Catalogue workbooks unchanged', self.call_initial_data())
+
+        self.assertIn('Imported TrainingTopic: 0 new', self.call_initial_data('--force'))
+        self.assertNotIn('Edited by hand', TrainingTopic.objects.values_list('description', flat=True))
+
+    def test_first_sync_of_matching_table_is_quiet(self):
+        JobCheckpoint.objects.filter(name=catalogue_import.CHECKPOINT_NAME).delete()
+        result = catalogue_import.sync()
+        self.assertFalse(result.baseline or any(result.applied))
+        self.assertEqual(catalogue_import.sync().unchanged, list(catalogue_import.SYNCED_SHEETS))
+
+    def call_initial_data(self, *args):
+        out = StringIO()
+        call_command('import_initial_data', *args, stdout=out)
+        return out.getvalue()
+
+class FastBootTests(ClubTestCase):
+    """fast_boot skips migrate and collectstatic when they have nothing to do"""
+
+    def fast_boot(self, *args):
+        out = StringIO()
+        call_command('fast_boot', *args, stdout=out)
+        return out.getvalue()
+
+    def test_migrated_database_is_not_migrated_again(self):
+        from .services import boot
+        self.assertEqual(boot.pending_migrations(), [])
+        with self.settings(STATIC_ROOT=tempfile.mkdtemp()):
+            output = self.fast_boot()
+        self.assertIn('migrations: up to date', output)
+        self.assertIn('catalogue: done', output)
+        self.assertIn('Boot finished in', output)
+
+    def test_static_files_are_collected_once(self):
+        from .services import boot
+        with self.settings(STATIC_ROOT=tempfile.mkdtemp()):
+            output = self.fast_boot('--static-only')
+            self.assertIn('static files: collected', output)
+            self.assertNotIn('migrations', output)
+            self.assertTrue(os.path.exists(os.path.join(settings.STATIC_ROOT, 'css', 'style.css')))
+            self.assertEqual(boot.collected_fingerprint(), boot.static_fingerprint())
+
+            self.assertIn('static files: unchanged', self.fast_boot('--static-only'))
+
+            source = tempfile.mkdtemp()
+            with open(os.path.join(source, 'extra.css'), 'w') as extra:
+                extra.write('body {}')
+            with self.settings(STATICFILES_DIRS=[*settings.STATICFILES_DIRS, source]):
+                self.assertIn('static files: collected', self.fast_boot('--static-only'))
+            self.assertTrue(os.path.exists(os.path.join(settings.STATIC_ROOT, 'extra.css')))
+
+    def test_migrate_lock_is_held_while_migrating(self):
+        from .services import boot
+
+        def held():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND objid = %s",
+                    [boot.MIGRATE_LOCK_ID],
+                )
+                return cursor.fetchone()[0]
+
+        with boot.migrate_lock():
+            self.assertEqual(held(), 1)
+        self.assertEqual(held(), 0)
+
+class MetricsTests(ClubTestCase):
+    """Metric labels stay within a known set whatever the client sends"""
+
+    def export_count(self, format_type):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value('export_duration_seconds_count', {'format': format_type}) or 0
+
+    def test_export_format_labels_are_bounded(self):
+        from .services import metrics
+        before = {name: self.export_count(name) for name in ('csv', 'other')}
+        for requested in ('CSV', '../../etc', 'x' * 200):
+            with metrics.track_export(requested):
+                pass
+        self.assertEqual(self.export_count('csv'), before['csv'] + 1)
+        self.assertEqual(self.export_count('other'), before['other'] + 2)
+        self.assertEqual(self.export_count('x' * 200), 0)
+
+    def test_db_pool_stats_without_a_pool(self):
+        from prometheus_client import REGISTRY
+        from .services import metrics
+        self.assertNotIn('pool', settings.DATABASES['default'].get('OPTIONS', {}))
+        self.assertIsNone(metrics.get_db_pool_stats())
+        metrics.update_db_pool_gauges()
+        self.assertIsNone(REGISTRY.get_sample_value('db_pool_connections_in_use', {'alias': 'default'}))
+
+        with override_settings(METRICS_TOKEN='scrape'):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'db_pool_connections_in_use{', response.content)
+
+    def test_metrics_need_the_token_or_an_allowed_address(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            # The forwarded address is the client's to choose
+            response = self.client.get('/metrics/', HTTP_X_FORWARDED_FOR='10.0.0.5')
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.5').status_code, 200)
+            self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.6').status_code, 403)
+
+    def test_pool_checks_connections_on_checkout(self):
+        import runpy
+        from django.db.utils import ConnectionHandler
+        from psycopg_pool import ConnectionPool
+        os.environ['DATABASE_POOL'] = 'true'
+        try:
+            configured = runpy.run_path(os.path.join(settings.BASE_DIR, 'gliding_club', 'settings.py'))
+        finally:
+            del os.environ['DATABASE_POOL']
+        self.assertTrue(configured['DATABASES']['default']['CONN_HEALTH_CHECKS'])
+
+        pooled = configured['DATABASES']['default']
+        wrapper = ConnectionHandler({'default': pooled, 'pool_check': pooled})['pool_check']
+        self.addCleanup(wrapper._connection_pools.pop, 'pool_check', None)
+        # Not opened, so no connection is made
+        self.assertIs(wrapper.pool._check, ConnectionPool.check_connection)
+
+    def test_export_view_labels_what_it_exported(self):
+        self.add_students(1, records_each=1)
+        student = User.objects.get(username='student1')
+        before = self.export_count('csv')
+        response = self.client.get(reverse('export_student_records', args=[student.pk, 'Csv']))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(self.export_count('csv'), before + 1)
+        self.assertEqual(self.export_count('Csv'), 0)
+
+class SQLCommentTests(ClubTestCase):
+    """Statements carry the view (and, if enabled, the request id) that issued them, safely escaped"""
+
+    def capture_sql(self, func):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append(sql)
+            return execute(sql, params, many, context)
+
+        # Runs inside the tagging wrapper, so it sees the statements as sent
+        with connection.execute_wrapper(record):
+            result = func()
+        return result, statements
+
+    def test_requests_tag_their_statements(self):
+        from . import sqlcomment
+        response, statements = self.capture_sql(
+            lambda: self.client.get(reverse('instructor_dashboard'), HTTP_X_REQUEST_ID='req-42')
+        )
+        self.assertEqual(response['X-Request-ID'], 'req-42')
+        tags = sqlcomment.parse_comment(statements[-1])
+        self.assertEqual(tags['url_name'], 'instructor_dashboard')
+        self.assertEqual(tags['view'], 'training_records.views.instructor.instructor_dashboard')
+        # Unique per request, so only when asked for
+        self.assertNotIn('request_id', tags)
+        with override_settings(SQL_COMMENT_REQUEST_ID=True):
+            _, statements = self.capture_sql(
+                lambda: self.client.get(reverse('instructor_dashboard'), HTTP_X_REQUEST_ID='req-42')
+            )
+        self.assertEqual(sqlcomment.parse_comment(statements[-1])['request_id'], 'req-42')
+
+        # Outside a request only the command (if any) is tagged
+        _, statements = self.capture_sql(lambda: list(User.objects.all()))
+        self.assertNotIn('request_id', sqlcomment.parse_comment(statements[0]))
+
+    @override_settings(SQL_COMMENT_REQUEST_ID=True)
+    def test_unsafe_request_id_is_replaced(self):
+        response, statements = self.capture_sql(
+            lambda: self.client.get(reverse('instructor_dashboard'), HTTP_X_REQUEST_ID="x'*/; DROP TABLE x --")
+        )
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+        self.assertTrue(all('DROP' not in sql for sql in statements))
+
+    def test_tag_values_are_escaped(self):
+        from . import sqlcomment
+        comment = sqlcomment.format_comment({'view': "a'b*/c%d e", 'url_name': '', 'command': 'digest'})
+        self.assertEqual(comment, "/*command='digest',view='a_b__c_d_e'*/")
+        self.assertEqual(
+            sqlcomment.parse_comment(f'SELECT 1 {comment}'), {'command': 'digest', 'view': 'a_b__c_d_e'},
+        )
+        self.assertEqual(sqlcomment.format_comment({'view': ''}), '')
+        self.assertEqual(sqlcomment.parse_comment('SELECT 1'), {})
+
+class ProbeTests(ClubTestCase):
+    """Probes are answered ahead of the middleware stack, and /health/ is cached per worker"""
+
+    def setUp(self):
+        super().setUp()
+        from gliding_club import health
+        self.health = health
+        health._health_cache = None
+        self.client.logout()
+
+    def test_live_does_no_work(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/live/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'ok')
+        # Session, CSP and the rest of the stack were skipped
+        self.assertNotIn('Content-Security-Policy', response)
+        self.assertFalse(response.cookies)
+        self.assertEqual(self.client.get('/live').status_code, 200)
+
+    def test_ready(self):
+        response = self.client.get('/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ready')
+
+    def test_health_is_cached(self):
+        response = self.client.get('/health/')
+        self.assertIn(response.status_code, (200, 503))
+        self.assertIn('database', response.json()['checks'])
+        with self.assertNumQueries(0):
+            cached = self.client.get('/health/')
+        self.assertEqual(cached.json(), response.json())
+
+        # Once the result expires the checks run again
+        self.health._health_cache = None
+        with self.settings(HEALTH_CHECK_CACHE_TTL=0):
+            first = self.client.get('/health/').json()
+            second = self.client.get('/health/').json()
+        self.assertEqual(second['cache_ttl_seconds'], 0)
+        self.assertNotEqual(second['timestamp'], first['timestamp'])
+
+class ReplicaRoutingTests(ClubTestCase):
+    """Reads from read-only views go to the replica unless the user just wrote something"""
+
+    def route(self, method, url_name, cookies=None):
+        """Run a request through ReplicaRoutingMiddleware; returns (read alias in the view, response)"""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from django.urls import resolve
+        from .middleware import ReplicaRoutingMiddleware
+        from .routers import ReplicaRouter
+
+        routed = []
+
+        def view(request):
+            routed.append(ReplicaRouter().db_for_read(TrainingRecord))
+            return HttpResponse()
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        # The test database has no replica alias
+        middleware.enabled = True
+        request = getattr(RequestFactory(), method)(reverse(url_name))
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(request.path_info)
+        response = middleware(request)
+        return routed[0], response
+
+    def test_router(self):
+        from . import routers
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(TrainingRecord))
+        token = routers.use_replica()
+        try:
+            self.assertEqual(router.db_for_read(TrainingRecord), 'replica')
+            self.assertEqual(router.db_for_write(TrainingRecord), 'default')
+        finally:
+            routers.reset(token)
+        self.assertIsNone(router.db_for_read(TrainingRecord))
+        self.assertTrue(router.allow_migrate('default', 'training_records'))
+        self.assertFalse(router.allow_migrate('replica', 'training_records'))
+
+    def test_read_views_use_the_replica_until_a_write(self):
+        from .middleware import ReplicaRoutingMiddleware
+        from .routers import ReplicaRouter
+        alias, response = self.route('get', 'record_list')
+        self.assertEqual(alias, 'replica')
+        self.assertNotIn(ReplicaRoutingMiddleware.PIN_COOKIE, response.cookies)
+        # Routing ends with the request
+        self.assertIsNone(ReplicaRouter().db_for_read(TrainingRecord))
+
+        # Views that are not listed, and writes, stay on the primary
+        self.assertIsNone(self.route('get', 'ground_briefing_list')[0])
+        alias, response = self.route('post', 'record_list')
+        self.assertIsNone(alias)
+        pin = response.cookies[ReplicaRoutingMiddleware.PIN_COOKIE]
+        self.assertTrue(pin['httponly'])
+
+        # The pin keeps the user's reads on the primary until it expires
+        self.assertIsNone(self.route('get', 'record_list', {pin.key: pin.value})[0])
+        expired = str(int(time.time()) - 1)
+        self.assertEqual(self.route('get', 'record_list', {pin.key: expired})[0], 'replica')
+        self.assertEqual(self.route('get', 'record_list', {pin.key: 'garbage'})[0], 'replica')
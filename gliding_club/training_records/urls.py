@@ -28,15 +28,18 @@ urlpatterns = [
     
     # Sign-off functionality
     path('records/<int:pk>/sign/', instructor.sign_record, name='sign_record'),
+    path('records/sign-off-queue/', instructor.sign_off_queue, name='sign_off_queue'),
 
     #insctructor specific urls
     path('instructor/flights/', instructor.instructor_flight_history, name='instructor_flight_history'),
 
     path('students/lookup/', instructor.student_lookup, name='student_lookup'),
+    path('students/search/', instructor.student_search, name='student_search'),
     path('students/<int:student_id>/history/', instructor.student_history, name='student_history'),
     path('students/<int:student_id>/export/<str:format>/', exports.export_student_records, name='export_student_records'),
     path('ground-briefings/', ground_briefings.GroundBriefingListView.as_view(), name='ground_briefing_list'),
     path('ground-briefings/create/', ground_briefings.GroundBriefingCreateView.as_view(), name='ground_briefing_create'),
     path('ground-briefings/<int:pk>/sign-off/', ground_briefings.ground_briefing_sign_off, name='ground_briefing_sign_off'),
+    path('ground-briefings/sign-off-session/', ground_briefings.ground_briefing_session_sign_off, name='ground_briefing_session_sign_off'),
     path('ground-briefings/student/', ground_briefings.student_ground_briefings, name='student_ground_briefings'),
 ]
\ No newline at end of file
@@ -27,8 +27,10 @@ from .student import (
 from .instructor import (
     instructor_dashboard,
     sign_record,
+    sign_off_queue,
     student_history,
     student_lookup,
+    student_search,
     instructor_flight_history,
     
 )
@@ -55,6 +57,7 @@ from .ground_briefings import (
     GroundBriefingListView,
     GroundBriefingCreateView,
     ground_briefing_sign_off,
+    ground_briefing_session_sign_off,
     student_ground_briefings
 )
 
@@ -66,8 +69,10 @@ __all__ = [
     'student_dashboard', 
     'instructor_dashboard',
     'sign_record',
+    'sign_off_queue',
     'student_history',
     'student_lookup',
+    'student_search',
     'TrainingRecordListView',
     'TrainingRecordDetailView', 
     'TrainingRecordCreateView',
@@ -78,6 +83,7 @@ __all__ = [
     'first_login_password_change',
     'export_student_records',
     'ground_briefing_sign_off',
+    'ground_briefing_session_sign_off',
     'student_ground_briefings',
     'GroundBriefingListView',
     'GroundBriefingCreateView'
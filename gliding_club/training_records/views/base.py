@@ -1,8 +1,22 @@
 # training_records/views/base.py
+import hashlib
+from functools import wraps
+
 from django.shortcuts import redirect
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.db import router
+from django.db.models import Count, Max
 from django.http import HttpResponseForbidden
+from django.middleware.csrf import get_token
+from django.utils import timezone, translation
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from ..models import CacheVersion, TrainingRecord, GroundBriefing
+from ..services import fragment_cache
+from ..services.catalogue import get_catalogue
 
 class StudentRequiredMixin(UserPassesTestMixin):
     def test_func(self):
@@ -20,4 +34,95 @@ def dashboard(request):
     elif request.user.is_student():
         return redirect('student_dashboard')
     else:
-        return redirect('admin:index')  # Fallback to admin
\ No newline at end of file
+        return redirect('admin:index')  # Fallback to admin
+
+def page_validators(request, last_modified, counters=(), parts=()):
+    """
+    ETag and Last-Modified for a page built from data last changed at last_modified.
+
+    The ETag also covers the viewer's permission scope, the language, the CSRF secret
+    embedded in forms, the reference data catalogue and the given version counters
+    (see services.fragment_cache), plus any other parts the page depends on. Those
+    change without moving last_modified, so only the ETag decides a 304.
+    """
+    user = request.user
+    get_token(request)  # makes sure the CSRF secret exists, so the page rendered next uses the same one
+    versions = CacheVersion.get_versions(counters, using=router.db_for_read(CacheVersion)) if counters else {}
+    digest = hashlib.md5(':'.join(str(part) for part in (
+        user.pk, user.user_type, user.is_superuser,
+        translation.get_language(),
+        request.META.get('CSRF_COOKIE', ''),
+        get_catalogue().version,
+        last_modified.isoformat() if last_modified else '',
+        *(f'{name}={version}' for name, version in sorted(versions.items())),
+        *parts,
+    )).encode()).hexdigest()
+    # Weak: the body is equivalent, not byte-identical (CSP nonces and CSRF masks differ)
+    return f'W/"{digest}"', last_modified
+
+def student_page_validators(request, student_id, parts=()):
+    """Validators for pages built from all of a student's records and ground briefings"""
+    records = TrainingRecord.objects.filter(student_id=student_id).aggregate(
+        last_modified=Max('updated_at'), count=Count('id'),
+    )
+    briefings = GroundBriefing.objects.filter(student_id=student_id).aggregate(
+        last_modified=Max('updated_at'), count=Count('id'),
+    )
+    # Counts catch deletions, which do not move the latest updated_at
+    last_modified = max(filter(None, [records['last_modified'], briefings['last_modified']]), default=None)
+    return page_validators(
+        request, last_modified,
+        counters=[fragment_cache.student_counter(student_id)],
+        parts=[records['count'], briefings['count'], *parts],
+    )
+
+def conditional_response(request, get_validators, render):
+    """
+    Return 304 Not Modified when the client's copy is current, else render().
+    The validators are only computed for authenticated GET and HEAD requests.
+    """
+    # Pending messages must be shown by a fresh render, not hidden behind a 304
+    if (request.method not in ('GET', 'HEAD') or not request.user.is_authenticated
+            or len(messages.get_messages(request))):
+        return render()
+    validators = get_validators()
+    if validators is None:
+        return render()
+
+    etag, last_modified = validators
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    # Last-Modified is sent for information only: a client sending just If-Modified-Since
+    # would get a 304 after a counter, catalogue, permission or language change
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        # Keep the cached page's CSP header: its nonces are the ones in the cached body
+        response._csp_exempt = True
+    else:
+        response = render()
+        if response.status_code != 200:
+            return response
+        response.headers.setdefault('ETag', etag)
+        if timestamp is not None:
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+    # Private pages: browsers may keep them but must revalidate before every use
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def conditional_page(get_validators):
+    """
+    Answer GET requests with 304 Not Modified when the client's copy is current,
+    before the view does any template or PDF work.
+
+    get_validators(request, *args, **kwargs) returns (etag, last_modified) from
+    page_validators(), or None to always run the view (missing objects, no permission).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return conditional_response(
+                request,
+                lambda: get_validators(request, *args, **kwargs),
+                lambda: view(request, *args, **kwargs),
+            )
+        return wrapper
+    return decorator
@@ -16,10 +16,20 @@ from datetime import datetime
 from weasyprint import HTML, CSS
 
 from ..models import TrainingRecord, User, Exercise, ExercisePerformance, GroundBriefing
+from ..services import ledger, metrics
+from ..services.catalogue import get_catalogue
+from .base import conditional_page, student_page_validators
 
 logger = logging.getLogger(__name__)
 
+def _export_validators(request, student_id, format='pdf'):
+    if not (request.user.is_instructor() or request.user.id == int(student_id)):
+        return None
+    # Exports show the date they were generated on
+    return student_page_validators(request, student_id, parts=[format.lower(), timezone.now().date()])
+
 @login_required
+@conditional_page(_export_validators)
 def export_student_records(request, student_id, format='pdf'):
     """
     Export a student's training records as either PDF or CSV with improved error handling.
@@ -35,19 +45,22 @@ def export_student_records(request, student_id, format='pdf'):
         # Get all records for this student, ordered by date
         records = TrainingRecord.objects.filter(
             student=student
-        ).order_by('date')
+        ).for_export().order_by('date')
         
         # Check if any records exist
         if not records.exists():
             messages.warning(request, "No training records found to export.")
             return redirect('record_list')
         
-        if format.lower() == 'csv':
-            return _export_csv(student, records)
-        elif format.lower() == 'matrix':
-            return _export_exercise_matrix(student, records, request)
-        else:  # Default to PDF
-            return _export_pdf_weasyprint(student, records, request)
+        # Any format other than CSV or the matrix gets the PDF, and is counted as one
+        export_format = format.lower() if format.lower() in ('csv', 'matrix') else 'pdf'
+        with metrics.track_export(export_format):
+            if export_format == 'csv':
+                return _export_csv(student, records)
+            elif export_format == 'matrix':
+                return _export_exercise_matrix(student, records, request)
+            else:
+                return _export_pdf_weasyprint(student, records, request)
     
     except Exception as e:
         # Log the detailed error with traceback
@@ -76,13 +89,17 @@ def _export_csv(student, records):
         writer.writerow([
             'Flight Number', 'Date', 'Topic', 'Glider', 'Location', 'Instructor',
             'Tow Height', 'Duration', 'Solo Flight', 'Student Comments', 
-            'Instructor Comments', 'Signed Off', 'Sign Off Date'
+            'Instructor Comments', 'Signed Off', 'Sign Off Date',
+            'Signature Hash', 'Ledger Entry', 'Ledger Entry Hash'
         ])
         
+        # Each record's latest signature ledger entry; its hash covers every entry before it
+        ledger_entries = ledger.latest_entries(student.pk)
+        
         # Write data rows with robust error handling and proper UTF-8 encoding
         for record in records:
             # Handle potentially None values safely
-            flight_number = record.get_flight_number() or ""
+            flight_number = record.flight_number or ""
             date = record.date.strftime('%Y-%m-%d') if record.date else ""
             topic = record.training_topic.name if record.training_topic else ""
             glider = f"{record.glider.tail_number} ({record.glider.model})" if record.glider else ""
@@ -112,11 +129,14 @@ def _export_csv(student, records):
                 except:
                     sign_off_date = str(record.sign_off_timestamp)
             
+            entry = ledger_entries.get(record.pk)
+            
             # Write the row with safe values
             writer.writerow([
                 flight_number, date, topic, glider, location, instructor,
                 tow_height, duration, solo, student_comments,
-                instructor_comments, signed_off, sign_off_date
+                instructor_comments, signed_off, sign_off_date,
+                record.signature_hash, entry.sequence if entry else "", entry.entry_hash if entry else ""
             ])
         
         return response
@@ -178,7 +198,7 @@ def _export_pdf_weasyprint(student, records, request):
             # Add the processed record to the list
             processed_records.append({
                 'id': record.id,
-                'flight_number': record.get_flight_number() if hasattr(record, 'get_flight_number') else "",
+                'flight_number': record.flight_number or "",
                 'date': record.date,
                 'date_formatted': record.date.strftime('%Y-%m-%d') if record.date else "N/A",
                 'topic': record.training_topic.name if record.training_topic else "N/A",
@@ -222,6 +242,9 @@ def _export_pdf_weasyprint(student, records, request):
             'total_flight_time': total_flight_time,
             'current_date': timezone.now().strftime('%Y-%m-%d'),
             'rtl': True,  # Flag for RTL support
+            # Lets a reader check a later export against this one without the database
+            'ledger_head': ledger.head(student.pk),
+            'ledger_checkpoint': ledger.latest_checkpoint(student.pk),
         }
         
         # Render the HTML template
@@ -259,8 +282,9 @@ def _export_exercise_matrix(student, records, request):
     """Generate an exercise matrix PDF showing performance on each exercise across flights."""
     try:
         # Get all exercises, but sort properly by converting number to integer first
-        pre_solo_exercises = list(Exercise.objects.filter(category='pre-solo'))
-        post_solo_exercises = list(Exercise.objects.filter(category='post-solo'))
+        exercises = get_catalogue().exercises
+        pre_solo_exercises = [exercise for exercise in exercises if exercise.category == 'pre-solo']
+        post_solo_exercises = [exercise for exercise in exercises if exercise.category == 'post-solo']
         
         # Custom sort function to handle numeric sorting
         def numeric_sort_key(exercise):
@@ -287,7 +311,7 @@ def _export_exercise_matrix(student, records, request):
         # Process records to extract exercise performance data
         flights = []
         
-        for record in records:
+        for record in records.prefetch_related('exercise_performances'):
             # Format duration as minutes
             if record.flight_duration:
                 minutes = int(record.flight_duration.total_seconds() / 60)
@@ -309,7 +333,7 @@ def _export_exercise_matrix(student, records, request):
             # Create flight entry
             flight = {
                 "id": record.id,
-                "number": str(record.get_flight_number()),
+                "number": str(record.flight_number),
                 "date": date_str,
                 "date_raw": record.date,
                 "glider": f"{record.glider.tail_number}" if record.glider else "N/A",
@@ -324,7 +348,7 @@ def _export_exercise_matrix(student, records, request):
             
             # Get performances for all exercises
             performances = {perf.exercise_id: perf.performance 
-                           for perf in ExercisePerformance.objects.filter(training_record=record)}
+                           for perf in record.exercise_performances.all()}
             
             # Map each exercise to a symbol
             for exercise in pre_solo_exercises:
@@ -1,36 +1,58 @@
 # training_records/views/ground_briefings.py
+from urllib.parse import urlencode
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, CreateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.db.models import Count
 from django.contrib import messages
 from django.http import HttpResponseForbidden
 
-from ..models import GroundBriefing, GroundBriefingTopic
-from ..forms import GroundBriefingForm, GroundBriefingSignOffForm
+from ..models import GroundBriefing
+from ..services.catalogue import get_catalogue
+from ..services.sign_off import sign_off_briefings
+from ..forms import GroundBriefingForm, GroundBriefingFilterForm, GroundBriefingSignOffForm
 from .base import StudentRequiredMixin
 
 class GroundBriefingListView(LoginRequiredMixin, ListView):
-    """List all ground briefings the user has access to"""
+    """List the ground briefings the user has access to, filtered and paginated"""
     model = GroundBriefing
     template_name = 'training_records/ground_briefing_list.html'
     context_object_name = 'briefings'
+    paginate_by = 25
+    
+    def get_filter_form(self):
+        if not hasattr(self, '_filter_form'):
+            self._filter_form = GroundBriefingFilterForm(self.request.GET or None, user=self.request.user)
+        return self._filter_form
     
     def get_queryset(self):
-        queryset = GroundBriefing.objects.all().select_related('topic', 'instructor', 'student')
+        queryset = GroundBriefing.objects.select_related('instructor', 'student')
         
         # Filter based on user type
         if self.request.user.is_student():
             queryset = queryset.filter(student=self.request.user)
-        elif self.request.user.is_instructor():
-            # Instructors can see briefings they signed off and pending ones
-            pass  # No filter needed, they can see all
-            
-        return queryset.order_by('topic__number')
+        # Instructors and admins see every briefing in the club
+        
+        queryset = self.get_filter_form().filter(queryset)
+        # pk keeps the order stable across pages
+        return queryset.order_by('topic__number', '-date', 'pk')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # Topics come from the cached catalogue instead of a join on every row; one added
+        # since the catalogue was loaded is fetched as usual
+        topics = get_catalogue().briefing_topics_by_id
+        for briefing in context['briefings']:
+            briefing.topic = topics.get(briefing.topic_id) or briefing.topic
+        
+        context['filter_form'] = self.get_filter_form()
+        # Filters without the page number, for the pagination links
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context['filter_query'] = query.urlencode()
         if self.request.user.is_student():
             # For students, add a form to request new briefings
             context['form'] = GroundBriefingForm(user=self.request.user)
@@ -80,54 +102,88 @@ def ground_briefing_sign_off(request, pk):
     
     return render(request, 'training_records/ground_briefing_sign_off.html', context)
 
+@login_required
+def ground_briefing_session_sign_off(request):
+    """Sign off every pending briefing on one topic at once, e.g. after a classroom session"""
+    if not request.user.is_instructor():
+        return HttpResponseForbidden("Instructors only")
+    
+    if request.method == 'POST':
+        briefing_ids = [pk for pk in request.POST.getlist('briefing_ids') if pk.isdigit()]
+        if not briefing_ids:
+            messages.warning(request, "Select at least one student to sign off.")
+        else:
+            try:
+                signed = sign_off_briefings(request.user, briefing_ids, request=request)
+            except ValueError:
+                messages.error(request, "Sign off the briefings of one topic at a time.")
+            else:
+                messages.success(request, f"Signed off {len(signed)} ground briefing(s).")
+        url = reverse('ground_briefing_session_sign_off')
+        topic_id = request.POST.get('topic', '')
+        if topic_id.isdigit():
+            url = f"{url}?{urlencode({'topic': int(topic_id)})}"
+        return redirect(url)
+    
+    catalogue = get_catalogue()
+    # Topics with pending requests, and how many, in one query
+    pending_counts = dict(
+        GroundBriefing.objects.filter(signed_off=False).order_by().values_list('topic').annotate(count=Count('pk'))
+    )
+    topics = [(topic, pending_counts[topic.id]) for topic in catalogue.briefing_topics if topic.id in pending_counts]
+    
+    topic = None
+    briefings = []
+    topic_id = request.GET.get('topic', '')
+    if topic_id.isdigit():
+        topic = catalogue.briefing_topics_by_id.get(int(topic_id))
+    if topic is not None:
+        briefings = GroundBriefing.objects.filter(topic_id=topic.id, signed_off=False).select_related(
+            'student', 'instructor'
+        ).order_by('student__first_name', 'student__last_name')
+    
+    context = {
+        'topics': topics,
+        'topic': topic,
+        'briefings': briefings,
+    }
+    return render(request, 'training_records/ground_briefing_session_sign_off.html', context)
+
 @login_required
 def student_ground_briefings(request):
     """Dedicated page for student ground briefings"""
     if not request.user.is_student():
         return HttpResponseForbidden("Students only")
     
-    # Get all the student's ground briefings
-    briefings = GroundBriefing.objects.filter(
-        student=request.user
-    ).select_related('topic', 'instructor').order_by('topic__number')
+    catalogue = get_catalogue()
     
-    # Get all available topics for reference
-    all_topics = GroundBriefingTopic.objects.all().order_by('number')
-    
-    # Create a lookup of topics that have briefings
-    topic_status_map = {}
+    # One query for the student's briefings; topics come from the cached catalogue.
+    # A student has at most one briefing per topic.
+    briefings = list(GroundBriefing.objects.filter(student=request.user).select_related('instructor'))
     for briefing in briefings:
-        if briefing.topic_id not in topic_status_map:
-            # If we haven't seen this topic yet, add it
-            topic_status_map[briefing.topic_id] = {
-                'status': 'completed' if briefing.signed_off else 'requested',
-                'briefing': briefing
-            }
-        elif briefing.signed_off and topic_status_map[briefing.topic_id]['status'] != 'completed':
-            # If we have a signed-off version of a topic, prefer that
-            topic_status_map[briefing.topic_id] = {
-                'status': 'completed',
-                'briefing': briefing
-            }
-    
-    # Prepare topics with their status
+        # A topic newer than the catalogue is fetched on its own
+        briefing.topic = catalogue.briefing_topics_by_id.get(briefing.topic_id) or briefing.topic
+    briefings.sort(key=lambda briefing: briefing.topic.number)
+    briefings_by_topic = {briefing.topic_id: briefing for briefing in briefings}
+    
+    # Pivot every topic against the student's briefings
     topics_with_status = []
-    for topic in all_topics:
-        status_info = topic_status_map.get(topic.id, {'status': 'not_started', 'briefing': None})
-        topics_with_status.append({
-            'topic': topic,
-            'status': status_info['status'],
-            'briefing': status_info['briefing']
-        })
+    for topic in catalogue.briefing_topics:
+        briefing = briefings_by_topic.get(topic.id)
+        if briefing is None:
+            status = 'not_started'
+        else:
+            status = 'completed' if briefing.signed_off else 'requested'
+        topics_with_status.append({'topic': topic, 'status': status, 'briefing': briefing})
     
     # Calculate completion statistics
-    total_topics = all_topics.count()
-    completed_briefings = briefings.filter(signed_off=True).count()
-    pending_briefings = briefings.filter(signed_off=False).count()
-    remaining_topics = total_topics - (completed_briefings + pending_briefings)
+    total_topics = len(catalogue.briefing_topics)
+    completed_briefings = sum(1 for briefing in briefings if briefing.signed_off)
+    pending_briefings = len(briefings) - completed_briefings
+    remaining_topics = total_topics - len(briefings_by_topic)
     
     # For the new briefing request form
-    form = GroundBriefingForm(user=request.user)
+    form = GroundBriefingForm(user=request.user, briefed_topic_ids=briefings_by_topic.keys())
     
     context = {
         'briefings': briefings,
@@ -2,24 +2,30 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse,HttpResponseForbidden
-from django.db.models import Sum, Count, Max, Q
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.urls import reverse
+from django.db.models import Sum, Count, Max, Q, OuterRef, Subquery
 from ..models import TrainingRecord, User, GroundBriefing, Exercise, ExercisePerformance
-from ..forms import SignOffForm, GroundBriefingSignOffForm
+from ..forms import SignOffForm
 from ..services.notification_service import NotificationService
-from django.contrib.auth.password_validation import validate_password
-from django.core.exceptions import ValidationError
+from ..services.student_search import search_students
+from ..services.sign_off import sign_off_records
+from ..services import metrics, fragment_cache
+from .base import conditional_page, conditional_response, page_validators, student_page_validators
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from datetime import datetime, date, timedelta
 from django.core.paginator import Paginator
 import csv
-from datetime import datetime
 try:
-    from weasyprint import HTML, CSS
+    from weasyprint import HTML
     WEASYPRINT_AVAILABLE = True
 except ImportError:
     WEASYPRINT_AVAILABLE = False
 
+# Maximum number of students returned by the typeahead search
+STUDENT_SEARCH_LIMIT = 10
+
 @login_required
 def instructor_dashboard(request):
     if not request.user.is_instructor():
@@ -28,42 +34,12 @@ def instructor_dashboard(request):
     # Get all training records where this user is the instructor
     all_instructor_records = TrainingRecord.objects.filter(instructor=request.user).order_by('-date', '-created_at')
     
-    # Separate instructional flights (instructor on board) from supervised solo flights
-    instructional_records = all_instructor_records.filter(is_solo=False)
-    supervised_solo_records = all_instructor_records.filter(is_solo=True)
+    # Statistics and recent students are evaluated lazily, only when a cached
+    # dashboard fragment has to be rendered again
+    stats = SimpleLazyObject(lambda: _instructor_stats(all_instructor_records))
     
     # Get unsigned records that need attention (both types)
-    unsigned_records = all_instructor_records.filter(signed_off=False).order_by('-date')
-    
-    # Calculate instructional flights statistics
-    total_instructional_flights = instructional_records.count()
-    total_supervised_solo_flights = supervised_solo_records.count()
-    
-    # Calculate total flight time (only from instructional flights - no seconds)
-    instructional_duration = instructional_records.aggregate(total=Sum('flight_duration'))['total']
-    total_flight_time = "0:00"
-    if instructional_duration:
-        total_seconds = int(instructional_duration.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        total_flight_time = f"{hours}:{minutes:02d}"
-    
-    # Count of students taught (from both types of flights)
-    students_count = all_instructor_records.values('student').distinct().count()
-    
-    # Get all students for the lookup feature
-    all_students = User.objects.filter(user_type='student').order_by('first_name', 'last_name')
-    
-    # Get recent students with training count
-    recent_students = User.objects.filter(
-        user_type='student',
-        student_records__instructor=request.user
-    ).annotate(
-        training_count=Count('student_records')
-    ).order_by('-student_records__date')[:5]
-    
-    # Make recent_students distinct
-    recent_students = list(dict.fromkeys(recent_students))
+    unsigned_records = all_instructor_records.filter(signed_off=False).for_list().order_by('-date')
     
     pending_briefings = GroundBriefing.objects.filter(
         instructor=request.user,
@@ -71,26 +47,107 @@ def instructor_dashboard(request):
     ).select_related('student', 'topic').order_by('date')
 
     context = {
-        'instructor_records': all_instructor_records[:10],  # Latest 10 records (both types)
+        'instructor_records': all_instructor_records.for_list()[:10],  # Latest 10 records (both types)
         'unsigned_records': unsigned_records,
-        'total_instructional_flights': total_instructional_flights,  # Changed from total_flights
-        'total_supervised_solo_flights': total_supervised_solo_flights,  # New
-        'total_flight_time': total_flight_time,  # Now without seconds
-        'students_count': students_count,
-        'pending_count': unsigned_records.count(),
-        'all_students': all_students,
-        'recent_students': recent_students,
+        'stats': stats,
+        'recent_students': SimpleLazyObject(lambda: _get_recent_students(request.user)),
         'pending_briefings': pending_briefings,
     }
 
     return render(request, 'training_records/instructor_dashboard.html', context)
 
+def _instructor_stats(records):
+    """Dashboard statistics for an instructor's records, in a single query using conditional aggregation"""
+    # Instructional flights have the instructor on board; solo flights are supervised.
+    stats = records.aggregate(
+        total_instructional_flights=Count('id', filter=Q(is_solo=False)),
+        total_supervised_solo_flights=Count('id', filter=Q(is_solo=True)),
+        instructional_duration=Sum('flight_duration', filter=Q(is_solo=False)),
+        students_count=Count('student', distinct=True),
+        pending_count=Count('id', filter=Q(signed_off=False)),
+    )
+    
+    # Calculate total flight time (only from instructional flights - no seconds)
+    instructional_duration = stats.pop('instructional_duration')
+    stats['total_flight_time'] = "0:00"
+    if instructional_duration:
+        total_seconds = int(instructional_duration.total_seconds())
+        hours = total_seconds // 3600
+        minutes = (total_seconds % 3600) // 60
+        stats['total_flight_time'] = f"{hours}:{minutes:02d}"
+    return stats
+
+def _latest_record_per_student(records):
+    """
+    Each student's latest record among records, newest first.
+    DISTINCT ON picks the latest row per student in a subquery, so this is one query.
+    """
+    latest_per_student = records.order_by(
+        'student_id', '-date', '-created_at'
+    ).distinct('student_id').values('pk')
+    
+    return TrainingRecord.objects.filter(
+        pk__in=Subquery(latest_per_student)
+    ).order_by('-date', '-created_at')
+
+def _get_recent_students(instructor, limit=5):
+    """
+    The students this instructor flew with most recently, newest first, each with
+    their latest record and how many flights they had with this instructor.
+    """
+    training_count = TrainingRecord.objects.filter(
+        instructor=instructor, student=OuterRef('student')
+    ).order_by().values('student').annotate(count=Count('pk')).values('count')
+    
+    latest_records = _latest_record_per_student(
+        TrainingRecord.objects.filter(instructor=instructor)
+    ).select_related('student').annotate(
+        training_count=Subquery(training_count)
+    )[:limit]
+    
+    recent_students = []
+    for record in latest_records:
+        student = record.student
+        student.training_count = record.training_count
+        student.last_training_date = record.date
+        recent_students.append(student)
+    return recent_students
+
+@login_required
+def student_search(request):
+    """Typeahead search for students, returned as JSON (instructors only)"""
+    if not request.user.is_instructor():
+        return HttpResponseForbidden("Only instructors can look up students")
+    
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'results': []})
+    
+    students = search_students(query, limit=STUDENT_SEARCH_LIMIT)
+    
+    return JsonResponse({
+        'results': [
+            {
+                'id': student.id,
+                'name': student.get_full_name() or student.username,
+                'license_number': student.student_license_number,
+                'url': reverse('student_history', args=[student.id]),
+            }
+            for student in students
+        ]
+    })
+
 
 @login_required
 def sign_record(request, pk):
     """Allow instructors to sign off on a training record and edit flight details"""
     
-    record = get_object_or_404(TrainingRecord, pk=pk)
+    record = get_object_or_404(
+        TrainingRecord.objects.select_related(
+            'student', 'instructor', 'training_topic', 'glider'
+        ).with_performances(),
+        pk=pk,
+    )
     
     # Only the instructor assigned to the record can sign it off
     if not request.user.is_instructor() or request.user != record.instructor:
@@ -113,14 +170,10 @@ def sign_record(request, pk):
         if days_remaining is not None:
             modification_warning = f"⚠️ This record was already signed off. You have {days_remaining} day(s) remaining to make modifications."
     
-    # Get exercise performances for this record
-    exercise_performances = record.exercise_performances.filter(
-        performance__in=['performed_well', 'needs_improvement', 'performed_badly']
-        ).select_related('exercise').order_by('exercise__category', 'exercise__name')
-    
-    # Group exercises by category
-    pre_solo_performances = exercise_performances.filter(exercise__category='pre-solo')
-    post_solo_performances = exercise_performances.filter(exercise__category='post-solo')
+    # Exercise performances for this record, loaded once and grouped by category
+    performances = record.get_performed_performances_by_category()
+    pre_solo_performances = performances['pre-solo']
+    post_solo_performances = performances['post-solo']
     
     if request.method == 'POST':
         form = SignOffForm(request.POST, instance=record)
@@ -137,23 +190,23 @@ def sign_record(request, pk):
                     exercise_updates.setdefault(exercise_id, {})[field_type] = value
         
         if form.is_valid():
-            # Update exercise performances
+            # Update exercise performances, using the ones already loaded with the record
+            performances_by_exercise = {
+                str(perf.exercise_id): perf for perf in record.exercise_performances.all()
+            }
+            changed = bool(form.instance.get_dirty_fields())
             for exercise_id, updates in exercise_updates.items():
-                try:
-                    performance = ExercisePerformance.objects.get(
-                        training_record=record, 
-                        exercise_id=exercise_id
-                    )
-                    if 'performance' in updates:
-                        performance.performance = updates['performance']
-                        performance.save()
-                except ExercisePerformance.DoesNotExist:
-                    pass
+                performance = performances_by_exercise.get(exercise_id)
+                if performance and 'performance' in updates and performance.performance != updates['performance']:
+                    performance.performance = updates['performance']
+                    performance.save(update_fields=['performance'])
+                    changed = True
             
-            # Save the updated record
-
+            # Save the updated record (only the fields the instructor changed are written)
             updated_record = form.save()
-            updated_record.reset_notification_flags()
+            if changed:
+                # A new revision, so the student is told about it again
+                updated_record.reset_notification_flags()
             
             # Check what action the instructor chose
             action = request.POST.get('action', 'sign_off')  # Default to sign_off for already signed records
@@ -180,7 +233,9 @@ def sign_record(request, pk):
                 updated_record.sign(request.user)
                 messages.success(request, f"Training record #{record.pk} has been successfully updated and signed off.")
             else:
-                # Just updating an already signed record (modification)
+                # Just updating an already signed record (modification); re-sign it so the
+                # signature and the ledger cover what it now says
+                updated_record.amend_signature()
                 messages.success(request, f"Training record #{record.pk} has been updated successfully.")
             
             return redirect('record_detail', pk=record.pk)
@@ -200,6 +255,57 @@ def sign_record(request, pk):
     return render(request, 'training_records/sign_record.html', context)
 
 @login_required
+def sign_off_queue(request):
+    """The instructor's unsigned records, signed off in bulk"""
+    if not request.user.is_instructor():
+        return HttpResponseForbidden("Instructors only")
+    
+    if request.method == 'POST':
+        record_ids = [pk for pk in request.POST.getlist('record_ids') if pk.isdigit()]
+        if not record_ids:
+            messages.warning(request, "Select at least one record to sign off.")
+            return redirect('sign_off_queue')
+        
+        signed = sign_off_records(request.user, record_ids, request=request)
+        skipped = len(record_ids) - len(signed)
+        if signed:
+            messages.success(request, f"Signed off {len(signed)} training record(s).")
+        if skipped:
+            messages.warning(request, f"{skipped} record(s) were already signed off or are not assigned to you.")
+        return redirect('sign_off_queue')
+    
+    pending_records = TrainingRecord.objects.filter(
+        instructor=request.user, signed_off=False
+    ).for_list().order_by('date', 'created_at')
+    
+    return render(request, 'training_records/sign_off_queue.html', {'pending_records': pending_records})
+
+def _student_history_stats(records):
+    """Flight counts and total flight time for a student's records, in one query"""
+    stats = records.aggregate(
+        total_flights=Count('id'),
+        solo_flights=Count('id', filter=Q(is_solo=True)),
+        signed_off_count=Count('id', filter=Q(signed_off=True)),
+        total_duration=Sum('flight_duration'),
+    )
+    
+    # Format the duration for display
+    total_duration = stats.pop('total_duration')
+    stats['total_flight_time'] = "0:00"
+    if total_duration:
+        total_seconds = int(total_duration.total_seconds())
+        hours = total_seconds // 3600
+        minutes = (total_seconds % 3600) // 60
+        stats['total_flight_time'] = f"{hours}:{minutes:02d}"
+    return stats
+
+def _student_history_validators(request, student_id):
+    if not request.user.is_instructor():
+        return None
+    return student_page_validators(request, student_id)
+
+@login_required
+@conditional_page(_student_history_validators)
 def student_history(request, student_id):
     # Check if user is an instructor
     if not request.user.is_instructor():
@@ -211,20 +317,8 @@ def student_history(request, student_id):
     # Get all training records for this student (regardless of instructor)
     training_records = TrainingRecord.objects.filter(student=student).order_by('-date', '-created_at')
     
-    # Calculate statistics
-    total_flights = training_records.count()
-    solo_flights = training_records.filter(is_solo=True).count()
-    signed_off_count = training_records.filter(signed_off=True).count()
-    
-    # Calculate total flight time
-    total_duration = training_records.aggregate(total=Sum('flight_duration'))['total']
-    # Format the duration for display
-    total_flight_time = "0:00"
-    if total_duration:
-        total_seconds = int(total_duration.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        total_flight_time = f"{hours}:{minutes:02d}"
+    # Statistics are only computed when the cached history fragment has to be rendered again
+    stats = SimpleLazyObject(lambda: _student_history_stats(training_records))
     
     # Get all exercises completed by the student
     completed_exercises = Exercise.objects.filter(
@@ -243,11 +337,8 @@ def student_history(request, student_id):
     
     context = {
         'student': student,
-        'training_records': training_records,
-        'total_flights': total_flights,
-        'solo_flights': solo_flights,
-        'signed_off_count': signed_off_count,
-        'total_flight_time': total_flight_time,
+        'training_records': training_records.for_list(),
+        'stats': stats,
         'pre_solo_exercises': pre_solo_exercises,
         'post_solo_exercises': post_solo_exercises,
         'instructors': instructors,
@@ -266,32 +357,24 @@ def student_lookup(request):
     if student_id:
         return redirect('student_history', student_id=student_id)
     
-    # Get all students for the lookup form
-    all_students = User.objects.filter(user_type='student').order_by('first_name', 'last_name')
-    
     # Get recent records for quick access
-    recent_records = TrainingRecord.objects.all().order_by('-date')[:20]
-    
-    # Group students with their most recent training topic
-    students_with_recent_activity = User.objects.filter(
-        user_type='student',
-        student_records__isnull=False
-    ).annotate(
-        last_training_date=Max('student_records__date')
-    ).order_by('-last_training_date')[:15]
-    
-    # Get the most recent training topic for each student
-    for student in students_with_recent_activity:
-        recent_record = TrainingRecord.objects.filter(
-            student=student
-        ).order_by('-date').first()
-        
-        if recent_record:
-            student.recent_topic = recent_record.training_topic.name
-            student.recent_date = recent_record.date
+    recent_records = TrainingRecord.objects.select_related(
+        'student', 'instructor', 'training_topic'
+    ).order_by('-date', '-created_at')[:20]
+    
+    # Students with their most recent training topic, from each student's latest record
+    latest_records = _latest_record_per_student(
+        TrainingRecord.objects.filter(student__user_type='student')
+    ).select_related('student', 'training_topic')[:15]
+    
+    students_with_recent_activity = []
+    for record in latest_records:
+        student = record.student
+        student.recent_topic = record.training_topic.name
+        student.recent_date = record.date
+        students_with_recent_activity.append(student)
     
     context = {
-        'all_students': all_students,
         'students_with_recent_activity': students_with_recent_activity,
         'recent_records': recent_records,
     }
@@ -343,9 +426,7 @@ def instructor_flight_history(request):
         date__gte=start_date,
         date__lte=end_date,
         is_solo=False  # Only show flights where instructor was present
-    ).select_related(
-        'student', 'glider'
-    ).order_by('-date', '-created_at')
+    ).for_list().order_by('-date', '-created_at')
     
     # Get additional filters
     student_filter = request.GET.get('student')
@@ -357,7 +438,11 @@ def instructor_flight_history(request):
     # Check for export request
     export_format = request.GET.get('export')
     if export_format in ['csv', 'pdf']:
-        return _export_instructor_flights(flights, request.user, start_date, end_date, export_format)
+        return conditional_response(
+            request,
+            lambda: _flight_export_validators(request, flights),
+            lambda: _export_instructor_flights(flights, request.user, start_date, end_date, export_format),
+        )
     
     # Calculate statistics for the filtered results
     total_flights = flights.count()
@@ -397,15 +482,25 @@ def instructor_flight_history(request):
     
     return render(request, 'training_records/instructor_flight_history.html', context)
 
+def _flight_export_validators(request, flights):
+    """Validators for an export of these flights; the export also shows today's date"""
+    stats = flights.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return page_validators(
+        request, stats['last_modified'],
+        counters=[fragment_cache.instructor_counter(request.user.pk), fragment_cache.ALL_STUDENTS],
+        parts=[stats['count'], timezone.now().date()],
+    )
+
 def _export_instructor_flights(flights, instructor, start_date, end_date, format_type):
     """Export instructor flights to CSV or PDF"""
     try:
-        if format_type == 'csv':
-            return _export_instructor_flights_csv(flights, instructor, start_date, end_date)
-        elif format_type == 'pdf':
-            return _export_instructor_flights_pdf(flights, instructor, start_date, end_date)
-        else:
-            return HttpResponse("Invalid export format", content_type='text/plain', status=400)
+        with metrics.track_export(f'instructor_{format_type}'):
+            if format_type == 'csv':
+                return _export_instructor_flights_csv(flights, instructor, start_date, end_date)
+            elif format_type == 'pdf':
+                return _export_instructor_flights_pdf(flights, instructor, start_date, end_date)
+            else:
+                return HttpResponse("Invalid export format", content_type='text/plain', status=400)
     except Exception as e:
         logger.error(f"{format_type.upper()} export error for {instructor.username}: {str(e)}")
         fallback = " Try exporting as CSV instead." if format_type == 'pdf' else ""
@@ -3,7 +3,8 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import HttpResponseForbidden
-from django.db.models import Sum
+from django.db.models import Count, Q, Sum
+from django.utils.functional import SimpleLazyObject
 from ..models import TrainingRecord, GroundBriefing, GroundBriefingTopic
 from ..forms import GroundBriefingForm
 from django.utils import timezone
@@ -18,43 +19,24 @@ def student_dashboard(request):
     
     # Calculate 90 days ago
     ninety_days_ago = timezone.now().date() - timedelta(days=90)
-    recent_records = all_records.filter(date__gte=ninety_days_ago)
-    
-    # All-time statistics
-    total_flights = all_records.count()
-    solo_flights = all_records.filter(is_solo=True).count()
-    
-    # Calculate total flight duration (sum of all durations)
-    total_flight_duration = timedelta()
-    for record in all_records:
-        if record.flight_duration:
-            total_flight_duration += record.flight_duration
-    
-    # Calculate solo flight duration
-    solo_flight_duration = timedelta()
-    for record in all_records.filter(is_solo=True):
-        if record.flight_duration:
-            solo_flight_duration += record.flight_duration
-    
-    # 90-day statistics
-    recent_flights = recent_records.count()
-    recent_solo_flights = recent_records.filter(is_solo=True).count()
-    
-    # Calculate recent flight duration
-    recent_flight_duration = timedelta()
-    for record in recent_records:
-        if record.flight_duration:
-            recent_flight_duration += record.flight_duration
-    
-    # Calculate recent solo flight duration
-    recent_solo_flight_duration = timedelta()
-    for record in recent_records.filter(is_solo=True):
-        if record.flight_duration:
-            recent_solo_flight_duration += record.flight_duration
+    recent = Q(date__gte=ninety_days_ago)
+    
+    # All-time and 90-day statistics in one query, only run when the cached
+    # dashboard fragment has to be rendered again
+    stats = SimpleLazyObject(lambda: all_records.aggregate(
+        total_flights=Count('id'),
+        solo_flights=Count('id', filter=Q(is_solo=True)),
+        total_flight_hours=Sum('flight_duration'),
+        solo_flight_hours=Sum('flight_duration', filter=Q(is_solo=True)),
+        recent_flights=Count('id', filter=recent),
+        recent_solo_flights=Count('id', filter=recent & Q(is_solo=True)),
+        recent_flight_hours=Sum('flight_duration', filter=recent),
+        recent_solo_flight_hours=Sum('flight_duration', filter=recent & Q(is_solo=True)),
+    ))
     
     # Get additional data
-    recent_training_records = all_records.order_by('-date')[:10]
-    pending_records = all_records.filter(signed_off=False).order_by('-date')[:5]
+    recent_training_records = all_records.for_list().order_by('-date')[:10]
+    pending_records = all_records.filter(signed_off=False).for_list().order_by('-date')[:5]
     
     ground_briefings = GroundBriefing.objects.filter(student=request.user)
     pending_briefings = ground_briefings.filter(signed_off=False)
@@ -62,24 +44,15 @@ def student_dashboard(request):
     
     context = {
         'title': 'Student Dashboard',
-        # All-time statistics
-        'total_flights': total_flights,
-        'solo_flights': solo_flights,
-        'total_flight_hours': total_flight_duration,  # Pass as duration object
-        'solo_flight_hours': solo_flight_duration,    # Pass as duration object
-        
-        # 90-day statistics
-        'recent_flights': recent_flights,
-        'recent_solo_flights': recent_solo_flights,
-        'recent_flight_hours': recent_flight_duration,      # Pass as duration object
-        'recent_solo_flight_hours': recent_solo_flight_duration,  # Pass as duration object
+        # All-time and 90-day statistics; durations are timedelta objects
+        'stats': stats,
         
         # Existing context
         'recent_training_records': recent_training_records,
         'pending_records': pending_records,
         'pending_briefings': pending_briefings,
         'completed_briefings': completed_briefings,
-        'total_briefings': ground_briefings.count(),
+        'total_briefings': ground_briefings.count,
     }
     
     return render(request, 'training_records/student_dashboard.html', context)
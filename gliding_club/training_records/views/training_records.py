@@ -1,5 +1,7 @@
 # training_records/views/training_records.py
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.urls import reverse_lazy
 from django.contrib import messages
@@ -8,12 +10,23 @@ from django.db.models import Q
 from django.db import transaction
 import logging
 
-from ..models import TrainingRecord, Exercise, ExercisePerformance
+from ..models import TrainingRecord, Exercise, ExercisePerformance, MODIFICATION_WINDOW
 from ..forms import TrainingRecordForm
-from .base import StudentRequiredMixin
+from ..services import fragment_cache
+from ..services.catalogue import get_catalogue
+from .base import StudentRequiredMixin, conditional_page, page_validators
 
 logger = logging.getLogger(__name__)
 
+def _exercise_context(catalogue):
+    """Exercise lists for the record form, split by category"""
+    return {
+        'pre_solo_exercises': catalogue.pre_solo_exercises,
+        'post_solo_exercises': catalogue.post_solo_exercises,
+        'pre_solo_count': len(catalogue.pre_solo_exercises),
+        'post_solo_count': len(catalogue.post_solo_exercises),
+    }
+
 class TrainingRecordListView(LoginRequiredMixin, ListView):
     """List all training records the user has access to"""
     model = TrainingRecord
@@ -22,7 +35,7 @@ class TrainingRecordListView(LoginRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        queryset = TrainingRecord.objects.all().order_by('-date','-created_at')
+        queryset = TrainingRecord.objects.for_list().order_by('-date','-created_at')
         
         # Filter based on user type
         if self.request.user.is_student():
@@ -40,13 +53,45 @@ class TrainingRecordListView(LoginRequiredMixin, ListView):
             )
             
         return queryset
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Students only see their own records; everyone else sees every record and student name
+        if self.request.user.is_student():
+            context['records_counter'] = fragment_cache.student_counter(self.request.user.pk)
+        else:
+            context['records_counter'] = [fragment_cache.ALL_RECORDS, fragment_cache.ALL_STUDENTS]
+        return context
 
+def _record_detail_validators(request, pk):
+    """Validators for the detail page: the record, its student's counter and the modification window"""
+    record = TrainingRecord.objects.with_modifiable().filter(pk=pk).values(
+        'updated_at', 'student_id', 'sign_off_timestamp', 'is_modifiable'
+    ).first()
+    if record is None:
+        return None
+    # The edit buttons and days left to modify change with time, not only with the data
+    days_left = None
+    if record['sign_off_timestamp'] and record['is_modifiable']:
+        days_left = (record['sign_off_timestamp'] + MODIFICATION_WINDOW - timezone.now()).days
+    return page_validators(
+        request, record['updated_at'],
+        counters=[fragment_cache.student_counter(record['student_id'])],
+        parts=[record['is_modifiable'], days_left],
+    )
+
+@method_decorator(conditional_page(_record_detail_validators), name='get')
 class TrainingRecordDetailView(LoginRequiredMixin, DetailView):
     """Detail view for a training record"""
     model = TrainingRecord
     template_name = 'training_records/record_detail.html'
     context_object_name = 'record'
     
+    def get_queryset(self):
+        return TrainingRecord.objects.select_related(
+            'student', 'instructor', 'training_topic', 'glider'
+        ).with_flight_number().with_performances()
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['can_sign'] = (
@@ -65,22 +110,11 @@ class TrainingRecordDetailView(LoginRequiredMixin, DetailView):
         else:
             context['formatted_duration'] = "0:00"
 
-        # Check if any performed exercises exist (not just 'not_performed')
-        performed_exercises_exist = self.object.exercise_performances.filter(
-            performance__in=['performed_well', 'needs_improvement','performed_badly']
-        ).exists()
-        context['performed_exercises_exist'] = performed_exercises_exist
-
-        # Get exercise performances grouped by category - only include performed ones
-        context['pre_solo_performances'] = self.object.exercise_performances.filter(
-            exercise__category='pre-solo',
-            performance__in=['performed_well', 'needs_improvement', 'performed_badly']
-        ).select_related('exercise').order_by('exercise__number', 'exercise__name')
-        
-        context['post_solo_performances'] = self.object.exercise_performances.filter(
-            exercise__category='post-solo',
-            performance__in=['performed_well', 'needs_improvement', 'performed_badly']
-        ).select_related('exercise').order_by('exercise__number', 'exercise__name')
+        # Load all exercise performances once and split them by category
+        performances = self.object.get_performed_performances_by_category()
+        context['pre_solo_performances'] = performances['pre-solo']
+        context['post_solo_performances'] = performances['post-solo']
+        context['performed_exercises_exist'] = any(performances.values())
 
         return context
 
@@ -100,8 +134,7 @@ class TrainingRecordCreateView(LoginRequiredMixin, CreateView):
         context = super().get_context_data(**kwargs)
         
         # Add exercise categories for display
-        context['pre_solo_exercises'] = Exercise.objects.filter(category='pre-solo').order_by('number', 'name')
-        context['post_solo_exercises'] = Exercise.objects.filter(category='post-solo').order_by('number', 'name')
+        context.update(_exercise_context(get_catalogue()))
         
         return context
     
@@ -114,8 +147,9 @@ class TrainingRecordCreateView(LoginRequiredMixin, CreateView):
         self.object = form.save()
         
         # Get all exercises to ensure we have a performance record for each
-        all_exercises = Exercise.objects.all()
+        exercises_by_id = get_catalogue().exercises_by_id
         processed_exercise_ids = set()
+        performances = []
         
         # Process the exercise performance data from the POST request
         if self.request.POST:
@@ -130,28 +164,32 @@ class TrainingRecordCreateView(LoginRequiredMixin, CreateView):
                 if exercise_id and performance:
                     try:
                         exercise_id = int(exercise_id)
+                        if exercise_id not in exercises_by_id:
+                            raise Exercise.DoesNotExist(f"Exercise {exercise_id} does not exist")
+                        if exercise_id in processed_exercise_ids:
+                            continue
                         processed_exercise_ids.add(exercise_id)
-                        exercise = Exercise.objects.get(pk=exercise_id)
                         
                         # Create the performance record
-                        ExercisePerformance.objects.create(
+                        performances.append(ExercisePerformance(
                             training_record=self.object,
-                            exercise=exercise,
+                            exercise_id=exercise_id,
                             performance=performance,
                             notes=''
-                        )
+                        ))
                     except (Exercise.DoesNotExist, ValueError) as e:
                         logger.error(f"Error processing exercise {exercise_id}: {str(e)}")
         
         # For any exercises not processed (not in the form), create a default 'not_performed' record
-        for exercise in all_exercises:
-            if exercise.id not in processed_exercise_ids:
-                ExercisePerformance.objects.create(
+        for exercise_id in exercises_by_id:
+            if exercise_id not in processed_exercise_ids:
+                performances.append(ExercisePerformance(
                     training_record=self.object,
-                    exercise=exercise,
+                    exercise_id=exercise_id,
                     performance='not_performed',
                     notes=''
-                )
+                ))
+        ExercisePerformance.objects.bulk_create(performances)
         
         messages.success(self.request, 'Training record created successfully.')
         return redirect(self.get_success_url())
@@ -173,8 +211,7 @@ class TrainingRecordUpdateView(LoginRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context['pre_solo_exercises'] = Exercise.objects.filter(category='pre-solo').order_by('number', 'name')
-        context['post_solo_exercises'] = Exercise.objects.filter(category='post-solo').order_by('number', 'name')
+        context.update(_exercise_context(get_catalogue()))
 
         context['existing_performances'] = {
             perf.exercise_id: {'performance': perf.performance, 'notes': perf.notes}
@@ -198,7 +235,9 @@ class TrainingRecordUpdateView(LoginRequiredMixin, UpdateView):
 
                 if exercise_id and performance:
                     try:
-                        exercise = Exercise.objects.get(pk=int(exercise_id))
+                        exercise = get_catalogue().exercises_by_id.get(int(exercise_id))
+                        if exercise is None:
+                            raise Exercise.DoesNotExist(f"Exercise {exercise_id} does not exist")
                         ExercisePerformance.objects.update_or_create(
                             training_record=self.object,
                             exercise=exercise,